@@ -1,21 +1,44 @@
-from flask import Flask, render_template, redirect, url_for, request, flash
-from datetime import date, datetime, timedelta
+import hashlib
+from flask import Flask, Response, render_template, redirect, url_for, request, flash
+from datetime import date
 from kiteconnect import KiteConnect
 import config
 import db
 import scraper
 import scheduler
+import trader
+import jobs
+import market_clock
+import metrics
+import rules
+import ticker
+import token_manager
 
 app = Flask(__name__)
 app.secret_key = config.KITE_API_SECRET or 'dev-secret-key'
 
+# This process owns the job executor; anything still "running" is stale
+jobs.recover()
+
+# Log in again shortly after each daily token expiry (needs auto-login credentials)
+token_manager.start()
+
+# Fire the daily job's stages at their market times (MARKET_CLOCK=off to rely on /cron)
+market_clock.start()
+
+# Pick trailing listing-day exits back up after a restart mid-session (TICKER_ENABLED=on)
+ticker.resume()
+
 @app.route('/')
 def dashboard():
     """Main dashboard showing dates"""
-    # Get unique dates from run_logs
-    dates = db.get_all_run_dates()
+    # Dates with runs, plus their counts, from the materialized summary
+    summaries = db.get_daily_summaries(limit=config.PAGE_SIZE)
+    next_cursor = summaries[-1]['date'] if len(summaries) == config.PAGE_SIZE else None
     return render_template('dashboard.html',
-        dates=dates,
+        dates=[s['date'] for s in summaries],
+        summaries=summaries,
+        next_cursor=next_cursor,
         today=date.today().isoformat()
     )
 
@@ -24,7 +47,7 @@ def date_detail(date_str):
     """Show detailed view for a specific date"""
     # Get all data for this date
     ipos = db.get_ipos_by_date(date_str)
-    decisions = db.get_decisions_by_date(date_str)
+    decisions = _with_reasons(db.get_decisions_by_date(date_str))
     logs = db.get_logs_by_date(date_str)
 
     return render_template('date_detail.html',
@@ -39,28 +62,130 @@ def date_detail(date_str):
         }
     )
 
+def _with_reasons(decisions):
+    """Build the text of rule decisions stored as a reason code only"""
+    for d in decisions:
+        if d['reason'] is None and d['reason_code'] is not None:
+            d['reason'] = rules.format_reason(d['reason_code'],
+                                              [d[c] or 0.0 for c in rules.CATEGORIES])
+    return decisions
+
+def _page_limit():
+    limit = request.args.get('limit', config.PAGE_SIZE, type=int)
+    return max(1, min(limit, config.MAX_PAGE_SIZE))
+
+def _parse_cursor(cursor):
+    """Cursor format: '<date>,<id>'; raises ValueError when malformed"""
+    if not cursor:
+        return None
+    cursor_date, _, cursor_id = cursor.partition(',')
+    date.fromisoformat(cursor_date)
+    if not cursor_id.isdigit():
+        raise ValueError(f"bad cursor id: {cursor_id!r}")
+    return cursor_date, int(cursor_id)
+
+def _bad_cursor():
+    return {'error': "invalid cursor, expected the next_cursor of the previous page"}, 400
+
+@app.route('/api/dates')
+def api_dates():
+    """Dates with activity and their counts, newest first (cursor = last date)"""
+    limit = _page_limit()
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            date.fromisoformat(cursor)
+        except ValueError:
+            return _bad_cursor()
+    items = db.get_daily_summaries(before=cursor, limit=limit)
+    next_cursor = items[-1]['date'] if len(items) == limit else None
+    return {'items': items, 'next_cursor': next_cursor}
+
+@app.route('/api/decisions')
+def api_decisions():
+    """Decisions, newest first (cursor = '<date>,<id>' of the last row)"""
+    limit = _page_limit()
+    try:
+        cursor = _parse_cursor(request.args.get('cursor'))
+    except ValueError:
+        return _bad_cursor()
+    items = _with_reasons(db.get_decisions_page(cursor, limit))
+    next_cursor = f"{items[-1]['date']},{items[-1]['id']}" if len(items) == limit else None
+    return {'items': items, 'next_cursor': next_cursor}
+
+@app.route('/api/logs')
+def api_logs():
+    """Run logs, newest first (cursor = '<run_date>,<id>' of the last row)"""
+    limit = _page_limit()
+    try:
+        cursor = _parse_cursor(request.args.get('cursor'))
+    except ValueError:
+        return _bad_cursor()
+    items = db.get_logs_page(cursor, limit)
+    next_cursor = f"{items[-1]['run_date']},{items[-1]['id']}" if len(items) == limit else None
+    return {'items': items, 'next_cursor': next_cursor}
+
+def _flash_job(name, job_id, created):
+    """Tell the dashboard which job a manual trigger queued (or found running)"""
+    flash({'text': f"{name} {'queued' if created else 'already running'} as job {job_id}",
+           'url': url_for('job_status', job_id=job_id)})
+
 @app.route('/run')
 def run_job():
-    """Manually trigger the daily job"""
-    scheduler.run_daily_job()
+    """Manually trigger the daily job (runs in the background)"""
+    _flash_job('Daily job', *jobs.submit('daily_job', scheduler.run_daily_job))
     return redirect(url_for('dashboard'))
 
 @app.route('/scrape')
 def run_scrape():
-    """Manually trigger scraping only"""
-    scraper.run_scraper()
+    """Manually trigger scraping only (runs in the background)"""
+    _flash_job('Scrape', *jobs.submit('scrape', scraper.run_scraper))
     return redirect(url_for('dashboard'))
 
+@app.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    """Status and progress of a background job"""
+    job = jobs.get(job_id)
+    if not job:
+        return {'error': 'job not found'}, 404
+    return job
+
 @app.route('/health')
 def health():
     """Health check endpoint for Railway"""
     return {'status': 'ok'}
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Stage, NSE, Kite and db latency histograms plus run counters (Prometheus format)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/cron')
 def cron_trigger():
-    """Endpoint for Railway cron to hit"""
-    scheduler.run_daily_job()
-    return {'status': 'completed'}
+    """Endpoint for Railway cron to hit - queues the daily job and returns at once"""
+    if config.MARKET_CLOCK:
+        # The market clock runs each stage on time; a cron hit only catches up
+        # slots that are due (e.g. after the app slept through them)
+        fired = market_clock.catch_up()
+        market_clock.wake()
+        return {'status': 'queued' if fired else 'scheduled',
+                'jobs': [{'stage': stage, 'slot': slot, 'job_id': job_id,
+                          'status_url': url_for('job_status', job_id=job_id)}
+                         for stage, slot, job_id in fired],
+                'schedule_url': url_for('schedule')}
+    job_id, created = jobs.submit('daily_job', scheduler.run_daily_job)
+    return {'status': 'queued' if created else 'already running', 'job_id': job_id,
+            'status_url': url_for('job_status', job_id=job_id)}
+
+@app.route('/schedule')
+def schedule():
+    """Market clock: today's stage slots, the next one and recent runs"""
+    return market_clock.status()
+
+@app.route('/ticker')
+def ticker_status():
+    """Live ticks: connection, tick path stats and trailed positions"""
+    return ticker.status()
 
 @app.route('/login-kite')
 def login_kite():
@@ -68,7 +193,7 @@ def login_kite():
     if not config.KITE_API_KEY:
         return "Kite API key not configured", 500
 
-    kite = KiteConnect(api_key=config.KITE_API_KEY)
+    kite = KiteConnect(api_key=config.KITE_API_KEY, root=config.KITE_API_ROOT)
     login_url = kite.login_url()
     return redirect(login_url)
 
@@ -84,39 +209,46 @@ def kite_callback():
         return "Kite credentials not configured", 500
 
     try:
-        kite = KiteConnect(api_key=config.KITE_API_KEY)
+        kite = KiteConnect(api_key=config.KITE_API_KEY, root=config.KITE_API_ROOT)
         data = kite.generate_session(request_token, api_secret=config.KITE_API_SECRET)
         access_token = data['access_token']
 
-        # Store token in database (expires in 24 hours)
-        expires_at = (datetime.now() + timedelta(hours=24)).isoformat()
-        db.save_access_token(access_token, expires_at)
+        # Store token (valid until the next 06:00 IST expiry)
+        token_manager.set_token(access_token)
 
         return redirect(url_for('dashboard'))
     except Exception as e:
         return f"Error generating access token: {e}", 500
 
+@app.route('/kite-postback', methods=['POST'])
+def kite_postback():
+    """Kite order postback - resolves tracked orders without waiting for a poll"""
+    data = request.get_json(silent=True) or {}
+
+    expected = hashlib.sha256(
+        f"{data.get('order_id')}{data.get('order_timestamp')}{config.KITE_API_SECRET}".encode()
+    ).hexdigest()
+    if not config.KITE_API_SECRET or data.get('checksum') != expected:
+        return {'status': 'invalid checksum'}, 400
+
+    trader.get_order_tracker().update(data)
+    return {'status': 'ok'}
+
 @app.route('/token-status')
 def token_status():
     """Check if we have a valid token"""
-    token = db.get_access_token()
-    if token:
-        return {'status': 'valid', 'has_token': True}
-    else:
-        return {'status': 'expired', 'has_token': False}
+    return token_manager.status()
 
 @app.route('/auto-refresh-token')
 def auto_refresh_token():
     """Manually trigger auto token refresh"""
-    try:
-        import kite_auto_login
-        token = kite_auto_login.auto_login_kite()
-        if token:
-            return redirect(url_for('dashboard'))
-        else:
-            return "Auto-refresh failed. Check credentials.", 500
-    except Exception as e:
-        return f"Error: {e}", 500
+    # Through the token manager, so it shares one login with the scheduled
+    # refresh and subscribers (KiteClient, ticker) get the new token
+    token = token_manager.refresh(force=True)
+    if token:
+        return redirect(url_for('dashboard'))
+    status = token_manager.status()
+    return f"Auto-refresh failed: {status.get('last_error') or 'check credentials'}", 500
 
 if __name__ == '__main__':
     import os
@@ -0,0 +1,281 @@
+"""
+Vectorized backtest of the subscription entry rule and SL/target exits
+
+Inputs are local CSV files:
+  subscriptions: company, close_date, qib, snii, bnii, nii, retail
+  bars:          company, open, high, low, close   (one row per bar, in time
+                 order - a single listing-day OHLC row or minute bars)
+
+Every IPO's listing-day bars are packed into one NaN-padded 2D array, so the
+entry rule and the exit simulation for all IPOs (and, for a sweep, all
+parameter combinations in a chunk) are a handful of NumPy operations.
+
+Usage:
+    python backtest.py subs.csv bars.csv --sl 1,1.5,2 --target 3,4,5 --threshold 1
+"""
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import config
+import rules
+
+CATEGORIES = rules.CATEGORIES
+
+def _num(val):
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return 0.0
+
+def load_subscriptions(path):
+    """Load a subscriptions CSV -> (companies list, float array [n, 5])"""
+    companies = []
+    values = []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            companies.append(row['company'])
+            values.append([_num(row.get(c)) for c in CATEGORIES])
+    return companies, np.array(values, dtype=np.float64).reshape(-1, len(CATEGORIES))
+
+def load_subscriptions_from_db():
+    """Load every stored subscription from the app database"""
+    import db
+    rows = db.get_db().execute(
+        'SELECT company, qib, snii, bnii, nii, retail FROM subscriptions ORDER BY close_date'
+    ).fetchall()
+    companies = [r['company'] for r in rows]
+    values = [[r[c] or 0.0 for c in CATEGORIES] for r in rows]
+    return companies, np.array(values, dtype=np.float64).reshape(-1, len(CATEGORIES))
+
+def _read_bars_csv(path):
+    """Read a bars CSV -> (company per row, float array [rows, 4])"""
+    with open(path, newline='') as f:
+        header = next(csv.reader(f))
+    cols = [header.index(c) for c in ('company', 'open', 'high', 'low', 'close')]
+
+    # np.loadtxt parses in C; quotechar handles company names with commas
+    opts = {'delimiter': ',', 'skiprows': 1, 'quotechar': '"', 'ndmin': 1}
+    names = np.loadtxt(path, dtype=str, usecols=cols[0], **opts)
+    prices = np.loadtxt(path, dtype=np.float64, usecols=cols[1:], **opts)
+    return names, prices.reshape(-1, 4)
+
+def load_bars(path, companies):
+    """
+    Load a bars CSV into NaN-padded arrays aligned with `companies`.
+    Returns dict of open/high/low/close arrays shaped [n_ipos, max_bars].
+    IPOs without bars stay all-NaN (and are never traded).
+    A parsed copy is kept next to the CSV (<path>.npz) and reused while the
+    CSV is unchanged.
+    """
+    cache = path + '.npz'
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+        with np.load(cache, allow_pickle=False) as data:
+            names, prices = data['names'], data['prices']
+    else:
+        names, prices = _read_bars_csv(path)
+        try:
+            with open(cache, 'wb') as f:
+                np.savez(f, names=names, prices=prices)
+        except OSError:
+            pass
+
+    # Group rows by company while keeping each company's bar order
+    order = np.argsort(names, kind='stable')
+    names, prices = names[order], prices[order]
+    uniq, starts, counts = np.unique(names, return_index=True, return_counts=True)
+    position = dict(zip(uniq.tolist(), zip(starts.tolist(), counts.tolist())))
+
+    max_bars = int(counts.max()) if len(counts) else 1
+    ohlc = np.full((len(companies), max_bars, 4), np.nan)
+    for i, company in enumerate(companies):
+        if company in position:
+            start, count = position[company]
+            ohlc[i, :count] = prices[start:start + count]
+
+    return {
+        'open': ohlc[:, :, 0],
+        'high': ohlc[:, :, 1],
+        'low': ohlc[:, :, 2],
+        'close': ohlc[:, :, 3],
+    }
+
+def entry_mask(subs, threshold=None):
+    """
+    The trading rule from rules.py. With a `threshold`, every category uses
+    that value; otherwise the configured rule is applied as-is.
+    """
+    if threshold is None:
+        rule = rules.get_default_rule()
+    else:
+        rule = rules.compile_rule(thresholds={c: threshold for c in CATEGORIES})
+    buy, _ = rule.evaluate(subs)
+    return buy
+
+# Per-IPO price paths are stored relative to the entry price and each row is
+# shifted by its index * ROW_SPAN, so one flat sorted array (and one
+# np.searchsorted call) answers "first bar crossing level X" for every IPO.
+ROW_SPAN = 1000.0
+MAX_RELATIVE_PRICE = 500.0
+
+def prepare_bars(bars):
+    """
+    Precompute running extremes for the exit search.
+    The running low never rises and the running high never falls, so the
+    first bar touching an SL/target level is a binary search.
+    """
+    entry = bars['open'][:, 0]
+    n, t = bars['open'].shape
+    with np.errstate(invalid='ignore', divide='ignore'):
+        run_low = np.fmin.accumulate(bars['low'], axis=1) / entry[:, None]
+        run_high = np.fmax.accumulate(bars['high'], axis=1) / entry[:, None]
+    run_low = np.clip(np.nan_to_num(run_low, nan=1.0), 0, MAX_RELATIVE_PRICE)
+    run_high = np.clip(np.nan_to_num(run_high, nan=1.0), 0, MAX_RELATIVE_PRICE)
+
+    offsets = np.arange(n, dtype=np.float64)[:, None] * ROW_SPAN
+
+    # Last valid close for IPOs that exit at the end of the session
+    valid = ~np.isnan(bars['close'])
+    last_idx = t - 1 - np.argmax(valid[:, ::-1], axis=1)
+
+    return {
+        'n': n,
+        't': t,
+        'entry': entry,
+        'offsets': offsets[:, 0],
+        'low_keys': (offsets - run_low).ravel(),    # non-decreasing
+        'high_keys': (offsets + run_high).ravel(),  # non-decreasing
+        'last_close': bars['close'][np.arange(n), last_idx],
+    }
+
+def _first_crossing(keys, levels, prepared):
+    """First bar index per IPO whose key reaches `levels` ([p, n]); -1 if none"""
+    n, t = prepared['n'], prepared['t']
+    queries = levels + prepared['offsets']
+    idx = np.searchsorted(keys, queries.ravel(), side='left').reshape(queries.shape)
+    idx = idx - np.arange(n) * t
+    return np.where(idx < t, idx, -1)
+
+def simulate_exits(bars, sl_percent, target_percent):
+    """
+    Simulate buy-at-first-open with SL and target for every IPO at once.
+    `bars` is the output of load_bars or prepare_bars. sl_percent /
+    target_percent may be scalars or arrays of shape [p]; the result then
+    has shape [p, n]. Returns percentage returns (NaN = no bars).
+
+    When SL and target are both touched inside the same bar the SL is assumed
+    to fill first (bars don't tell us the intra-bar order).
+    """
+    prepared = bars if 'low_keys' in bars else prepare_bars(bars)
+    n = prepared['n']
+
+    sl_level = 1 - np.asarray(sl_percent, dtype=np.float64) / 100
+    tp_level = 1 + np.asarray(target_percent, dtype=np.float64) / 100
+    sl_level = np.broadcast_to(sl_level[..., None], sl_level.shape + (n,))
+    tp_level = np.broadcast_to(tp_level[..., None], tp_level.shape + (n,))
+
+    sl_hit = _first_crossing(prepared['low_keys'], -sl_level, prepared)
+    tp_hit = _first_crossing(prepared['high_keys'], tp_level, prepared)
+
+    sl_first = (sl_hit >= 0) & ((tp_hit < 0) | (sl_hit <= tp_hit))
+    tp_first = (tp_hit >= 0) & ~sl_first
+
+    entry = prepared['entry']
+    last_return = prepared['last_close'] / entry
+    exit_ratio = np.where(sl_first, sl_level, np.where(tp_first, tp_level, last_return))
+    exit_ratio = np.where(np.isnan(entry), np.nan, exit_ratio)
+    return (exit_ratio - 1) * 100
+
+def summarize(returns, mask):
+    """Stats per parameter set for the IPOs selected by `mask`"""
+    traded = returns[..., mask]
+    n = traded.shape[-1]
+    if n == 0:
+        zeros = np.zeros(traded.shape[:-1])
+        return {'trades': 0, 'win_rate': zeros, 'avg_return': zeros, 'total_return': zeros}
+    return {
+        'trades': n,
+        'win_rate': (traded > 0).mean(axis=-1) * 100,
+        'avg_return': traded.mean(axis=-1),
+        'total_return': traded.sum(axis=-1),
+    }
+
+# Process pool workers keep the arrays from their initializer
+_worker_state = {}
+
+def _init_worker(subs, prepared, thresholds):
+    _worker_state['prepared'] = prepared
+    # Entry masks depend only on the threshold, so build them once per worker.
+    # IPOs without listing-day bars can't be simulated and are left out.
+    has_bars = ~np.isnan(prepared['entry'])
+    _worker_state['masks'] = {thr: entry_mask(subs, thr) & has_bars for thr in thresholds}
+
+def _run_chunk(chunk):
+    """chunk: list of (sl, target) pairs, simulated together in one batch"""
+    prepared = _worker_state['prepared']
+    sl = np.array([c[0] for c in chunk])
+    tp = np.array([c[1] for c in chunk])
+    returns = simulate_exits(prepared, sl, tp)
+
+    results = []
+    for threshold, mask in _worker_state['masks'].items():
+        stats = summarize(returns, mask)
+        for i, (s, t) in enumerate(chunk):
+            results.append({
+                'threshold': float(threshold), 'sl': float(s), 'target': float(t),
+                'trades': stats['trades'],
+                'win_rate': round(float(stats['win_rate'][i]), 2),
+                'avg_return': round(float(stats['avg_return'][i]), 3),
+                'total_return': round(float(stats['total_return'][i]), 2),
+            })
+    return results
+
+def sweep(subs, bars, thresholds, sl_values, target_values, workers=None, chunk_size=64):
+    """Evaluate every (threshold, sl, target) combination over a process pool"""
+    prepared = prepare_bars(bars)
+    pairs = [(s, t) for s in sl_values for t in target_values]
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+    workers = workers or min(len(chunks), os.cpu_count() or 1)
+
+    if workers <= 1:
+        _init_worker(subs, prepared, thresholds)
+        results = [r for chunk in chunks for r in _run_chunk(chunk)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(subs, prepared, thresholds)) as pool:
+            results = [r for part in pool.map(_run_chunk, chunks) for r in part]
+
+    return sorted(results, key=lambda r: r['avg_return'], reverse=True)
+
+def _floats(text):
+    return [float(v) for v in text.split(',') if v.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description='Backtest the IPO subscription strategy')
+    parser.add_argument('subscriptions', help="subscriptions CSV, or 'db' for the app database")
+    parser.add_argument('bars', help='listing-day bars CSV')
+    parser.add_argument('--threshold', default='1', help='comma-separated subscription thresholds')
+    parser.add_argument('--sl', default=str(config.STOP_LOSS_PERCENT), help='comma-separated SL percents')
+    parser.add_argument('--target', default=str(config.TARGET_PROFIT_PERCENT), help='comma-separated target percents')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.subscriptions == 'db':
+        companies, subs = load_subscriptions_from_db()
+    else:
+        companies, subs = load_subscriptions(args.subscriptions)
+    bars = load_bars(args.bars, companies)
+    print(f"Loaded {len(companies)} IPOs, {bars['open'].shape[1]} bars max")
+
+    results = sweep(subs, bars, _floats(args.threshold), _floats(args.sl),
+                    _floats(args.target), workers=args.workers)
+
+    print(f"{'thr':>5} {'sl%':>5} {'tgt%':>5} {'trades':>7} {'win%':>7} {'avg%':>8} {'total%':>9}")
+    for r in results[:args.top]:
+        print(f"{r['threshold']:>5} {r['sl']:>5} {r['target']:>5} {r['trades']:>7} "
+              f"{r['win_rate']:>7} {r['avg_return']:>8} {r['total_return']:>9}")
+
+if __name__ == '__main__':
+    main()
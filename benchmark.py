@@ -0,0 +1,539 @@
+"""
+Benchmark suite for parsing, rule evaluation, db queries and the daily job
+
+Everything runs against a synthetic database (generated once per size and
+kept under bench_data/) and recorded NSE / Kite payloads from fixtures/, so
+no network access or credentials are needed. Results are written as JSON,
+one file per run, and two result files can be compared.
+
+Usage:
+    python benchmark.py generate --ipos 100000
+    python benchmark.py run --ipos 10000
+    python benchmark.py run --only parse,db --output before.json
+    python benchmark.py compare before.json after.json --threshold 10
+"""
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
+import config
+import db
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(ROOT, 'fixtures')
+DATA_DIR = os.path.join(ROOT, 'bench_data')
+RESULTS_DIR = os.path.join(ROOT, 'bench_results')
+
+GROUPS = ('parse', 'eval', 'db', 'e2e')
+
+def load_fixture(*parts):
+    with open(os.path.join(FIXTURES, *parts), encoding='utf-8') as f:
+        return f.read()
+
+# Synthetic database
+
+IPOS_PER_DAY = 3
+SNAPSHOTS_PER_IPO = 5
+RUNS_PER_DAY = 4
+
+def generate_db(path, n_ipos, seed=42):
+    """Create a database with n_ipos IPOs plus their subscriptions, snapshots, decisions and logs"""
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    config.DB_PATH = path
+    db.init_db()
+    conn = db.get_db()
+
+    days = max(1, n_ipos // IPOS_PER_DAY)
+    first_day = date.today() - timedelta(days=days + 5)
+    ipos, subs, snapshots, decisions = [], [], [], []
+
+    for i in range(n_ipos):
+        close = first_day + timedelta(days=i // IPOS_PER_DAY)
+        company = f'Synthetic Industries {i} Limited'
+        ipos.append((company, f'SYN{i}', (close - timedelta(days=2)).isoformat(),
+                     close.isoformat(), (close + timedelta(days=3)).isoformat(),
+                     round(rng.uniform(20, 1500), 0), round(rng.uniform(20, 5000), 1)))
+
+        values = [round(rng.lognormvariate(0.5, 1.2), 2) for _ in db.SNAPSHOT_FIELDS]
+        subs.append((company, close.isoformat(), *values))
+        for s in range(SNAPSHOTS_PER_IPO):
+            ts = f'{close.isoformat()}T{10 + s}:00:00'
+            snapshots.append((company, close.isoformat(), ts,
+                              *(round(v * (s + 1) / SNAPSHOTS_PER_IPO, 2) for v in values)))
+
+        buy = all(v > 1 for v in values)
+        status = rng.choice(('EXECUTED', 'EXECUTED', 'FAILED', 'SIMULATED')) if buy else None
+        decisions.append((close.isoformat(), company, 'BUY' if buy else 'SKIP',
+                          'synthetic', status, 0 if buy else 1))
+
+    with conn:
+        conn.executemany('''
+            INSERT INTO ipos (company, symbol, open_date, close_date, listing_date, issue_price, issue_size)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', ipos)
+        db.upsert_subscriptions(subs)
+        conn.executemany('''
+            INSERT INTO subscription_snapshots (company, close_date, ts, qib, snii, bnii, nii, retail)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', snapshots)
+        conn.executemany('''
+            INSERT INTO decisions (date, company, decision_type, reason, status, reason_code)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', decisions)
+        conn.executemany('''
+            INSERT INTO run_logs (run_date, run_type, status, details) VALUES (?, ?, ?, ?)
+        ''', [((first_day + timedelta(days=d)).isoformat(), run_type,
+               'FAILED' if rng.random() < 0.05 else 'SUCCESS', 'synthetic')
+              for d in range(days) for run_type in ('SCRAPE_IPO', 'SCRAPE_SUB', 'EVALUATE', 'TRADE')[:RUNS_PER_DAY]])
+    conn.execute('ANALYZE')
+    db.close_db()
+
+def get_bench_db(n_ipos, regenerate=False):
+    """Path to a working copy of the synthetic database of the given size"""
+    base = os.path.join(DATA_DIR, f'ipos-{n_ipos}.db')
+    if regenerate or not os.path.exists(base):
+        print(f"Generating synthetic database with {n_ipos} IPOs...")
+        generate_db(base, n_ipos)
+    work = os.path.join(tempfile.mkdtemp(prefix='ipo-bench-'), 'ipo.db')
+    shutil.copyfile(base, work)
+    # Bring a base generated by an older schema up to date
+    with mock.patch.object(config, 'DB_PATH', work):
+        db.init_db()
+    return work
+
+# Stubbed NSE and Kite
+
+class FakeResponse:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.HTTPError(f'{self.status_code} Error', response=self)
+
+class FakeNSESession:
+    """Serves ipo-current-issue / ipo-detail from the recorded fixtures"""
+
+    def __init__(self, ipo_list, details, latency=0.0):
+        self.ipo_list = json.dumps(ipo_list)
+        self.details = {sym: json.dumps(payload) for sym, payload in details.items()}
+        self.latency = latency
+
+    def get(self, url, headers=None, timeout=None):
+        if self.latency:
+            time.sleep(self.latency)
+        if url.startswith(config.NSE_IPO_LIST_URL):
+            return FakeResponse(self.ipo_list)
+        symbol = url.split('symbol=', 1)[-1]
+        if symbol in self.details:
+            return FakeResponse(self.details[symbol])
+        return FakeResponse('{}', 404)
+
+class FakeKite:
+    """Enough of KiteConnect for run_trading: every order fills at once"""
+    VARIETY_REGULAR = 'regular'
+    EXCHANGE_NSE = 'NSE'
+    TRANSACTION_TYPE_BUY = 'BUY'
+    TRANSACTION_TYPE_SELL = 'SELL'
+    PRODUCT_CNC = 'CNC'
+    ORDER_TYPE_MARKET = 'MARKET'
+    ORDER_TYPE_LIMIT = 'LIMIT'
+    ORDER_TYPE_SLM = 'SL-M'
+    GTT_TYPE_OCO = 'two-leg'
+
+    def __init__(self, instruments_csv, latency=0.0):
+        self._instruments = list(csv.DictReader(io.StringIO(instruments_csv)))
+        for inst in self._instruments:
+            inst['instrument_token'] = int(inst['instrument_token'])
+            inst['tick_size'] = float(inst['tick_size'])
+            inst['lot_size'] = int(inst['lot_size'])
+        self.latency = latency
+        self._orders = {}
+        self._ids = itertools.count(250000000000001)  # thread-safe, trades run in parallel
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def instruments(self, exchange=None):
+        self._wait()
+        return [i for i in self._instruments if exchange in (None, i['exchange'])]
+
+    def place_order(self, variety, **params):
+        self._wait()
+        order_id = str(next(self._ids))
+        self._orders[order_id] = {'order_id': order_id, 'status': 'COMPLETE',
+                                  'average_price': 100.0, **params}
+        return order_id
+
+    def place_gtt(self, **params):
+        self._wait()
+        return {'trigger_id': next(self._ids)}
+
+    def orders(self):
+        self._wait()
+        return list(self._orders.values())
+
+    def order_history(self, order_id):
+        self._wait()
+        return [self._orders[order_id]]
+
+def _nse_fixtures(today):
+    """
+    Recorded NSE payloads with every other issue closing today (the rest
+    are seeded as listing today, see _seed_listing_day)
+    """
+    ipo_list = json.loads(load_fixture('nse', 'ipo-current-issue.json'))
+    day = datetime.strptime(today, '%Y-%m-%d').strftime('%d-%b-%Y')
+    for item in ipo_list[::2]:
+        item['issueEndDate'] = day
+    return ipo_list, json.loads(load_fixture('nse', 'ipo-detail.json'))
+
+def _seed_listing_day(ipo_list, today):
+    """Pending BUYs listing today for half the fixture companies, so run_trading has work"""
+    earlier = (date.fromisoformat(today) - timedelta(days=5)).isoformat()
+    listing = ipo_list[1::2]
+    db.upsert_ipos([(i['companyName'], None, earlier, today, 100.0, i['symbol'])
+                    for i in listing])
+    for i in listing:
+        db.save_decision(earlier, i['companyName'], 'BUY', 'seeded for benchmark')
+
+@contextlib.contextmanager
+def stubbed_network(latency=0.0):
+    """Patch NSE, Kite and Kite login so the daily job runs entirely offline"""
+    import scraper
+    import token_manager
+    import trader
+
+    today = date.today().isoformat()
+    ipo_list, details = _nse_fixtures(today)
+    session = FakeNSESession(ipo_list, details, latency)
+    instruments_csv = load_fixture('kite', 'instruments.csv')
+
+    def init_kite():
+        trader.kite = FakeKite(instruments_csv, latency)
+        return trader.kite
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(mock.patch.object(scraper, 'get_session', lambda: session))
+        stack.enter_context(mock.patch.object(trader, 'init_kite', init_kite))
+        stack.enter_context(mock.patch.object(trader, '_instruments_loaded_on', None))
+        stack.enter_context(mock.patch.object(trader, '_order_tracker', None))
+        stack.enter_context(mock.patch.object(config, 'NSE_CACHE_TTL_LIST', 0))
+        stack.enter_context(mock.patch.object(config, 'NSE_CACHE_TTL_DETAIL', 0))
+        stack.enter_context(mock.patch.object(token_manager, 'ensure_token', lambda: 'bench'))
+        yield ipo_list
+
+# Measurement
+
+def measure(func, repeat=5, min_time=0.05):
+    """
+    Time func() like timeit's autorange: each of `repeat` rounds loops until
+    it has run for at least min_time. Returns per-call stats in microseconds.
+    """
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) / number)
+    return _stats([s * 1e6 for s in samples], 'us', number)
+
+def _stats(samples, unit, number=1):
+    return {
+        'unit': unit,
+        'loops': number,
+        'rounds': len(samples),
+        'min': round(min(samples), 3),
+        'median': round(statistics.median(samples), 3),
+        'mean': round(statistics.fmean(samples), 3),
+        'max': round(max(samples), 3),
+    }
+
+# Benchmarks
+
+def bench_parse(results, repeat):
+    import scraper
+
+    ipo_list, details = _nse_fixtures(date.today().isoformat())
+    dates = [i[k] for i in ipo_list for k in ('issueStartDate', 'issueEndDate')]
+    dates += ['2026-02-04', '04-February-2026', '-', '']
+    floats = [b['noOfTime'] for d in details.values() for b in d['bidDetails']]
+    floats += ['1,234.56', '12.5x', '-', '0.00', None]
+    list_text = load_fixture('nse', 'ipo-current-issue.json')
+
+    results['parse.nse_date'] = measure(lambda: [scraper.parse_nse_date(d) for d in dates], repeat)
+    results['parse.float'] = measure(lambda: [scraper.parse_float(v) for v in floats], repeat)
+    results['parse.ipo_list_json'] = measure(lambda: json.loads(list_text), repeat)
+
+    with stubbed_network():
+        symbol = ipo_list[0]['symbol']
+        results['scrape.ipo_list'] = measure(scraper.scrape_ipo_list, repeat)
+        results['scrape.detail'] = measure(lambda: scraper.scrape_subscription_detail(symbol), repeat)
+        with mock.patch.object(config, 'NSE_CACHE_TTL_DETAIL', 3600):
+            results['scrape.detail_cached'] = measure(
+                lambda: scraper.scrape_subscription_detail(symbol), repeat)
+
+def bench_eval(results, repeat):
+    import rules
+    import trader
+
+    history = db.get_all_subscriptions()
+    day = history[len(history) // 2]['close_date']
+    todays = [h for h in history if h['close_date'] == day]
+    values = rules.to_array(history)
+    rule = rules.get_default_rule()
+    _, codes = rule.evaluate(values)
+
+    results['eval.single'] = measure(lambda: trader.evaluate_subscription(todays[0]), repeat)
+    results['eval.day_batch'] = measure(lambda: trader.evaluate_subscriptions(todays), repeat)
+    results['eval.to_array_all'] = measure(lambda: rules.to_array(history), repeat)
+    results['eval.rule_all'] = measure(lambda: rule.evaluate(values), repeat)
+    results['eval.format_reason'] = measure(
+        lambda: rules.format_reason(int(codes[0]), values[0]), repeat)
+    results['eval.rescore_history'] = measure(trader.rescore_history, repeat)
+
+def bench_db(results, repeat):
+    conn = db.get_db()
+    mid = conn.execute('SELECT company, close_date, listing_date FROM ipos '
+                       'ORDER BY id LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM ipos)').fetchone()
+    company, close_date, listing_date = mid['company'], mid['close_date'], mid['listing_date']
+    decision = conn.execute('SELECT date, id FROM decisions WHERE date = ? LIMIT 1',
+                            (close_date,)).fetchone()
+    log = conn.execute('SELECT run_date, id FROM run_logs WHERE run_date <= ? '
+                       'ORDER BY run_date DESC, id DESC LIMIT 1', (close_date,)).fetchone()
+
+    reads = {
+        'get_ipos_by_close_date': lambda: db.get_ipos_by_close_date(close_date),
+        'get_ipos_by_listing_date': lambda: db.get_ipos_by_listing_date(listing_date),
+        'get_ipos_by_date': lambda: db.get_ipos_by_date(close_date),
+        'get_all_ipos': db.get_all_ipos,
+        'get_subscription': lambda: db.get_subscription(company, close_date),
+        'get_latest_snapshot': lambda: db.get_latest_snapshot(company, close_date),
+        'get_subscription_curve': lambda: db.get_subscription_curve(company, close_date),
+        'get_pending_buys': lambda: db.get_pending_buys(listing_date),
+        'get_recent_decisions': db.get_recent_decisions,
+        'get_decisions_by_date': lambda: db.get_decisions_by_date(close_date),
+        'get_decisions_page': lambda: db.get_decisions_page(tuple(decision), 20),
+        'get_recent_logs': db.get_recent_logs,
+        'get_logs_by_date': lambda: db.get_logs_by_date(close_date),
+        'get_logs_page': lambda: db.get_logs_page(tuple(log), 50),
+        'get_all_run_dates': db.get_all_run_dates,
+        'get_daily_summaries': lambda: db.get_daily_summaries(limit=config.PAGE_SIZE),
+        'get_daily_summaries_cursor': lambda: db.get_daily_summaries(close_date, config.PAGE_SIZE),
+        'get_daily_summary': lambda: db.get_daily_summary(close_date),
+        'get_all_subscriptions': db.get_all_subscriptions,
+        'get_access_token': db.get_access_token,
+        'get_cached_response': lambda: db.get_cached_response(config.NSE_IPO_LIST_URL),
+    }
+    for name, func in reads.items():
+        results[f'db.{name}'] = measure(func, repeat)
+
+    # Writes go last; they grow the tables a little but keep the same shape
+    ipo_rows = [(f'Bench Write {i} Limited', None, close_date, None, 100.0, f'BW{i}')
+                for i in range(100)]
+    sub_rows = [(f'Bench Write {i} Limited', close_date, 1.0, 1.0, 1.0, 1.0, 1.0)
+                for i in range(100)]
+    counter = iter(range(10 ** 9))
+
+    results['db.upsert_ipos_100'] = measure(lambda: db.upsert_ipos(ipo_rows), repeat)
+    results['db.upsert_subscriptions_100'] = measure(lambda: db.upsert_subscriptions(sub_rows), repeat)
+    results['db.save_subscription_snapshot'] = measure(
+        lambda: db.save_subscription_snapshot(company, close_date, f'T{next(counter)}',
+                                              next(counter), 1, 1, 1, 1), repeat)
+    results['db.save_decision'] = measure(
+        lambda: db.save_decision(close_date, company, 'SKIP', 'bench'), repeat)
+    results['db.log_run'] = measure(lambda: db.log_run('BENCH', 'SUCCESS', 'bench'), repeat)
+
+def bench_e2e(results, repeat, n_ipos, latency=0.0):
+    """Full run_daily_job per round on a fresh copy of the database, with per-stage times"""
+    import scheduler
+    import scraper
+    import trader
+
+    totals = []
+    stages = {}
+    stage_funcs = ((scraper, 'run_scraper'), (trader, 'run_evaluation'), (trader, 'run_trading'))
+
+    for _ in range(repeat):
+        config.DB_PATH = get_bench_db(n_ipos)
+        with stubbed_network(latency) as ipo_list, contextlib.ExitStack() as stack:
+            _seed_listing_day(ipo_list, date.today().isoformat())
+            for module, name in stage_funcs:
+                stack.enter_context(mock.patch.object(
+                    module, name, _timed(getattr(module, name), stages.setdefault(name, []))))
+
+            started = time.perf_counter()
+            scheduler.run_daily_job()
+            totals.append((time.perf_counter() - started) * 1000)
+        _discard_db()
+
+    results['e2e.daily_job'] = _stats(totals, 'ms')
+    for name, samples in stages.items():
+        results[f'e2e.{name}'] = _stats(samples, 'ms')
+
+def _timed(func, sink):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sink.append((time.perf_counter() - started) * 1000)
+    return wrapper
+
+def _discard_db():
+    db.close_db()
+    shutil.rmtree(os.path.dirname(config.DB_PATH), ignore_errors=True)
+
+# Results
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+def run(args):
+    groups = [g.strip() for g in args.only.split(',')] if args.only else list(GROUPS)
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        sys.exit(f"Unknown benchmark groups: {', '.join(sorted(unknown))}")
+
+    results = {}
+    log = io.StringIO()
+    for group in groups:
+        print(f"Running {group} benchmarks...")
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(log):
+            if group == 'e2e':
+                bench_e2e(results, args.e2e_repeat, args.ipos, args.latency_ms / 1000)
+            else:
+                config.DB_PATH = get_bench_db(args.ipos, args.regenerate)
+                args.regenerate = False
+                try:
+                    globals()[f'bench_{group}'](results, args.repeat)
+                finally:
+                    _discard_db()
+        print(f"  done in {time.perf_counter() - started:.1f}s")
+
+    commit = _git('rev-parse', '--short', 'HEAD') or 'unknown'
+    report = {
+        'meta': {
+            'commit': commit,
+            'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'ipos': args.ipos,
+            'repeat': args.repeat,
+            'latency_ms': args.latency_ms,
+        },
+        'benchmarks': results,
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'benchmark':<36} {'median':>12} {'min':>12}")
+    for name, r in results.items():
+        print(f"{name:<36} {r['median']:>10.1f}{r['unit']:>2} {r['min']:>10.1f}{r['unit']:>2}")
+    print(f"\nSaved {output}")
+
+def compare(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"{old['meta']['commit']} -> {new['meta']['commit']}")
+
+    regressions = 0
+    print(f"{'benchmark':<36} {'old':>12} {'new':>12} {'change':>8}")
+    for name, n in new['benchmarks'].items():
+        o = old['benchmarks'].get(name)
+        if not o or o['unit'] != n['unit'] or not o['median']:
+            print(f"{name:<36} {'-':>12} {n['median']:>10.1f}{n['unit']:>2}")
+            continue
+        change = (n['median'] / o['median'] - 1) * 100
+        flag = ''
+        if change > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{name:<36} {o['median']:>10.1f}{o['unit']:>2} {n['median']:>10.1f}{n['unit']:>2} "
+              f"{change:>+7.1f}%{flag}")
+
+    if regressions:
+        print(f"\n{regressions} benchmark(s) slower by more than {args.threshold}%")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the IPO trading pipeline')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    gen = sub.add_parser('generate', help='build a synthetic database')
+    gen.add_argument('--ipos', type=int, default=10000)
+    gen.add_argument('--output', help='database path (default bench_data/ipos-<n>.db)')
+
+    r = sub.add_parser('run', help='run benchmarks and save results as JSON')
+    r.add_argument('--ipos', type=int, default=10000, help='synthetic database size (1k-100k)')
+    r.add_argument('--only', help=f"comma-separated groups: {','.join(GROUPS)}")
+    r.add_argument('--repeat', type=int, default=5, help='timing rounds per micro-benchmark')
+    r.add_argument('--e2e-repeat', type=int, default=3, help='daily job runs')
+    r.add_argument('--latency-ms', type=float, default=0, help='simulated NSE/Kite latency per call')
+    r.add_argument('--regenerate', action='store_true', help='rebuild the synthetic database')
+    r.add_argument('--output', help='results file (default bench_results/<time>-<commit>.json)')
+
+    c = sub.add_parser('compare', help='compare two result files')
+    c.add_argument('old')
+    c.add_argument('new')
+    c.add_argument('--threshold', type=float, default=10, help='percent slowdown flagged as a regression')
+
+    args = parser.parse_args()
+    if args.command == 'generate':
+        path = args.output or os.path.join(DATA_DIR, f'ipos-{args.ipos}.db')
+        started = time.perf_counter()
+        generate_db(path, args.ipos)
+        print(f"Generated {path} in {time.perf_counter() - started:.1f}s")
+    elif args.command == 'run':
+        run(args)
+    else:
+        compare(args)
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,24 @@ INVESTMENT_AMOUNT = int(os.environ.get('INVESTMENT_AMOUNT', 5000))  # Rs. per IP
 STOP_LOSS_PERCENT = float(os.environ.get('STOP_LOSS_PERCENT', 1.5))  # SL below entry price
 TARGET_PROFIT_PERCENT = float(os.environ.get('TARGET_PROFIT_PERCENT', 4))  # Target exit above entry
 
+# BUY rule: per-category thresholds (every category must be above its value),
+# optional weighted score and minimum issue size (Rs. crore)
+RULE_THRESHOLDS = os.environ.get('RULE_THRESHOLDS', 'QIB=1,SNII=1,BNII=1,NII=1,Retail=1')
+RULE_WEIGHTS = os.environ.get('RULE_WEIGHTS', '')  # e.g. 'QIB=3,NII=1,Retail=1'
+RULE_MIN_SCORE = float(os.environ['RULE_MIN_SCORE']) if os.environ.get('RULE_MIN_SCORE') else None
+RULE_MIN_ISSUE_SIZE = float(os.environ['RULE_MIN_ISSUE_SIZE']) if os.environ.get('RULE_MIN_ISSUE_SIZE') else None
+
+EXIT_MODE = os.environ.get('EXIT_MODE', 'gtt')  # 'gtt' (one OCO trigger) or 'orders' (SL-M + LIMIT)
+GTT_SL_LIMIT_BUFFER = float(os.environ.get('GTT_SL_LIMIT_BUFFER', 0.5))  # % below SL trigger for the GTT sell limit
+
+SYMBOL_MIN_CONFIDENCE = float(os.environ.get('SYMBOL_MIN_CONFIDENCE', 0.6))  # Name-match score needed to trade a guessed symbol
+
+# Order fill tracking
+ORDER_FILL_TIMEOUT = float(os.environ.get('ORDER_FILL_TIMEOUT', 30))  # Seconds to wait for a buy fill
+ORDER_POLL_MIN_INTERVAL = float(os.environ.get('ORDER_POLL_MIN_INTERVAL', 0.25))  # First/fastest poll gap
+ORDER_POLL_MAX_INTERVAL = float(os.environ.get('ORDER_POLL_MAX_INTERVAL', 2))  # Backoff ceiling
+TRADE_WORKERS = int(os.environ.get('TRADE_WORKERS', 4))  # IPOs traded in parallel on a listing day
+
 # Zerodha Kite API credentials
 KITE_API_KEY = os.environ.get('KITE_API_KEY', '')
 KITE_API_SECRET = os.environ.get('KITE_API_SECRET', '')
@@ -12,10 +30,68 @@ KITE_ACCESS_TOKEN = os.environ.get('KITE_ACCESS_TOKEN', '')  # Fallback manual t
 KITE_USER_ID = os.environ.get('KITE_USER_ID', '')
 KITE_PASSWORD = os.environ.get('KITE_PASSWORD', '')
 KITE_TOTP_KEY = os.environ.get('KITE_TOTP_KEY', '')  # TOTP secret for automation
+KITE_LOGIN_MODE = os.environ.get('KITE_LOGIN_MODE', 'auto')  # http, selenium, or auto (http then selenium)
+KITE_TOKEN_EXPIRY = os.environ.get('KITE_TOKEN_EXPIRY', '06:00')  # IST; every access token dies at this time
+KITE_TOKEN_REFRESH_DELAY = int(os.environ.get('KITE_TOKEN_REFRESH_DELAY', 300))  # Seconds after expiry to log in again
+KITE_TOKEN_RETRY_INTERVAL = int(os.environ.get('KITE_TOKEN_RETRY_INTERVAL', 60))  # First retry after a failed refresh, doubled
+
+# Kite API client limits (requests/second per endpoint class) and retries
+KITE_ORDER_RATE = float(os.environ.get('KITE_ORDER_RATE', 8))  # Kite allows 10/s for orders
+KITE_QUOTE_RATE = float(os.environ.get('KITE_QUOTE_RATE', 1))  # Kite allows 1/s for quotes
+KITE_OTHER_RATE = float(os.environ.get('KITE_OTHER_RATE', 8))  # Kite allows 10/s for everything else
+KITE_MAX_RETRIES = int(os.environ.get('KITE_MAX_RETRIES', 3))
+KITE_RETRY_BASE_DELAY = float(os.environ.get('KITE_RETRY_BASE_DELAY', 0.25))  # Seconds, doubled per retry
 
 # Database path
 DB_PATH = os.environ.get('DB_PATH', 'data/ipo.db')
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 8192))  # SQLite page cache per connection
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 64 * 1024 * 1024))  # Bytes of DB file to mmap
+DB_CACHED_STATEMENTS = int(os.environ.get('DB_CACHED_STATEMENTS', 256))  # Prepared statements kept per connection
+
+# Timing spans (see metrics.py)
+TIMINGS_DB_SLOW_MS = float(os.environ.get('TIMINGS_DB_SLOW_MS', 20))  # db spans at least this slow are stored
+TIMINGS_RETENTION_DAYS = int(os.environ.get('TIMINGS_RETENTION_DAYS', 30))
+
+# Dashboard / JSON API page sizes
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 30))
+MAX_PAGE_SIZE = 200
 
 # NSE API URLs (using NSE instead of chittorgarh - more reliable)
-NSE_IPO_LIST_URL = 'https://www.nseindia.com/api/ipo-current-issue'
-NSE_IPO_DETAIL_URL = 'https://www.nseindia.com/api/ipo-detail'
+# Point NSE_BASE_URL / KITE_API_ROOT at standin.py to run against local fixtures
+NSE_BASE_URL = os.environ.get('NSE_BASE_URL', 'https://www.nseindia.com').rstrip('/')
+NSE_IPO_LIST_URL = f'{NSE_BASE_URL}/api/ipo-current-issue'
+NSE_IPO_DETAIL_URL = f'{NSE_BASE_URL}/api/ipo-detail'
+KITE_API_ROOT = os.environ.get('KITE_API_ROOT') or None  # None = Kite's own API
+KITE_LOGIN_ROOT = os.environ.get('KITE_LOGIN_ROOT', 'https://kite.zerodha.com').rstrip('/')
+
+# NSE fetch settings
+NSE_FETCH_WORKERS = int(os.environ.get('NSE_FETCH_WORKERS', 6))  # Concurrent ipo-detail requests
+NSE_HOME_URL = NSE_BASE_URL
+
+# NSE response cache (on disk, in the main database)
+NSE_CACHE_TTL_LIST = int(os.environ.get('NSE_CACHE_TTL_LIST', 60))  # Seconds to reuse ipo-current-issue
+NSE_CACHE_TTL_DETAIL = int(os.environ.get('NSE_CACHE_TTL_DETAIL', 120))  # Seconds to reuse ipo-detail
+NSE_CACHE_MAX_ENTRIES = int(os.environ.get('NSE_CACHE_MAX_ENTRIES', 500))  # LRU cap
+
+# Intraday subscription polling
+SUBSCRIPTION_POLL_INTERVAL = int(os.environ.get('SUBSCRIPTION_POLL_INTERVAL', 300))  # Seconds between snapshots
+SUBSCRIPTION_POLL_END = os.environ.get('SUBSCRIPTION_POLL_END', '17:00')  # IST time to stop polling
+
+# Market clock (see market_clock.py): stage times are IST on NSE trading days
+MARKET_CLOCK = os.environ.get('MARKET_CLOCK', 'on').lower() not in ('0', 'off', 'false', 'no')
+MARKET_CLOCK_WARMUP = os.environ.get('MARKET_CLOCK_WARMUP', '08:45')  # Token + instrument warm-up
+MARKET_CLOCK_TRADE = os.environ.get('MARKET_CLOCK_TRADE', '09:00:00')  # Listing-day orders (pre-open auction opens)
+MARKET_CLOCK_EVALUATE_DELAY = int(os.environ.get('MARKET_CLOCK_EVALUATE_DELAY', 120))  # Seconds after bidding closes
+MARKET_CLOCK_TRADE_GRACE = int(os.environ.get('MARKET_CLOCK_TRADE_GRACE', 3600))  # Latest catch-up for a missed trade slot
+MARKET_HOLIDAYS = [d.strip() for d in os.environ.get('MARKET_HOLIDAYS', '').split(',') if d.strip()]  # Extra YYYY-MM-DD closures
+
+# Live ticks and trailing exits on listing day (see ticker.py)
+TICKER_ENABLED = os.environ.get('TICKER_ENABLED', 'off').lower() in ('1', 'on', 'true', 'yes')
+KITE_TICKER_ROOT = os.environ.get('KITE_TICKER_ROOT') or None  # None = Kite's own websocket
+TICK_BUFFER_SIZE = int(os.environ.get('TICK_BUFFER_SIZE', 4096))  # Ticks kept per instrument
+TICK_RECORD_DIR = os.environ.get('TICK_RECORD_DIR', '')  # Save raw tick frames here for replays ('' = off)
+TRAIL_STOP_PERCENT = float(os.environ.get('TRAIL_STOP_PERCENT', STOP_LOSS_PERCENT))  # SL trails this far below the day's high
+TRAIL_TARGET_PERCENT = float(os.environ.get('TRAIL_TARGET_PERCENT', 0))  # Target kept this far above the high once past it (0 = fixed)
+TRAIL_MIN_STEP_PERCENT = float(os.environ.get('TRAIL_MIN_STEP_PERCENT', 0.25))  # Smallest move (% of entry) worth a modification
+TRAIL_MODIFY_INTERVAL = float(os.environ.get('TRAIL_MODIFY_INTERVAL', 2))  # Min seconds between modifications of one position
+TRAIL_MAX_MODIFICATIONS = int(os.environ.get('TRAIL_MAX_MODIFICATIONS', 20))  # Kite caps modifications per order
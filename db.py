@@ -1,22 +1,179 @@
 import sqlite3
+import threading
 from datetime import date, datetime
 import config
+import metrics
 
-def get_db():
-    conn = sqlite3.connect(config.DB_PATH)
+_local = threading.local()
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30,
+                           cached_statements=config.DB_CACHED_STATEMENTS)
     conn.row_factory = sqlite3.Row
+    # WAL lets dashboard readers run alongside the cron writer
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{config.DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={config.DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
     return conn
 
+def get_db():
+    """Get this thread's persistent connection (opened on first use)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != config.DB_PATH:
+        if conn is not None:
+            conn.close()
+        conn = _connect(config.DB_PATH)
+        _local.conn = conn
+        _local.path = config.DB_PATH
+    return conn
+
+def close_db():
+    """Close this thread's connection (e.g. before a worker thread exits)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+def _add_column(conn, table, column, decl):
+    """Add a column to an existing table if an older schema lacks it"""
+    cols = [r['name'] for r in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in cols:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+        return True
+    return False
+
+# Per-date dashboard counts, kept current by triggers on every write
+SUMMARY_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS daily_summary (
+        date DATE PRIMARY KEY,
+        ipos INTEGER NOT NULL DEFAULT 0,
+        decisions INTEGER NOT NULL DEFAULT 0,
+        trades INTEGER NOT NULL DEFAULT 0,
+        failures INTEGER NOT NULL DEFAULT 0,
+        runs INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+
+    -- The date primary key already serves the dashboard's runs > 0 scan
+    DROP INDEX IF EXISTS idx_daily_summary_runs;
+
+    -- Triggers are recreated on startup so definition changes reach existing databases
+    DROP TRIGGER IF EXISTS trg_summary_run_log;
+    DROP TRIGGER IF EXISTS trg_summary_decision_insert;
+    DROP TRIGGER IF EXISTS trg_summary_decision_status;
+    DROP TRIGGER IF EXISTS trg_summary_ipo_insert;
+    DROP TRIGGER IF EXISTS trg_summary_ipo_update;
+    DROP TRIGGER IF EXISTS trg_summary_ipo_delete;
+
+    CREATE TRIGGER trg_summary_run_log AFTER INSERT ON run_logs
+    BEGIN
+        INSERT INTO daily_summary (date, runs, failures)
+        VALUES (NEW.run_date, 1, NEW.status IS 'FAILED')
+        ON CONFLICT(date) DO UPDATE SET
+            runs = runs + 1,
+            failures = failures + (NEW.status IS 'FAILED');
+    END;
+
+    CREATE TRIGGER trg_summary_decision_insert AFTER INSERT ON decisions
+    BEGIN
+        INSERT INTO daily_summary (date, decisions, trades, failures)
+        VALUES (NEW.date, 1, (NEW.status IS 'EXECUTED' OR NEW.status IS 'EXECUTED_UNPROTECTED'), NEW.status IS 'FAILED')
+        ON CONFLICT(date) DO UPDATE SET
+            decisions = decisions + 1,
+            trades = trades + ((NEW.status IS 'EXECUTED' OR NEW.status IS 'EXECUTED_UNPROTECTED')),
+            failures = failures + (NEW.status IS 'FAILED');
+    END;
+
+    CREATE TRIGGER trg_summary_decision_status AFTER UPDATE OF status ON decisions
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN
+        UPDATE daily_summary SET
+            trades = trades + ((NEW.status IS 'EXECUTED' OR NEW.status IS 'EXECUTED_UNPROTECTED')) - ((OLD.status IS 'EXECUTED' OR OLD.status IS 'EXECUTED_UNPROTECTED')),
+            failures = failures + (NEW.status IS 'FAILED') - (OLD.status IS 'FAILED')
+        WHERE date = NEW.date;
+    END;
+
+    CREATE TRIGGER trg_summary_ipo_insert AFTER INSERT ON ipos
+    BEGIN
+        INSERT INTO daily_summary (date, ipos)
+        SELECT d, 1 FROM (
+            SELECT NEW.open_date AS d UNION SELECT NEW.close_date UNION SELECT NEW.listing_date
+        ) WHERE d IS NOT NULL
+        ON CONFLICT(date) DO UPDATE SET ipos = ipos + 1;
+    END;
+
+    CREATE TRIGGER trg_summary_ipo_update AFTER UPDATE OF open_date, close_date, listing_date ON ipos
+    WHEN OLD.open_date IS NOT NEW.open_date
+      OR OLD.close_date IS NOT NEW.close_date
+      OR OLD.listing_date IS NOT NEW.listing_date
+    BEGIN
+        UPDATE daily_summary SET ipos = ipos - 1 WHERE date IN (
+            OLD.open_date, OLD.close_date, OLD.listing_date
+        );
+        INSERT INTO daily_summary (date, ipos)
+        SELECT d, 1 FROM (
+            SELECT NEW.open_date AS d UNION SELECT NEW.close_date UNION SELECT NEW.listing_date
+        ) WHERE d IS NOT NULL
+        ON CONFLICT(date) DO UPDATE SET ipos = ipos + 1;
+    END;
+
+    CREATE TRIGGER trg_summary_ipo_delete AFTER DELETE ON ipos
+    BEGIN
+        UPDATE daily_summary SET ipos = ipos - 1 WHERE date IN (
+            OLD.open_date, OLD.close_date, OLD.listing_date
+        );
+    END;
+'''
+
+def rebuild_daily_summary(conn=None):
+    """Recompute daily_summary from the base tables"""
+    conn = conn or get_db()
+    with conn:
+        conn.execute('DELETE FROM daily_summary')
+        conn.execute('''
+            INSERT INTO daily_summary (date, ipos)
+            SELECT d, COUNT(*) FROM (
+                SELECT id, open_date AS d FROM ipos
+                UNION SELECT id, close_date FROM ipos
+                UNION SELECT id, listing_date FROM ipos
+            ) WHERE d IS NOT NULL GROUP BY d
+        ''')
+        conn.execute('''
+            INSERT INTO daily_summary (date, decisions, trades, failures)
+            SELECT date, COUNT(*), SUM(status IS 'EXECUTED' OR status IS 'EXECUTED_UNPROTECTED'), SUM(status IS 'FAILED')
+            FROM decisions WHERE true GROUP BY date
+            ON CONFLICT(date) DO UPDATE SET
+                decisions = excluded.decisions,
+                trades = excluded.trades,
+                failures = excluded.failures
+        ''')
+        conn.execute('''
+            INSERT INTO daily_summary (date, runs, failures)
+            SELECT run_date, COUNT(*), SUM(status IS 'FAILED')
+            FROM run_logs WHERE true GROUP BY run_date
+            ON CONFLICT(date) DO UPDATE SET
+                runs = excluded.runs,
+                failures = failures + excluded.failures
+        ''')
+
 def init_db():
     conn = get_db()
+    has_summary = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_summary'"
+    ).fetchone()
     conn.executescript('''
         CREATE TABLE IF NOT EXISTS ipos (
             id INTEGER PRIMARY KEY,
             company TEXT NOT NULL,
+            symbol TEXT,
             open_date DATE,
             close_date DATE,
             listing_date DATE,
+            listing_date_estimated INTEGER NOT NULL DEFAULT 0,
             issue_price REAL,
+            issue_size REAL,
+            listing_price REAL,
             scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
 
@@ -44,6 +201,8 @@ def init_db():
             target_price REAL,
             quantity INTEGER,
             status TEXT,
+            exit_order_id TEXT,
+            reason_code INTEGER,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
 
@@ -62,32 +221,182 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             expires_at TIMESTAMP NOT NULL
         );
+
+        -- Natural keys: drop rows duplicated by older scrapes, then enforce uniqueness.
+        -- A UNIQUE index treats NULLs as distinct, so a missing close date is keyed as ''
+        DELETE FROM ipos WHERE id NOT IN (
+            SELECT MAX(id) FROM ipos GROUP BY company, close_date
+        );
+        DROP INDEX IF EXISTS idx_ipos_company_close;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_ipos_company_close_key
+            ON ipos (company, COALESCE(close_date, ''));
+
+        DELETE FROM subscriptions WHERE id NOT IN (
+            SELECT MAX(id) FROM subscriptions GROUP BY company, close_date
+        );
+        DROP INDEX IF EXISTS idx_subscriptions_company_close;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_subscriptions_company_close_key
+            ON subscriptions (company, COALESCE(close_date, ''));
+
+        CREATE INDEX IF NOT EXISTS idx_ipos_open_date ON ipos (open_date);
+        CREATE INDEX IF NOT EXISTS idx_ipos_close_date ON ipos (close_date);
+        CREATE INDEX IF NOT EXISTS idx_ipos_listing_date ON ipos (listing_date);
+        CREATE INDEX IF NOT EXISTS idx_decisions_date ON decisions (date, created_at);
+        CREATE INDEX IF NOT EXISTS idx_decisions_company ON decisions (company, decision_type, status);
+        CREATE INDEX IF NOT EXISTS idx_run_logs_date ON run_logs (run_date, created_at);
+        CREATE INDEX IF NOT EXISTS idx_decisions_date_id ON decisions (date, id);
+        CREATE INDEX IF NOT EXISTS idx_run_logs_date_id ON run_logs (run_date, id);
+
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_jobs_kind_status ON jobs (kind, status);
+
+        CREATE TABLE IF NOT EXISTS subscription_snapshots (
+            id INTEGER PRIMARY KEY,
+            company TEXT NOT NULL,
+            close_date DATE,
+            ts TIMESTAMP NOT NULL,
+            qib REAL,
+            snii REAL,
+            bnii REAL,
+            nii REAL,
+            retail REAL
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_snapshots_company_close_ts
+            ON subscription_snapshots (company, close_date, ts);
+
+        CREATE TABLE IF NOT EXISTS instruments (
+            exchange TEXT NOT NULL,
+            tradingsymbol TEXT NOT NULL,
+            instrument_token INTEGER NOT NULL,
+            name TEXT,
+            lot_size INTEGER,
+            tick_size REAL,
+            instrument_type TEXT,
+            segment TEXT,
+            PRIMARY KEY (exchange, tradingsymbol)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS instruments_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            loaded_on DATE NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            source TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            rows_done INTEGER NOT NULL,
+            file_size INTEGER,
+            file_mtime REAL,
+            head_hash TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS timings (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            duration_ms REAL NOT NULL,
+            ok INTEGER NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_timings_kind_name_ts ON timings (kind, name, ts);
+        CREATE INDEX IF NOT EXISTS idx_timings_ts ON timings (ts);
+
+        CREATE TABLE IF NOT EXISTS http_cache (
+            url TEXT PRIMARY KEY,
+            body TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS schedule_runs (
+            stage TEXT NOT NULL,
+            slot TEXT NOT NULL,
+            fired_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            lag_ms REAL,
+            start_lag_ms REAL,
+            job_id INTEGER,
+            PRIMARY KEY (stage, slot)
+        );
     ''')
+    _add_column(conn, 'ipos', 'symbol', 'TEXT')
+    _add_column(conn, 'decisions', 'exit_order_id', 'TEXT')
+    _add_column(conn, 'decisions', 'reason_code', 'INTEGER')
+    _add_column(conn, 'ipos', 'issue_size', 'REAL')
+    _add_column(conn, 'ipos', 'listing_price', 'REAL')
+    _add_column(conn, 'ipos', 'listing_date_estimated', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(conn, 'schedule_runs', 'start_lag_ms', 'REAL')
+    _add_column(conn, 'import_checkpoints', 'file_mtime', 'REAL')
+    _add_column(conn, 'import_checkpoints', 'head_hash', 'TEXT')
+    added = _add_column(conn, 'instruments', 'instrument_type', 'TEXT')
+    added |= _add_column(conn, 'instruments', 'segment', 'TEXT')
+    if added:
+        # Cached master predates the type columns: download it again
+        conn.execute('DELETE FROM instruments_meta')
     conn.commit()
-    conn.close()
+
+    conn.executescript(SUMMARY_SCHEMA)
+    if not has_summary:
+        rebuild_daily_summary(conn)
 
 # IPO functions
-def upsert_ipo(company, open_date, close_date, listing_date, issue_price):
+def upsert_ipos(ipos):
+    """
+    Insert or update many IPOs in one transaction, keyed by (company, close_date).
+    Each item is a (company, open_date, close_date, listing_date, issue_price, symbol)
+    tuple, optionally followed by a flag marking listing_date as an estimate and
+    the issue size (Rs. crore). A known symbol, listing date, issue price or
+    issue size is never overwritten with NULL, and an estimated listing date
+    never replaces a published one.
+    """
+    # Pad the optional (listing_date_estimated, issue_size) tail
+    rows = [(*row, *(0, None)[len(row) - 6:]) for row in ipos]
     conn = get_db()
-    conn.execute('''
-        INSERT INTO ipos (company, open_date, close_date, listing_date, issue_price)
-        VALUES (?, ?, ?, ?, ?)
-        ON CONFLICT(id) DO UPDATE SET
-            open_date=excluded.open_date,
-            close_date=excluded.close_date,
-            listing_date=excluded.listing_date,
-            issue_price=excluded.issue_price,
-            scraped_at=CURRENT_TIMESTAMP
-    ''', (company, open_date, close_date, listing_date, issue_price))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.executemany('''
+            INSERT INTO ipos (company, open_date, close_date, listing_date, issue_price, symbol,
+                              listing_date_estimated, issue_size)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(company, COALESCE(close_date, '')) DO UPDATE SET
+                symbol=COALESCE(excluded.symbol, ipos.symbol),
+                open_date=excluded.open_date,
+                listing_date=CASE
+                    WHEN excluded.listing_date IS NULL
+                      OR (excluded.listing_date_estimated AND NOT ipos.listing_date_estimated
+                          AND ipos.listing_date IS NOT NULL)
+                    THEN ipos.listing_date ELSE excluded.listing_date END,
+                listing_date_estimated=CASE
+                    WHEN excluded.listing_date IS NULL
+                      OR (excluded.listing_date_estimated AND NOT ipos.listing_date_estimated
+                          AND ipos.listing_date IS NOT NULL)
+                    THEN ipos.listing_date_estimated ELSE excluded.listing_date_estimated END,
+                issue_price=COALESCE(excluded.issue_price, ipos.issue_price),
+                issue_size=COALESCE(excluded.issue_size, ipos.issue_size),
+                scraped_at=CURRENT_TIMESTAMP
+        ''', rows)
+
+def upsert_ipo(company, open_date, close_date, listing_date, issue_price, symbol=None):
+    upsert_ipos([(company, open_date, close_date, listing_date, issue_price, symbol)])
 
 def get_ipos_by_close_date(close_date):
     conn = get_db()
     rows = conn.execute(
         'SELECT * FROM ipos WHERE close_date = ?', (close_date,)
     ).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 def get_ipos_by_listing_date(listing_date):
@@ -95,26 +404,65 @@ def get_ipos_by_listing_date(listing_date):
     rows = conn.execute(
         'SELECT * FROM ipos WHERE listing_date = ?', (listing_date,)
     ).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
+def get_ipos_without_listing_date(since_close_date):
+    """IPOs closing on/after a date that have no listing date yet"""
+    conn = get_db()
+    rows = conn.execute('''
+        SELECT id, close_date FROM ipos
+        WHERE listing_date IS NULL AND close_date >= ?
+    ''', (since_close_date,)).fetchall()
+    return [dict(r) for r in rows]
+
+def set_estimated_listing_dates(rows):
+    """(listing_date, id) pairs; only fills IPOs that still have no listing date"""
+    conn = get_db()
+    with conn:
+        conn.executemany('''
+            UPDATE ipos SET listing_date = ?, listing_date_estimated = 1
+            WHERE id = ? AND listing_date IS NULL
+        ''', rows)
+
+def postpone_estimated_listing_dates(rows):
+    """(listing_date, id) pairs; only moves listing dates that are still estimates"""
+    conn = get_db()
+    with conn:
+        conn.executemany('''
+            UPDATE ipos SET listing_date = ?
+            WHERE id = ? AND listing_date_estimated
+        ''', rows)
+
 def get_all_ipos():
     conn = get_db()
     rows = conn.execute(
         'SELECT * FROM ipos ORDER BY close_date DESC LIMIT 50'
     ).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 # Subscription functions
-def save_subscription(company, close_date, qib, snii, bnii, nii, retail):
+def upsert_subscriptions(subscriptions):
+    """
+    Insert or update many subscriptions in one transaction, keyed by
+    (company, close_date). Each item is a
+    (company, close_date, qib, snii, bnii, nii, retail) tuple.
+    """
     conn = get_db()
-    conn.execute('''
-        INSERT INTO subscriptions (company, close_date, qib, snii, bnii, nii, retail)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (company, close_date, qib, snii, bnii, nii, retail))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.executemany('''
+            INSERT INTO subscriptions (company, close_date, qib, snii, bnii, nii, retail)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(company, COALESCE(close_date, '')) DO UPDATE SET
+                qib=excluded.qib,
+                snii=excluded.snii,
+                bnii=excluded.bnii,
+                nii=excluded.nii,
+                retail=excluded.retail,
+                scraped_at=CURRENT_TIMESTAMP
+        ''', subscriptions)
+
+def save_subscription(company, close_date, qib, snii, bnii, nii, retail):
+    upsert_subscriptions([(company, close_date, qib, snii, bnii, nii, retail)])
 
 def get_subscription(company, close_date):
     conn = get_db()
@@ -122,22 +470,75 @@ def get_subscription(company, close_date):
         'SELECT * FROM subscriptions WHERE company = ? AND close_date = ?',
         (company, close_date)
     ).fetchone()
-    conn.close()
     return dict(row) if row else None
 
+# Subscription time-series (only changed snapshots are stored)
+SNAPSHOT_FIELDS = ('qib', 'snii', 'bnii', 'nii', 'retail')
+
+def save_subscription_snapshot(company, close_date, ts, qib, snii, bnii, nii, retail):
+    """Append a snapshot if it differs from the latest one. Returns True if written"""
+    conn = get_db()
+    with conn:
+        cur = conn.execute('''
+            INSERT INTO subscription_snapshots (company, close_date, ts, qib, snii, bnii, nii, retail)
+            SELECT ?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8
+            WHERE NOT EXISTS (
+                SELECT 1 FROM (
+                    SELECT qib, snii, bnii, nii, retail FROM subscription_snapshots
+                    WHERE company = ?1 AND close_date IS ?2
+                    ORDER BY ts DESC
+                    LIMIT 1
+                )
+                WHERE qib IS ?4 AND snii IS ?5 AND bnii IS ?6 AND nii IS ?7 AND retail IS ?8
+            )
+        ''', (company, close_date, ts, qib, snii, bnii, nii, retail))
+    return cur.rowcount == 1
+
+def get_latest_snapshot(company, close_date):
+    """Get the most recent subscription snapshot for an IPO"""
+    conn = get_db()
+    row = conn.execute('''
+        SELECT * FROM subscription_snapshots
+        WHERE company = ? AND close_date IS ?
+        ORDER BY ts DESC
+        LIMIT 1
+    ''', (company, close_date)).fetchone()
+    return dict(row) if row else None
+
+def get_subscription_curve(company, close_date):
+    """Get all stored snapshots for an IPO, oldest first"""
+    conn = get_db()
+    rows = conn.execute('''
+        SELECT ts, qib, snii, bnii, nii, retail FROM subscription_snapshots
+        WHERE company = ? AND close_date = ?
+        ORDER BY ts
+    ''', (company, close_date)).fetchall()
+    return [dict(r) for r in rows]
+
+def get_all_subscriptions():
+    """Every stored subscription joined with its IPO's issue size (for re-scoring)"""
+    conn = get_db()
+    rows = conn.execute('''
+        SELECT s.company, s.close_date, s.qib, s.snii, s.bnii, s.nii, s.retail, i.issue_size
+        FROM subscriptions s
+        LEFT JOIN ipos i ON i.company = s.company AND i.close_date = s.close_date
+        ORDER BY s.close_date
+    ''').fetchall()
+    return [dict(r) for r in rows]
+
 # Decision functions
 def save_decision(date, company, decision_type, reason, order_id=None,
                   entry_price=None, stop_loss_price=None, target_price=None,
-                  quantity=None, status='PENDING'):
+                  quantity=None, status='PENDING', reason_code=None):
     conn = get_db()
     conn.execute('''
         INSERT INTO decisions (date, company, decision_type, reason, order_id,
-                               entry_price, stop_loss_price, target_price, quantity, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                               entry_price, stop_loss_price, target_price, quantity,
+                               status, reason_code)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (date, company, decision_type, reason, order_id, entry_price,
-          stop_loss_price, target_price, quantity, status))
+          stop_loss_price, target_price, quantity, status, reason_code))
     conn.commit()
-    conn.close()
 
 def update_decision(id, **kwargs):
     conn = get_db()
@@ -145,19 +546,45 @@ def update_decision(id, **kwargs):
     values = list(kwargs.values()) + [id]
     conn.execute(f'UPDATE decisions SET {sets} WHERE id = ?', values)
     conn.commit()
-    conn.close()
+
+def claim_decision(id):
+    """Move a PENDING decision to PLACING; False if another run already claimed it"""
+    conn = get_db()
+    with conn:
+        cur = conn.execute(
+            "UPDATE decisions SET status = 'PLACING' WHERE id = ? AND status = 'PENDING'", (id,)
+        )
+    return cur.rowcount == 1
 
 def get_pending_buys(listing_date):
+    """
+    PENDING BUYs for IPOs listing on a date: an idx_ipos_listing_date search,
+    then idx_decisions_company per IPO. Decisions are dated on the close date,
+    which keeps a company's earlier issues out.
+    """
     conn = get_db()
     rows = conn.execute('''
-        SELECT d.*, i.issue_price
-        FROM decisions d
-        JOIN ipos i ON d.company = i.company
-        WHERE d.decision_type = 'BUY'
+        SELECT d.*, i.id AS ipo_id, i.issue_price, i.symbol, i.listing_date_estimated
+        FROM ipos i
+        JOIN decisions d ON d.company = i.company AND d.date = i.close_date
+        WHERE i.listing_date = ?
+        AND d.decision_type = 'BUY'
         AND d.status = 'PENDING'
-        AND i.listing_date = ?
     ''', (listing_date,)).fetchall()
-    conn.close()
+    return [dict(r) for r in rows]
+
+def get_open_positions(listing_date):
+    """EXECUTED BUYs for IPOs listing on a date that have exit orders in place"""
+    conn = get_db()
+    rows = conn.execute('''
+        SELECT d.*, i.symbol
+        FROM ipos i
+        JOIN decisions d ON d.company = i.company AND d.date = i.close_date
+        WHERE i.listing_date = ?
+        AND d.decision_type = 'BUY'
+        AND d.status = 'EXECUTED'
+        AND d.exit_order_id IS NOT NULL
+    ''', (listing_date,)).fetchall()
     return [dict(r) for r in rows]
 
 def get_recent_decisions(limit=20):
@@ -165,7 +592,6 @@ def get_recent_decisions(limit=20):
     rows = conn.execute(
         'SELECT * FROM decisions ORDER BY created_at DESC LIMIT ?', (limit,)
     ).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 # Log functions
@@ -176,14 +602,13 @@ def log_run(run_type, status, details=''):
         VALUES (?, ?, ?, ?)
     ''', (date.today(), run_type, status, details))
     conn.commit()
-    conn.close()
+    metrics.incr('runs_total', run_type=run_type, status=status)
 
 def get_recent_logs(limit=50):
     conn = get_db()
     rows = conn.execute(
         'SELECT * FROM run_logs ORDER BY created_at DESC LIMIT ?', (limit,)
     ).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 # Date-based queries
@@ -191,11 +616,87 @@ def get_all_run_dates():
     """Get all unique dates that have activity"""
     conn = get_db()
     rows = conn.execute('''
-        SELECT DISTINCT run_date FROM run_logs
-        ORDER BY run_date DESC
+        SELECT date FROM daily_summary
+        WHERE runs > 0
+        ORDER BY date DESC
     ''').fetchall()
-    conn.close()
-    return [r['run_date'] for r in rows]
+    return [r['date'] for r in rows]
+
+def get_daily_summaries(before=None, limit=None):
+    """
+    Get per-date counts (IPOs, decisions, trades, failures) for dates with runs,
+    newest first. Pass the last date seen as `before` to get the next page.
+    """
+    conn = get_db()
+    limit = -1 if limit is None else limit
+    if before:
+        rows = conn.execute('''
+            SELECT * FROM daily_summary
+            WHERE runs > 0 AND date < ?
+            ORDER BY date DESC
+            LIMIT ?
+        ''', (before, limit)).fetchall()
+    else:
+        rows = conn.execute('''
+            SELECT * FROM daily_summary
+            WHERE runs > 0
+            ORDER BY date DESC
+            LIMIT ?
+        ''', (limit,)).fetchall()
+    return [dict(r) for r in rows]
+
+# Decisions are made on the close date, so that day's subscription row holds
+# the values their reason_code refers to
+DECISIONS_WITH_SUBSCRIPTION = '''
+    SELECT d.*, s.qib, s.snii, s.bnii, s.nii, s.retail
+    FROM decisions d
+    LEFT JOIN subscriptions s ON s.company = d.company AND s.close_date = d.date
+'''
+
+# Keyset pagination: pages are ordered by (date, id) descending and the
+# cursor is the (date, id) of the last row already returned
+def get_decisions_page(before=None, limit=20):
+    """Get a page of decisions older than the (date, id) cursor"""
+    conn = get_db()
+    if before:
+        rows = conn.execute(f'''
+            {DECISIONS_WITH_SUBSCRIPTION}
+            WHERE (d.date, d.id) < (?, ?)
+            ORDER BY d.date DESC, d.id DESC
+            LIMIT ?
+        ''', (*before, limit)).fetchall()
+    else:
+        rows = conn.execute(f'''
+            {DECISIONS_WITH_SUBSCRIPTION}
+            ORDER BY d.date DESC, d.id DESC
+            LIMIT ?
+        ''', (limit,)).fetchall()
+    return [dict(r) for r in rows]
+
+def get_logs_page(before=None, limit=50):
+    """Get a page of run logs older than the (run_date, id) cursor"""
+    conn = get_db()
+    if before:
+        rows = conn.execute('''
+            SELECT * FROM run_logs
+            WHERE (run_date, id) < (?, ?)
+            ORDER BY run_date DESC, id DESC
+            LIMIT ?
+        ''', (*before, limit)).fetchall()
+    else:
+        rows = conn.execute('''
+            SELECT * FROM run_logs
+            ORDER BY run_date DESC, id DESC
+            LIMIT ?
+        ''', (limit,)).fetchall()
+    return [dict(r) for r in rows]
+
+def get_daily_summary(date_str):
+    conn = get_db()
+    row = conn.execute(
+        'SELECT * FROM daily_summary WHERE date = ?', (date_str,)
+    ).fetchone()
+    return dict(row) if row else None
 
 def get_ipos_by_date(date_str):
     """Get IPOs relevant for a date (closing or listing)"""
@@ -205,18 +706,16 @@ def get_ipos_by_date(date_str):
         WHERE close_date = ? OR listing_date = ? OR open_date = ?
         ORDER BY company
     ''', (date_str, date_str, date_str)).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 def get_decisions_by_date(date_str):
     """Get decisions made on a date"""
     conn = get_db()
-    rows = conn.execute('''
-        SELECT * FROM decisions
-        WHERE date = ?
-        ORDER BY created_at DESC
+    rows = conn.execute(f'''
+        {DECISIONS_WITH_SUBSCRIPTION}
+        WHERE d.date = ?
+        ORDER BY d.created_at DESC
     ''', (date_str,)).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 def get_logs_by_date(date_str):
@@ -227,7 +726,6 @@ def get_logs_by_date(date_str):
         WHERE run_date = ?
         ORDER BY created_at
     ''', (date_str,)).fetchall()
-    conn.close()
     return [dict(r) for r in rows]
 
 # Token management
@@ -242,7 +740,6 @@ def save_access_token(access_token, expires_at):
         VALUES (?, ?)
     ''', (access_token, expires_at))
     conn.commit()
-    conn.close()
 
 def get_access_token():
     """Get current access token if valid"""
@@ -254,8 +751,282 @@ def get_access_token():
         ORDER BY created_at DESC
         LIMIT 1
     ''', (datetime.now().isoformat(),)).fetchone()
-    conn.close()
     return dict(row)['access_token'] if row else None
 
+def get_token_record():
+    """Latest stored token with its created_at/expires_at (expired or not)"""
+    conn = get_db()
+    row = conn.execute('''
+        SELECT access_token, created_at, expires_at FROM kite_tokens
+        ORDER BY created_at DESC
+        LIMIT 1
+    ''').fetchone()
+    return dict(row) if row else None
+
+# Background jobs
+def create_job(kind):
+    """Insert a QUEUED job and return its id"""
+    conn = get_db()
+    cur = conn.execute(
+        "INSERT INTO jobs (kind, status) VALUES (?, 'QUEUED')", (kind,)
+    )
+    conn.commit()
+    return cur.lastrowid
+
+def update_job(id, **kwargs):
+    conn = get_db()
+    sets = ', '.join(f'{k} = ?' for k in kwargs.keys())
+    values = list(kwargs.values()) + [id]
+    conn.execute(f'UPDATE jobs SET {sets} WHERE id = ?', values)
+    conn.commit()
+
+def get_job(id):
+    conn = get_db()
+    row = conn.execute('SELECT * FROM jobs WHERE id = ?', (id,)).fetchone()
+    return dict(row) if row else None
+
+def get_active_job(kind):
+    """Get the queued or running job of a kind, if any"""
+    conn = get_db()
+    row = conn.execute('''
+        SELECT * FROM jobs
+        WHERE kind = ? AND status IN ('QUEUED', 'RUNNING')
+        ORDER BY id DESC
+        LIMIT 1
+    ''', (kind,)).fetchone()
+    return dict(row) if row else None
+
+def fail_unfinished_jobs(error):
+    """Mark jobs left QUEUED/RUNNING by a dead process as FAILED"""
+    conn = get_db()
+    conn.execute('''
+        UPDATE jobs SET status = 'FAILED', error = ?, finished_at = ?
+        WHERE status IN ('QUEUED', 'RUNNING')
+    ''', (error, datetime.now().isoformat(sep=' ', timespec='seconds')))
+    conn.commit()
+
+# Bulk import (historical datasets)
+def get_import_checkpoint(source):
+    conn = get_db()
+    row = conn.execute(
+        'SELECT * FROM import_checkpoints WHERE source = ?', (source,)
+    ).fetchone()
+    return dict(row) if row else None
+
+def clear_import_checkpoint(source):
+    conn = get_db()
+    conn.execute('DELETE FROM import_checkpoints WHERE source = ?', (source,))
+    conn.commit()
+
+def import_chunk(source, kind, rows_done, fingerprint, ipos=(), subscriptions=(), snapshots=()):
+    """
+    Write one chunk of imported rows and advance the checkpoint in the same
+    transaction, so an interrupted import resumes exactly after the last
+    committed chunk. fingerprint is the (file_size, file_mtime, head_hash)
+    the checkpoint is only valid for.
+      ipos:          (company, symbol, open_date, close_date, listing_date,
+                      issue_price, issue_size, listing_price)
+      subscriptions: (company, close_date, qib, snii, bnii, nii, retail)
+      snapshots:     (company, close_date, ts, qib, snii, bnii, nii, retail)
+    """
+    conn = get_db()
+    with conn:
+        if ipos:
+            conn.executemany('''
+                INSERT INTO ipos (company, symbol, open_date, close_date, listing_date,
+                                  issue_price, issue_size, listing_price)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(company, COALESCE(close_date, '')) DO UPDATE SET
+                    symbol=COALESCE(excluded.symbol, ipos.symbol),
+                    open_date=COALESCE(excluded.open_date, ipos.open_date),
+                    listing_date=COALESCE(excluded.listing_date, ipos.listing_date),
+                    listing_date_estimated=CASE WHEN excluded.listing_date IS NULL
+                        THEN ipos.listing_date_estimated ELSE 0 END,
+                    issue_price=COALESCE(excluded.issue_price, ipos.issue_price),
+                    issue_size=COALESCE(excluded.issue_size, ipos.issue_size),
+                    listing_price=COALESCE(excluded.listing_price, ipos.listing_price)
+            ''', ipos)
+        if subscriptions:
+            conn.executemany('''
+                INSERT INTO subscriptions (company, close_date, qib, snii, bnii, nii, retail)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(company, COALESCE(close_date, '')) DO UPDATE SET
+                    qib=excluded.qib,
+                    snii=excluded.snii,
+                    bnii=excluded.bnii,
+                    nii=excluded.nii,
+                    retail=excluded.retail
+            ''', subscriptions)
+        if snapshots:
+            conn.executemany('''
+                INSERT INTO subscription_snapshots (company, close_date, ts, qib, snii, bnii, nii, retail)
+                SELECT ?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM subscription_snapshots
+                    WHERE company = ?1 AND close_date IS ?2 AND ts = ?3
+                )
+            ''', snapshots)
+        conn.execute('''
+            INSERT INTO import_checkpoints (source, kind, rows_done, file_size, file_mtime, head_hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(source) DO UPDATE SET
+                kind=excluded.kind,
+                rows_done=excluded.rows_done,
+                file_size=excluded.file_size,
+                file_mtime=excluded.file_mtime,
+                head_hash=excluded.head_hash,
+                updated_at=CURRENT_TIMESTAMP
+        ''', (source, kind, rows_done, *fingerprint))
+
+# Instrument master
+def replace_instruments(instruments, loaded_on):
+    """Replace the cached instrument dump in one transaction"""
+    conn = get_db()
+    with conn:
+        conn.execute('DELETE FROM instruments')
+        conn.executemany('''
+            INSERT OR REPLACE INTO instruments
+                (exchange, tradingsymbol, instrument_token, name, lot_size, tick_size,
+                 instrument_type, segment)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', instruments)
+        conn.execute('''
+            INSERT INTO instruments_meta (id, loaded_on) VALUES (1, ?)
+            ON CONFLICT(id) DO UPDATE SET loaded_on=excluded.loaded_on
+        ''', (loaded_on,))
+
+def get_instruments():
+    """Get the cached instrument dump"""
+    conn = get_db()
+    rows = conn.execute('''
+        SELECT exchange, tradingsymbol, instrument_token, name, lot_size, tick_size,
+               instrument_type, segment
+        FROM instruments
+    ''').fetchall()
+    return [dict(r) for r in rows]
+
+def get_instruments_loaded_on():
+    """Get the date the cached instrument dump was downloaded"""
+    conn = get_db()
+    row = conn.execute('SELECT loaded_on FROM instruments_meta WHERE id = 1').fetchone()
+    return row['loaded_on'] if row else None
+
+# HTTP response cache
+def get_cached_response(url):
+    """Get a cached response body and validators for a URL"""
+    conn = get_db()
+    row = conn.execute(
+        'SELECT * FROM http_cache WHERE url = ?', (url,)
+    ).fetchone()
+    return dict(row) if row else None
+
+def save_cached_response(url, body, etag, last_modified, fetched_at):
+    """Store a fresh response and evict least recently used entries"""
+    conn = get_db()
+    conn.execute('''
+        INSERT INTO http_cache (url, body, etag, last_modified, fetched_at, last_used)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(url) DO UPDATE SET
+            body=excluded.body,
+            etag=excluded.etag,
+            last_modified=excluded.last_modified,
+            fetched_at=excluded.fetched_at,
+            last_used=excluded.last_used
+    ''', (url, body, etag, last_modified, fetched_at, fetched_at))
+    conn.execute('''
+        DELETE FROM http_cache WHERE url NOT IN (
+            SELECT url FROM http_cache ORDER BY last_used DESC LIMIT ?
+        )
+    ''', (config.NSE_CACHE_MAX_ENTRIES,))
+    conn.commit()
+
+def touch_cached_response(url, used_at, revalidated=False):
+    """Mark a cache entry as used (and fresh again after a 304)"""
+    conn = get_db()
+    if revalidated:
+        conn.execute(
+            'UPDATE http_cache SET last_used = ?, fetched_at = ? WHERE url = ?',
+            (used_at, used_at, url)
+        )
+    else:
+        conn.execute(
+            'UPDATE http_cache SET last_used = ? WHERE url = ?', (used_at, url)
+        )
+    conn.commit()
+
+# Timing spans (written in batches by metrics.flush)
+def save_timings(rows):
+    """Insert (ts, kind, name, duration_ms, ok) rows"""
+    conn = get_db()
+    with conn:
+        conn.executemany('''
+            INSERT INTO timings (ts, kind, name, duration_ms, ok) VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+
+def prune_timings(before_ts):
+    conn = get_db()
+    with conn:
+        conn.execute('DELETE FROM timings WHERE ts < ?', (before_ts,))
+
+def get_timings(kind, name, since_ts):
+    """Stored spans of one kind/name since a unix timestamp, oldest first"""
+    conn = get_db()
+    rows = conn.execute('''
+        SELECT ts, duration_ms, ok FROM timings
+        WHERE kind = ? AND name = ? AND ts >= ?
+        ORDER BY ts
+    ''', (kind, name, since_ts)).fetchall()
+    return [dict(r) for r in rows]
+
+# Market clock slots (one row per fired stage slot)
+def claim_schedule_slot(stage, slot, lag_ms=None):
+    """Record a slot as fired; False if it already was (by this or another process)"""
+    conn = get_db()
+    with conn:
+        cur = conn.execute(
+            'INSERT OR IGNORE INTO schedule_runs (stage, slot, lag_ms) VALUES (?, ?, ?)',
+            (stage, slot, lag_ms)
+        )
+    return cur.rowcount == 1
+
+def set_schedule_job(stage, slot, job_id):
+    conn = get_db()
+    with conn:
+        conn.execute('UPDATE schedule_runs SET job_id = ? WHERE stage = ? AND slot = ?',
+                     (job_id, stage, slot))
+
+def set_schedule_start_lag(stage, slot, start_lag_ms):
+    """How late a fired slot's stage actually started (lag_ms is when it was queued)"""
+    conn = get_db()
+    with conn:
+        conn.execute('UPDATE schedule_runs SET start_lag_ms = ? WHERE stage = ? AND slot = ?',
+                     (start_lag_ms, stage, slot))
+
+def get_fired_slots(since_slot):
+    """(stage, slot) pairs fired at or after an ISO slot time"""
+    conn = get_db()
+    rows = conn.execute(
+        'SELECT stage, slot FROM schedule_runs WHERE slot >= ?', (since_slot,)
+    ).fetchall()
+    return {(r['stage'], r['slot']) for r in rows}
+
+def get_recent_schedule_runs(limit=20):
+    conn = get_db()
+    rows = conn.execute('''
+        SELECT r.*, j.status AS job_status
+        FROM schedule_runs r LEFT JOIN jobs j ON j.id = r.job_id
+        ORDER BY r.slot DESC
+        LIMIT ?
+    ''', (limit,)).fetchall()
+    return [dict(r) for r in rows]
+
+# Every public helper below the connection layer is timed as a 'db' span
+_UNTIMED = {'get_db', 'close_db', 'save_timings', 'prune_timings'}
+
+for _name, _func in list(globals().items()):
+    if (callable(_func) and getattr(_func, '__module__', None) == __name__
+            and not _name.startswith('_') and _name not in _UNTIMED):
+        globals()[_name] = metrics.timed('db', _name)(_func)
+
 # Initialize on import
 init_db()
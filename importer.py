@@ -0,0 +1,177 @@
+"""
+Streaming bulk importer for historical IPO datasets
+
+Reads CSV or JSON-lines files row by row through a generator pipeline and
+writes them to the ipos / subscriptions tables in chunked executemany
+transactions. Each chunk commits together with a checkpoint, so re-running
+an interrupted import resumes where it stopped, and re-importing a file
+doesn't duplicate anything (rows upsert on their natural keys). A file whose
+size, mtime or leading bytes changed since its checkpoint starts over.
+
+  ipos:          company, symbol, open_date, close_date, listing_date,
+                 issue_price, issue_size, listing_price
+  subscriptions: company, close_date, qib, snii, bnii, nii, retail [, ts]
+                 Rows with a ts also go to the intraday snapshot series
+                 (unchanged consecutive values are skipped).
+
+Usage:
+    python importer.py ipos history/ipos.csv
+    python importer.py subscriptions history/subs.jsonl --chunk-size 10000
+    python importer.py subscriptions history/subs.csv --restart
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+from functools import lru_cache
+from itertools import islice
+import db
+import scraper
+
+# Historical files repeat the same few thousand dates many times over
+parse_nse_date = lru_cache(maxsize=8192)(scraper.parse_nse_date)
+
+CHUNK_SIZE = 5000
+HEAD_BYTES = 64 * 1024  # Header + first rows hashed to recognise a rewritten file
+
+def read_rows(path):
+    """Yield one dict per CSV row or JSON line"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith(('.jsonl', '.ndjson', '.json')):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+def _float(val):
+    if val is None:
+        return None
+    val = str(val).strip().replace(',', '').rstrip('xX')
+    if val in ('', '-'):
+        return None
+    try:
+        return float(val)
+    except ValueError:
+        return None
+
+def _text(val):
+    val = (str(val).strip() if val is not None else '')
+    return val or None
+
+def ipo_rows(rows):
+    for r in rows:
+        company = _text(r.get('company'))
+        if not company:
+            continue
+        yield {'ipo': (
+            company,
+            _text(r.get('symbol')),
+            parse_nse_date(r.get('open_date')),
+            parse_nse_date(r.get('close_date')),
+            parse_nse_date(r.get('listing_date')),
+            _float(r.get('issue_price')),
+            _float(r.get('issue_size')),
+            _float(r.get('listing_price')),
+        )}
+
+def subscription_rows(rows):
+    last = {}  # (company, close_date) -> last snapshot values, for delta-only snapshots
+    for r in rows:
+        company = _text(r.get('company'))
+        if not company:
+            continue
+        close_date = parse_nse_date(r.get('close_date'))
+        values = tuple(_float(r.get(c)) or 0.0 for c in db.SNAPSHOT_FIELDS)
+        item = {'subscription': (company, close_date) + values}
+
+        ts = _text(r.get('ts'))
+        if ts and last.get((company, close_date)) != values:
+            last[(company, close_date)] = values
+            item['snapshot'] = (company, close_date, ts) + values
+        yield item
+
+PIPELINES = {
+    'ipos': ipo_rows,
+    'subscriptions': subscription_rows,
+}
+
+def chunked(items, size):
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def fingerprint(path):
+    """(size, mtime, hash of the first HEAD_BYTES) of a file"""
+    stat = os.stat(path)
+    with open(path, 'rb') as f:
+        head_hash = hashlib.sha256(f.read(HEAD_BYTES)).hexdigest()
+    return stat.st_size, stat.st_mtime, head_hash
+
+def run_import(kind, path, chunk_size=CHUNK_SIZE, restart=False):
+    """Import a file; returns the number of rows processed in this run"""
+    source = os.path.abspath(path)
+    file_print = fingerprint(path)
+
+    if restart:
+        db.clear_import_checkpoint(source)
+    checkpoint = db.get_import_checkpoint(source)
+    if checkpoint and (checkpoint['kind'], checkpoint['file_size'], checkpoint['file_mtime'],
+                       checkpoint['head_hash']) != (kind, *file_print):
+        print("File changed since the last import, starting over")
+        checkpoint = None
+    skip = checkpoint['rows_done'] if checkpoint else 0
+    if skip:
+        print(f"Resuming {path} after {skip} rows")
+
+    # Skipped rows still run through the pipeline so the snapshot delta
+    # state matches an uninterrupted import
+    items = PIPELINES[kind](read_rows(path))
+    done = 0
+    for _ in islice(items, skip):
+        done += 1
+
+    started = time.perf_counter()
+    imported = 0
+    for chunk in chunked(items, chunk_size):
+        done += len(chunk)
+        imported += len(chunk)
+        # Only the last row per natural key survives an upsert anyway
+        ipos = {(i['ipo'][0], i['ipo'][3]): i['ipo'] for i in chunk if 'ipo' in i}
+        subs = {i['subscription'][:2]: i['subscription'] for i in chunk if 'subscription' in i}
+        db.import_chunk(
+            source, kind, done, file_print,
+            ipos=list(ipos.values()),
+            subscriptions=list(subs.values()),
+            snapshots=[i['snapshot'] for i in chunk if 'snapshot' in i],
+        )
+        elapsed = time.perf_counter() - started
+        print(f"  {done} rows ({imported / elapsed:.0f} rows/s)")
+
+    if skip and not imported:
+        print(f"{path} was already imported ({skip} rows), nothing to do; use --restart to import it again")
+        return 0
+
+    db.log_run('IMPORT', 'SUCCESS', f'Imported {imported} {kind} rows from {os.path.basename(path)}')
+    return imported
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import historical IPO data')
+    parser.add_argument('kind', choices=sorted(PIPELINES))
+    parser.add_argument('paths', nargs='+', help='CSV or JSON-lines files')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--restart', action='store_true', help='drop saved checkpoints and import from the first row')
+    args = parser.parse_args()
+
+    for path in args.paths:
+        print(f"Importing {args.kind} from {path}")
+        run_import(args.kind, path, args.chunk_size, args.restart)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+In-process background job executor
+Jobs are persisted in the jobs table so their status survives the request
+that started them. Jobs run one at a time on a single worker thread (they
+all write to the same SQLite file), except kinds in OWN_WORKER, which must
+not queue behind a long scrape or evaluation and get a worker of their own.
+Triggering a kind that is already queued or running returns the existing
+job instead of starting another.
+"""
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import db
+import metrics
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job')
+# Listing-day orders go out on time even while a catch-up evaluation runs,
+# and hold their worker until the fills and exits are done
+OWN_WORKER = {'trade'}
+_own_executors = {}
+_submit_lock = threading.Lock()
+_current = threading.local()
+
+def _now():
+    return datetime.now().isoformat(sep=' ', timespec='seconds')
+
+def recover():
+    """Fail jobs a previous web process left queued/running (call once at startup)"""
+    db.fail_unfinished_jobs('Interrupted by restart')
+
+def submit(kind, func, *args, **kwargs):
+    """
+    Queue func(*args, **kwargs) as a background job.
+    Returns (job_id, created) - created is False if an identical job was
+    already queued or running.
+    """
+    with _submit_lock:
+        active = db.get_active_job(kind)
+        if active:
+            return active['id'], False
+        job_id = db.create_job(kind)
+        executor = _executor
+        if kind in OWN_WORKER:
+            if kind not in _own_executors:
+                _own_executors[kind] = ThreadPoolExecutor(max_workers=1,
+                                                          thread_name_prefix=f'job-{kind}')
+            executor = _own_executors[kind]
+
+    executor.submit(_run, job_id, func, args, kwargs)
+    return job_id, True
+
+def set_progress(message):
+    """Report progress for the job running on this thread (no-op outside jobs)"""
+    job_id = getattr(_current, 'job_id', None)
+    if job_id is not None:
+        db.update_job(job_id, progress=message)
+
+def get(job_id):
+    return db.get_job(job_id)
+
+def _run(job_id, func, args, kwargs):
+    _current.job_id = job_id
+    db.update_job(job_id, status='RUNNING', started_at=_now())
+    try:
+        func(*args, **kwargs)
+        db.update_job(job_id, status='SUCCESS', finished_at=_now())
+    except Exception as e:
+        traceback.print_exc()
+        db.update_job(job_id, status='FAILED', error=str(e), finished_at=_now())
+    finally:
+        _current.job_id = None
+        metrics.flush()
@@ -1,24 +1,125 @@
 """
-Fully automated Kite Connect login using Selenium + TOTP
-Based on: https://medium.com/@yasheshlele/how-to-fully-automate-your-zerodha-kite-api-login-with-python-1bf6001f34fe
+Fully automated Kite Connect login using TOTP
+By default the user ID, password and TOTP are posted straight to Kite's login
+API over a pooled requests.Session and the request_token is read from the
+connect redirect - no browser, well under a second. The headless Chromium
+flow (Selenium) is kept as a fallback; KITE_LOGIN_MODE picks http, selenium
+or auto (http, then selenium).
+Selenium flow based on: https://medium.com/@yasheshlele/how-to-fully-automate-your-zerodha-kite-api-login-with-python-1bf6001f34fe
 """
 
+import threading
 import time
+from urllib.parse import urljoin, urlparse, parse_qs
 import pyotp
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
+import requests
+from requests.adapters import HTTPAdapter
 from kiteconnect import KiteConnect
-from datetime import datetime, timedelta
 import config
-import db
+import token_manager
+
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'X-Kite-Version': '3',
+}
+MAX_REDIRECTS = 10
+
+class LoginError(Exception):
+    pass
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_login_session():
+    """Keep-alive session for the login API (cookies are cleared per login)"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(HTTP_HEADERS)
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=2)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+def get_login_url():
+    return f"{config.KITE_LOGIN_ROOT}/connect/login?v=3&api_key={config.KITE_API_KEY}"
+
+def current_totp():
+    """TOTP code with at least a second of validity left"""
+    totp = pyotp.TOTP(config.KITE_TOTP_KEY)
+    remaining = totp.interval - time.time() % totp.interval
+    if remaining < 1:
+        time.sleep(remaining)
+    return totp.now()
+
+def _api_post(session, path, data):
+    """POST to the login API; returns the response's data or raises LoginError"""
+    resp = session.post(f"{config.KITE_LOGIN_ROOT}{path}", data=data, timeout=10)
+    try:
+        body = resp.json()
+    except ValueError:
+        raise LoginError(f"{path}: unexpected {resp.status_code} response")
+    if resp.status_code != 200 or body.get('status') != 'success':
+        raise LoginError(f"{path}: {body.get('message') or resp.status_code}")
+    return body.get('data') or {}
+
+def _request_token_from(url):
+    token = parse_qs(urlparse(url).query).get('request_token')
+    return token[0] if token else None
+
+def _follow_to_request_token(session, url):
+    """
+    Follow the connect redirects by hand and stop at the first URL carrying a
+    request_token - the app's redirect URL itself may not be reachable from
+    here (e.g. localhost).
+    """
+    for _ in range(MAX_REDIRECTS):
+        resp = session.get(url, allow_redirects=False, timeout=10)
+        location = resp.headers.get('Location')
+        if not location:
+            raise LoginError(f"No request_token in redirect chain (stopped at {resp.status_code})")
+        url = urljoin(url, location)
+        request_token = _request_token_from(url)
+        if request_token:
+            return request_token
+    raise LoginError("Too many redirects before request_token")
+
+def http_request_token():
+    """Log in over plain HTTP and return a request_token"""
+    session = get_login_session()
+    session.cookies.clear()
+
+    # Opening the connect URL starts the login session (sess_id cookie)
+    session.get(get_login_url(), timeout=10)
+
+    login = _api_post(session, '/api/login', {
+        'user_id': config.KITE_USER_ID,
+        'password': config.KITE_PASSWORD,
+    })
+    twofa = {
+        'user_id': login.get('user_id', config.KITE_USER_ID),
+        'request_id': login['request_id'],
+        'twofa_type': 'totp',
+    }
+    try:
+        _api_post(session, '/api/twofa', {**twofa, 'twofa_value': current_totp()})
+    except LoginError as e:
+        # The code may have rolled over in flight - retry once with the next one
+        print(f"TOTP rejected ({e}), retrying with the next code...")
+        interval = pyotp.TOTP(config.KITE_TOTP_KEY).interval
+        time.sleep(interval - time.time() % interval)
+        _api_post(session, '/api/twofa', {**twofa, 'twofa_value': current_totp()})
+
+    # Now authenticated, the connect URL redirects to the app with the token
+    return _follow_to_request_token(session, get_login_url())
 
 def get_chrome_driver():
     """Initialize headless Chrome driver"""
     import os
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
 
     chrome_options = Options()
     chrome_options.add_argument('--headless')
@@ -43,27 +144,22 @@ def get_chrome_driver():
 
     return driver
 
-def auto_login_kite():
-    """
-    Fully automated Kite Connect login
-    Returns access_token or None
-    """
-    if not all([config.KITE_API_KEY, config.KITE_API_SECRET,
-                config.KITE_USER_ID, config.KITE_PASSWORD, config.KITE_TOTP_KEY]):
-        print("Missing Kite credentials for auto-login")
+def selenium_request_token():
+    """Log in through headless Chromium and return a request_token (None on failure)"""
+    try:
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+    except ImportError:
+        print("Selenium not installed - browser login unavailable")
         return None
 
-    print("Starting automated Kite login...")
-
     driver = get_chrome_driver()
     if not driver:
         return None
 
     try:
-        # Initialize Kite Connect
-        kite = KiteConnect(api_key=config.KITE_API_KEY)
-        login_url = kite.login_url()
-
+        login_url = get_login_url()
         print(f"Opening login URL: {login_url}")
         driver.get(login_url)
 
@@ -85,65 +181,85 @@ def auto_login_kite():
         login_button = driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
         login_button.click()
 
-        # Wait for TOTP page
-        time.sleep(2)
-
-        # Generate TOTP
-        print("Generating TOTP...")
-        totp = pyotp.TOTP(config.KITE_TOTP_KEY)
-        totp_code = totp.now()
-
-        # Enter TOTP
+        # Enter TOTP as soon as the field appears
         print("Entering TOTP...")
         totp_input = wait.until(EC.presence_of_element_located((By.ID, "totp")))
-        totp_input.send_keys(totp_code)
+        totp_input.send_keys(current_totp())
 
         # Click continue
         print("Submitting TOTP...")
         continue_button = driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
         continue_button.click()
 
-        # Wait for redirect and capture request_token from URL
+        # Wait for the redirect carrying the request_token
         print("Waiting for redirect...")
-        time.sleep(3)
+        wait.until(lambda d: "request_token=" in d.current_url)
 
         current_url = driver.current_url
         print(f"Redirected to: {current_url}")
+        return _request_token_from(current_url)
 
-        # Extract request_token
-        if "request_token=" in current_url:
-            request_token = current_url.split("request_token=")[1].split("&")[0]
-            print(f"Got request_token: {request_token[:20]}...")
+    except Exception as e:
+        print(f"Browser login error: {e}")
+        return None
+    finally:
+        driver.quit()
 
-            # Generate access token
-            print("Generating access token...")
-            data = kite.generate_session(request_token, api_secret=config.KITE_API_SECRET)
-            access_token = data['access_token']
+def auto_login_kite():
+    """
+    Fully automated Kite Connect login
+    Returns access_token or None
+    """
+    if not all([config.KITE_API_KEY, config.KITE_API_SECRET,
+                config.KITE_USER_ID, config.KITE_PASSWORD, config.KITE_TOTP_KEY]):
+        print("Missing Kite credentials for auto-login")
+        return None
+
+    mode = config.KITE_LOGIN_MODE
+    print(f"Starting automated Kite login ({mode})...")
+    started = time.perf_counter()
 
-            # Store in database
-            expires_at = (datetime.now() + timedelta(hours=24)).isoformat()
-            db.save_access_token(access_token, expires_at)
+    request_token = None
+    if mode in ('http', 'auto'):
+        try:
+            request_token = http_request_token()
+        except (LoginError, requests.RequestException, KeyError) as e:
+            print(f"HTTP login failed: {e}")
+    if not request_token and mode in ('selenium', 'auto'):
+        if mode == 'auto':
+            print("Falling back to browser login...")
+        request_token = selenium_request_token()
 
-            print("✓ Access token generated and saved!")
-            return access_token
-        else:
-            print("No request_token in URL - login may have failed")
-            return None
+    if not request_token:
+        print("No request_token - login failed")
+        return None
+    print(f"Got request_token: {request_token[:20]}...")
 
+    try:
+        # Generate access token
+        print("Generating access token...")
+        kite = KiteConnect(api_key=config.KITE_API_KEY, root=config.KITE_API_ROOT)
+        data = kite.generate_session(request_token, api_secret=config.KITE_API_SECRET)
+        access_token = data['access_token']
     except Exception as e:
         print(f"Auto-login error: {e}")
         import traceback
         traceback.print_exc()
         return None
-    finally:
-        driver.quit()
+
+    # Store with its real expiry (and hand it to subscribers)
+    expires_at = token_manager.set_token(access_token)
+
+    print(f"✓ Access token generated and saved in {time.perf_counter() - started:.2f}s"
+          f" (valid until {expires_at:%Y-%m-%d %H:%M} IST)")
+    return access_token
 
 def auto_refresh_token_if_needed():
     """
     Check if token is expired and auto-refresh if needed
     Returns True if token is valid (either existing or refreshed)
     """
-    token = db.get_access_token()
+    token = token_manager.get_token()
 
     if token:
         print("✓ Valid access token exists")
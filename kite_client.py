@@ -0,0 +1,150 @@
+"""
+Rate-limited, retrying wrapper around KiteConnect
+Every API method goes through a token bucket for its endpoint class (Kite
+limits orders, quotes and everything else separately), is retried with
+jittered exponential backoff on transient failures, and has its latency and
+outcome recorded.
+"""
+import random
+import threading
+import time
+import requests
+from kiteconnect.exceptions import NetworkException
+import config
+import metrics
+
+# Kite methods that create or change orders
+ORDER_METHODS = {
+    'place_order', 'modify_order', 'cancel_order', 'exit_order',
+    'place_gtt', 'modify_gtt', 'delete_gtt',
+}
+
+QUOTE_METHODS = {'quote', 'ltp', 'ohlc'}
+
+OTHER_METHODS = {
+    'orders', 'order_history', 'order_trades', 'trades', 'positions',
+    'holdings', 'margins', 'profile', 'instruments', 'get_gtt', 'get_gtts',
+    'historical_data', 'generate_session',
+}
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens/second, bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Take one token, sleeping until one is available"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def try_acquire(self):
+        """Take one token if available; never blocks"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+def endpoint_class(method):
+    if method in ORDER_METHODS:
+        return 'order'
+    if method in QUOTE_METHODS:
+        return 'quote'
+    return 'other'
+
+def is_retryable(method, error):
+    """
+    429s are always safe to retry (Kite rejected the call outright). Other
+    network failures are only retried for reads - a timed-out order may
+    already have reached the exchange.
+    """
+    if isinstance(error, NetworkException) and getattr(error, 'code', None) == 429:
+        return True
+    if method in ORDER_METHODS:
+        return False
+    return isinstance(error, (NetworkException, requests.ConnectionError, requests.Timeout))
+
+class KiteClient:
+    """Drop-in proxy for a KiteConnect instance"""
+
+    def __init__(self, kite):
+        self._kite = kite
+        self._buckets = {
+            'order': TokenBucket(config.KITE_ORDER_RATE),
+            'quote': TokenBucket(config.KITE_QUOTE_RATE),
+            'other': TokenBucket(config.KITE_OTHER_RATE),
+        }
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._kite, name)
+        if name in ORDER_METHODS or name in QUOTE_METHODS or name in OTHER_METHODS:
+            return lambda *args, **kwargs: self.call(name, attr, *args, **kwargs)
+        return attr
+
+    def call(self, method, func, *args, **kwargs):
+        """Call a Kite API method with rate limiting, retries and metrics"""
+        bucket = self._buckets[endpoint_class(method)]
+        attempt = 0
+        while True:
+            bucket.acquire()
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self._record(method, time.perf_counter() - started, type(e).__name__)
+                if attempt >= config.KITE_MAX_RETRIES or not is_retryable(method, e):
+                    raise
+                # Full jitter: sleep a random slice of the exponential window
+                delay = random.uniform(0, config.KITE_RETRY_BASE_DELAY * (2 ** attempt))
+                attempt += 1
+                print(f"Kite {method} failed ({e}), retry {attempt} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            self._record(method, time.perf_counter() - started, 'ok')
+            return result
+
+    def _record(self, method, seconds, outcome):
+        metrics.observe('kite', method, seconds, outcome == 'ok')
+        with self._metrics_lock:
+            m = self._metrics.setdefault(method, {
+                'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'outcomes': {},
+            })
+            ms = seconds * 1000
+            m['calls'] += 1
+            m['total_ms'] += ms
+            m['max_ms'] = max(m['max_ms'], ms)
+            if outcome != 'ok':
+                m['errors'] += 1
+            m['outcomes'][outcome] = m['outcomes'].get(outcome, 0) + 1
+
+    def get_metrics(self):
+        """Snapshot of per-method call counts, errors and latency"""
+        with self._metrics_lock:
+            snapshot = {}
+            for method, m in self._metrics.items():
+                snapshot[method] = {
+                    **m,
+                    'outcomes': dict(m['outcomes']),
+                    'avg_ms': round(m['total_ms'] / m['calls'], 1) if m['calls'] else 0.0,
+                }
+            return snapshot
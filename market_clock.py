@@ -0,0 +1,224 @@
+"""
+In-process market clock
+Fires the daily job's stages at exact IST times on NSE trading days instead
+of all at once when the 9 AM cron arrives:
+
+    warmup    08:45            Kite token, instruments, order tracker
+    trade     09:00:00         listing-day orders, as the pre-open auction opens
+    scrape    10:00 - 17:00    every SUBSCRIPTION_POLL_INTERVAL through bidding
+    evaluate  17:02            final post-close scrape, then BUY/SKIP decisions
+
+One thread sleeps until the next slot - a coarse wait, then a short spin
+for the last few milliseconds - and hands the stage to the jobs executor
+(trade on a worker of its own, so it never queues behind another stage).
+Each fired slot is claimed in schedule_runs, so a slot never fires twice
+(restarts, a second process) and a slot missed while the app was down is
+caught up on startup if it is still within its grace period. Only the most
+recent slot of a stage is caught up.
+
+Usage:
+    python market_clock.py [plan] [--date 2026-03-04]
+    python market_clock.py run
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta
+import config
+import db
+import jobs
+import metrics
+import scheduler
+import trading_calendar as cal
+
+SPIN = 0.02          # seconds before a slot to stop sleeping and spin
+MAX_SLEEP = 60       # re-check the clock at least this often
+MIN_GRACE = 60       # seconds a slot can still be caught up, at least
+
+_wake = threading.Event()
+_thread = None
+_fired = set()       # (stage, slot iso) fired or seen in schedule_runs
+
+def slots(day):
+    """(slot datetime, stage, grace seconds) for one day, in time order"""
+    if not cal.is_trading_day(day):
+        return []
+    interval = config.SUBSCRIPTION_POLL_INTERVAL
+    open_at = cal.at(day, cal.BIDDING_OPEN)
+    close_at = cal.at(day, cal.BIDDING_CLOSE)
+    warmup = cal.at(day, config.MARKET_CLOCK_WARMUP)
+
+    result = [
+        (warmup, 'warmup', max((cal.at(day, cal.MARKET_CLOSE) - warmup).total_seconds(), MIN_GRACE)),
+        (cal.at(day, config.MARKET_CLOCK_TRADE), 'trade', config.MARKET_CLOCK_TRADE_GRACE),
+    ]
+    at = open_at
+    while at <= close_at:
+        result.append((at, 'scrape', interval))
+        at += timedelta(seconds=interval)
+    evaluate_at = close_at + timedelta(seconds=config.MARKET_CLOCK_EVALUATE_DELAY)
+    # A missed evaluation is still useful until the next session's orders go out
+    next_trade = cal.at(cal.next_trading_day(day), config.MARKET_CLOCK_TRADE)
+    result.append((evaluate_at, 'evaluate', max((next_trade - evaluate_at).total_seconds(), MIN_GRACE)))
+    return sorted(result)
+
+STAGES = {
+    'warmup': scheduler.warm_up,
+    'trade': scheduler.trade,
+    'scrape': scheduler.scrape,
+    'evaluate': scheduler.evaluate,
+}
+
+def _window(now):
+    """Slots from the previous trading day through the next one"""
+    day = cal.previous_trading_day(now.date())
+    end = cal.next_trading_day(now.date())
+    result = []
+    while day <= end:
+        result += slots(day)
+        day += timedelta(days=1)
+    return result
+
+def due(now):
+    """Latest unfired slot per stage that has passed and is within its grace"""
+    latest = {}
+    for at, stage, grace in _window(now):
+        if at <= now:
+            latest[stage] = (at, grace)
+    return [(at, stage) for stage, (at, grace) in latest.items()
+            if (stage, at.isoformat()) not in _fired
+            and (now - at).total_seconds() <= grace]
+
+def next_slot(now):
+    for at, stage, _ in _window(now):
+        if at > now:
+            return at, stage
+    return None
+
+def _run_stage(stage, at):
+    lag = time.time() - at.timestamp()
+    metrics.observe('clock_lag', stage, max(lag, 0))
+    # Time spent queued behind other jobs counts: this is when the stage ran
+    db.set_schedule_start_lag(stage, at.isoformat(), round(lag * 1000, 1))
+    print(f"[clock] {stage} for {at:%Y-%m-%d %H:%M:%S} (started {lag * 1000:+.0f}ms)")
+    with metrics.span('stage', stage):
+        STAGES[stage](at.date().isoformat())
+
+def fire(at, stage):
+    """Claim a slot and queue its stage; returns the job id, None if it had already fired"""
+    key = (stage, at.isoformat())
+    lag_ms = round((time.time() - at.timestamp()) * 1000, 1)
+    _fired.add(key)
+    if not db.claim_schedule_slot(stage, key[1], lag_ms):
+        return None
+    job_id, _ = jobs.submit(stage, _run_stage, stage, at)
+    db.set_schedule_job(stage, key[1], job_id)
+    return job_id
+
+def catch_up():
+    """Fire every due slot now (e.g. on a cron hit); [(stage, slot, job_id)] fired"""
+    fired = []
+    for at, stage in due(cal.now()):
+        job_id = fire(at, stage)
+        if job_id is not None:
+            fired.append((stage, at.isoformat(), job_id))
+    return fired
+
+def _sleep_until(target):
+    """Sleep until the wall-clock time `target` (unix seconds), or until woken"""
+    while True:
+        remaining = target - time.time()
+        if remaining <= 0:
+            return True
+        if remaining > SPIN:
+            if _wake.wait(min(remaining - SPIN, MAX_SLEEP)):
+                return False
+            continue
+        # Last few ms: sleep-spin for sub-ms accuracy
+        while time.time() < target:
+            time.sleep(0.0005)
+        return True
+
+def _load_fired(now):
+    since = cal.at(cal.previous_trading_day(now.date()), '00:00').isoformat()
+    _fired.update(db.get_fired_slots(since))
+
+def _run():
+    _load_fired(cal.now())
+    while True:
+        now = cal.now()
+        for at, stage in due(now):
+            kind = 'catch-up' if (now - at).total_seconds() > 1 else 'on time'
+            if fire(at, stage) is not None:
+                print(f"[clock] fired {stage} {at:%H:%M:%S} ({kind})")
+
+        upcoming = next_slot(cal.now())
+        _wake.clear()
+        if upcoming is None:
+            _wake.wait(MAX_SLEEP)
+            continue
+        at, stage = upcoming
+        _sleep_until(at.timestamp())
+
+def start():
+    """Start the clock thread (no-op if MARKET_CLOCK is off)"""
+    global _thread
+    if not config.MARKET_CLOCK:
+        return False
+    if _thread is None:
+        _thread = threading.Thread(target=_run, daemon=True, name='market-clock')
+        _thread.start()
+    return True
+
+def wake():
+    """Re-check due slots now (e.g. after a cron hit or a config change)"""
+    _wake.set()
+
+def plan(day=None):
+    """A day's slots with their fired status, for /schedule and the CLI"""
+    day = day or cal.today()
+    fired = db.get_fired_slots(cal.at(day, '00:00').isoformat())
+    return [{'at': at.isoformat(), 'stage': stage, 'grace_s': int(grace),
+             'fired': (stage, at.isoformat()) in fired}
+            for at, stage, grace in slots(day)]
+
+def status():
+    now = cal.now()
+    upcoming = next_slot(now)
+    return {
+        'enabled': config.MARKET_CLOCK,
+        'running': _thread is not None and _thread.is_alive(),
+        'now': now.isoformat(timespec='seconds'),
+        'trading_day': cal.is_trading_day(now.date()),
+        'next': {'at': upcoming[0].isoformat(), 'stage': upcoming[1]} if upcoming else None,
+        'today': plan(now.date()),
+        'recent': db.get_recent_schedule_runs(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Market clock for the daily job stages')
+    parser.add_argument('command', nargs='?', choices=('plan', 'run'), default='plan')
+    parser.add_argument('--date', help='day to plan (YYYY-MM-DD, default today IST)')
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        day = datetime.strptime(args.date, '%Y-%m-%d').date() if args.date else cal.today()
+        if not cal.is_trading_day(day):
+            print(f"{day} is not a trading day (next: {cal.next_trading_day(day)})")
+            return
+        for slot in plan(day):
+            mark = 'x' if slot['fired'] else ' '
+            print(f"[{mark}] {slot['at'][11:19]}  {slot['stage']}")
+        return
+
+    config.MARKET_CLOCK = True
+    start()
+    print(f"Market clock running (next: {next_slot(cal.now())})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Lightweight timing spans and Prometheus metrics
+A span times one unit of work - a pipeline stage, an NSE request, a Kite
+call or a db helper - into an in-process histogram keyed by (kind, name).
+Spans are also buffered and written in batches to the timings table (db
+spans only when slow), so latency history survives restarts. render()
+produces the Prometheus text format served at /metrics.
+"""
+import atexit
+import functools
+from bisect import bisect_left
+import threading
+import time
+import config
+
+# Histogram bucket upper bounds, seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+FLUSH_SIZE = 200
+PRUNE_INTERVAL = 3600
+
+_lock = threading.Lock()
+_histograms = {}   # (kind, name) -> [bucket counts..., +Inf count, sum]
+_errors = {}       # (kind, name) -> count
+_counters = {}     # (metric, sorted label items) -> value
+_pending = []      # (ts, kind, name, duration_ms, ok) rows not yet written
+_last_prune = 0.0
+
+def observe(kind, name, seconds, ok=True):
+    """Record one timed operation"""
+    key = (kind, name)
+    slot = bisect_left(BUCKETS, seconds)  # == len(BUCKETS) for the +Inf bucket
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        hist[slot] += 1
+        hist[-1] += seconds
+        if not ok:
+            _errors[key] = _errors.get(key, 0) + 1
+
+        if kind != 'db' or seconds * 1000 >= config.TIMINGS_DB_SLOW_MS:
+            _pending.append((time.time() - seconds, kind, name, round(seconds * 1000, 3), int(ok)))
+            flush_now = len(_pending) >= FLUSH_SIZE
+        else:
+            flush_now = False
+    if flush_now:
+        flush()
+
+def incr(metric, value=1, **labels):
+    """Increment a counter"""
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+class span:
+    """
+    Context manager timing a block: `with metrics.span('stage', 'scrape'):`
+    An exception marks the span as failed and propagates. The duration (ms)
+    is available as .ms afterwards.
+    """
+    __slots__ = ('kind', 'name', 'ms', '_started')
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.ms = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._started
+        self.ms = seconds * 1000
+        observe(self.kind, self.name, seconds, exc_type is None)
+        return False
+
+def timed(kind, name=None):
+    """Decorator form of span (name defaults to the function name)"""
+    def decorate(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            ok = False
+            try:
+                result = func(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                observe(kind, label, time.perf_counter() - started, ok)
+        return wrapper
+    return decorate
+
+def flush():
+    """Write buffered spans to the timings table and prune old rows"""
+    global _last_prune
+    with _lock:
+        if not _pending:
+            return
+        rows = _pending[:]
+        del _pending[:]
+        prune = time.time() - _last_prune >= PRUNE_INTERVAL
+        if prune:
+            _last_prune = time.time()
+
+    import db
+    try:
+        db.save_timings(rows)
+        if prune:
+            db.prune_timings(time.time() - config.TIMINGS_RETENTION_DAYS * 86400)
+    except Exception as e:
+        print(f"Could not save timings: {e}")
+
+atexit.register(flush)
+
+def _labels(pairs):
+    def esc(v):
+        return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{k}="{esc(v)}"' for k, v in pairs)
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        histograms = {k: v[:] for k, v in _histograms.items()}
+        errors = dict(_errors)
+        counters = dict(_counters)
+
+    lines = [
+        '# HELP ipo_span_duration_seconds Duration of pipeline stages, NSE/Kite calls and db queries.',
+        '# TYPE ipo_span_duration_seconds histogram',
+    ]
+    for (kind, name), hist in sorted(histograms.items()):
+        base = _labels((('kind', kind), ('name', name)))
+        cumulative = 0
+        for bound, count in zip(BUCKETS, hist):
+            cumulative += count
+            lines.append(f'ipo_span_duration_seconds_bucket{{{base},le="{bound}"}} {cumulative}')
+        cumulative += hist[len(BUCKETS)]
+        lines.append(f'ipo_span_duration_seconds_bucket{{{base},le="+Inf"}} {cumulative}')
+        lines.append(f'ipo_span_duration_seconds_sum{{{base}}} {hist[-1]:.6f}')
+        lines.append(f'ipo_span_duration_seconds_count{{{base}}} {cumulative}')
+
+    lines += [
+        '# HELP ipo_span_errors_total Spans that ended with an exception.',
+        '# TYPE ipo_span_errors_total counter',
+    ]
+    for (kind, name), count in sorted(errors.items()):
+        lines.append(f'ipo_span_errors_total{{{_labels((("kind", kind), ("name", name)))}}} {count}')
+
+    by_metric = {}
+    for (metric, labels), value in counters.items():
+        by_metric.setdefault(metric, []).append((labels, value))
+    for metric, series in sorted(by_metric.items()):
+        lines.append(f'# TYPE ipo_{metric} counter')
+        for labels, value in sorted(series):
+            label_text = _labels(labels)
+            lines.append(f'ipo_{metric}{{{label_text}}} {value}' if label_text else f'ipo_{metric} {value}')
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,90 @@
+"""
+Order fill tracker
+One background poller resolves every pending order with a single orders()
+call per round, backing off while nothing changes. Kite postbacks (or any
+other order update source) can resolve orders immediately via update().
+"""
+import threading
+import config
+
+TERMINAL_STATUSES = {'COMPLETE', 'REJECTED', 'CANCELLED'}
+
+class OrderTracker:
+    def __init__(self, fetch_orders, min_interval=None, max_interval=None):
+        self._fetch_orders = fetch_orders
+        self.min_interval = min_interval or config.ORDER_POLL_MIN_INTERVAL
+        self.max_interval = max_interval or config.ORDER_POLL_MAX_INTERVAL
+
+        self._lock = threading.Lock()
+        self._events = {}    # order_id -> Event set once the order is terminal
+        self._results = {}   # order_id -> final order dict
+        self._wake = threading.Event()
+        self._poller = None
+
+    def track(self, order_id):
+        """Start tracking an order (idempotent)"""
+        with self._lock:
+            if order_id not in self._events:
+                self._events[order_id] = threading.Event()
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._run, daemon=True,
+                                                name='order-tracker')
+                self._poller.start()
+        self._wake.set()
+
+    def update(self, order):
+        """Feed an order update (from a poll or a postback)"""
+        order_id = order.get('order_id')
+        if order.get('status') not in TERMINAL_STATUSES:
+            return False
+        with self._lock:
+            event = self._events.get(order_id)
+            if event is None or event.is_set():
+                return False
+            self._results[order_id] = order
+            event.set()
+        return True
+
+    def wait(self, order_id, timeout=None):
+        """
+        Block until the order reaches a terminal status.
+        Returns the order dict, or None on timeout.
+        """
+        if timeout is None:
+            timeout = config.ORDER_FILL_TIMEOUT
+        self.track(order_id)
+        event = self._events[order_id]
+        event.wait(timeout)
+
+        with self._lock:
+            result = self._results.pop(order_id, None)
+            self._events.pop(order_id, None)
+        return result
+
+    def _pending(self):
+        return [oid for oid, ev in self._events.items() if not ev.is_set()]
+
+    def _run(self):
+        interval = self.min_interval
+        while True:
+            with self._lock:
+                if not self._pending():
+                    self._poller = None
+                    return
+
+            self._wake.clear()
+            resolved = 0
+            try:
+                for order in self._fetch_orders() or []:
+                    if self.update(order):
+                        resolved += 1
+            except Exception as e:
+                print(f"Order poll error: {e}")
+
+            # Poll fast while orders are moving, back off while they are not
+            if resolved:
+                interval = self.min_interval
+            else:
+                interval = min(interval * 1.5, self.max_interval)
+
+            self._wake.wait(interval)
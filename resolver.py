@@ -0,0 +1,138 @@
+"""
+Company name -> trading symbol resolver
+Builds a normalized-token inverted index over the instrument master once per
+load, so each lookup only scores the few instruments sharing a name token
+prefix. Kite truncates long names ("INDIAN RAILWAY FIN CORP L"), so tokens
+match when one is a prefix of the other. Only NSE cash-equity instruments are
+indexed: orders go to NSE, and bonds, NCDs and ETFs often share a company's
+name.
+"""
+import re
+
+# Words that carry no identity in Indian company names
+STOPWORDS = {
+    'LIMITED', 'LTD', 'THE', 'AND', 'OF', 'PVT', 'PRIVATE',
+    'CO', 'COMPANY', 'CORP', 'CORPORATION', 'INC',
+}
+
+_NON_ALNUM = re.compile(r'[^A-Z0-9 ]+')
+
+# Tokens are bucketed by this many leading characters in the inverted index
+PREFIX_LEN = 3
+
+# Instruments the resolver may return
+EXCHANGE = 'NSE'
+# Kite tradingsymbol suffixes of NSE equity series (SME, trade-for-trade);
+# any other suffix (-N1, -GB, -SG, ...) is a debt or gold instrument
+EQUITY_SERIES = {'', 'BE', 'BZ', 'SM', 'ST'}
+
+_index = None
+_index_source = None
+
+def normalize(name):
+    """Uppercase, strip punctuation and stopwords -> tuple of tokens"""
+    name = _NON_ALNUM.sub(' ', (name or '').upper().replace('&', ' AND '))
+    return tuple(t for t in name.split() if len(t) > 1 and t not in STOPWORDS)
+
+def _series(symbol):
+    return symbol.rpartition('-')[2] if '-' in symbol else ''
+
+def is_equity(exchange, inst):
+    """NSE cash-equity row (rows cached without a type are taken as equity)"""
+    if exchange != EXCHANGE or inst.get('instrument_type') not in (None, 'EQ'):
+        return False
+    if inst.get('segment') not in (None, EXCHANGE):
+        return False    # e.g. INDICES
+    return _series(inst.get('tradingsymbol') or '') in EQUITY_SERIES
+
+def build_index(instruments):
+    """
+    Build lookup tables from an instrument master dict
+    ({(exchange, SYMBOL): {'name': ..., 'tradingsymbol': ..., 'instrument_type': ...}}),
+    keyed by (exchange, SYMBOL). Where names collide, the plain EQ-series
+    symbol wins over SME and trade-for-trade series.
+    """
+    exact = {}
+    tokens = {}      # PREFIX_LEN-char bucket (or a shorter whole token) -> keys
+    stems = {}       # shorter-than-PREFIX_LEN prefix -> keys with a longer token
+    names = {}
+    symbols = {}
+
+    # Plain symbols last so they overwrite other series in the exact-name table
+    rows = sorted(((k, inst) for k, inst in instruments.items() if is_equity(k[0], inst)),
+                  key=lambda kv: (_series(kv[0][1]) == '', kv[0]))
+    for key, inst in rows:
+        name = normalize(inst.get('name'))
+        if not name or 'ETF' in name:
+            continue
+        exact[name] = key
+        names[key] = name
+        symbols[key[1]] = key
+        for tok in name:
+            tokens.setdefault(tok[:PREFIX_LEN], set()).add(key)
+            for k in range(2, min(len(tok), PREFIX_LEN)):
+                stems.setdefault(tok[:k], set()).add(key)
+
+    return {'exact': exact, 'tokens': tokens, 'stems': stems, 'names': names,
+            'symbols': symbols}
+
+def get_index(instruments):
+    """Index for the given instrument master, rebuilt only when it changes"""
+    global _index, _index_source
+    if _index is None or _index_source is not instruments:
+        _index = build_index(instruments)
+        _index_source = instruments
+    return _index
+
+def _tokens_match(a, b):
+    return a.startswith(b) or b.startswith(a)
+
+def score(query, name):
+    """Share of tokens matched (prefix-aware) over the longer of the two names"""
+    matched = sum(1 for q in query if any(_tokens_match(q, n) for n in name))
+    return matched / max(len(query), len(name))
+
+def _candidates(index, key):
+    """Instruments with a name token that could prefix-match one of key's"""
+    found = set()
+    for tok in key:
+        found |= index['tokens'].get(tok[:PREFIX_LEN], set())
+        if len(tok) < PREFIX_LEN:
+            # A short token prefixes longer ones in other buckets
+            found |= index['stems'].get(tok, set())
+        else:
+            # Short name tokens sit in their own buckets
+            for k in range(2, PREFIX_LEN):
+                found |= index['tokens'].get(tok[:k], set())
+    return found
+
+def resolve_symbol(company, instruments):
+    """
+    Resolve a company name to an NSE equity trading symbol.
+    Returns (symbol, exchange, confidence) with confidence in [0, 1], or
+    (None, None, 0.0).
+    """
+    index = get_index(instruments)
+    key = normalize(company)
+    if not key:
+        return None, None, 0.0
+
+    match = index['exact'].get(key)
+    if match:
+        return match[1], match[0], 1.0
+
+    # Company name written as the symbol itself (e.g. "IRFC")
+    match = index['symbols'].get(''.join(key))
+    if match:
+        return match[1], match[0], 0.9
+
+    best, best_score = None, 0.0
+    for cand in sorted(_candidates(index, key)):
+        s = score(key, index['names'][cand])
+        if s > best_score:
+            best, best_score = cand, s
+
+    if best is None:
+        return None, None, 0.0
+    # Only an exact normalized name counts as certain
+    return best[1], best[0], round(min(best_score, 0.95), 3)
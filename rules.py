@@ -0,0 +1,114 @@
+"""
+Subscription rule engine
+A rule is compiled once (thresholds per category, optional weighted score,
+optional issue-size floor) into NumPy arrays, then applied to any number of
+subscriptions in one vectorized call. Results are BUY flags plus integer
+reason codes; the human-readable reason is only built by format_reason().
+"""
+import numpy as np
+import config
+
+CATEGORIES = ('qib', 'snii', 'bnii', 'nii', 'retail')
+LABELS = ('QIB', 'SNII', 'BNII', 'NII', 'Retail')
+
+# Reason code bits: one per category below its threshold, then the extras
+SCORE_TOO_LOW = 1 << len(CATEGORIES)
+ISSUE_TOO_SMALL = 1 << (len(CATEGORIES) + 1)
+
+class CompiledRule:
+    def __init__(self, thresholds, weights=None, min_score=None, min_issue_size=None):
+        self.thresholds = np.array([thresholds.get(c, 1.0) for c in CATEGORIES],
+                                   dtype=np.float64)
+        self.weights = None
+        if weights:
+            w = np.array([weights.get(c, 0.0) for c in CATEGORIES], dtype=np.float64)
+            if w.sum() <= 0:
+                raise ValueError(f"Rule weights must sum to more than 0: {weights}")
+            self.weights = w / w.sum()
+        self.min_score = min_score
+        self.min_issue_size = min_issue_size
+        self._bits = (1 << np.arange(len(CATEGORIES))).astype(np.int64)
+
+    def evaluate(self, subs, issue_sizes=None):
+        """
+        Evaluate an array of subscriptions ([n, 5] in CATEGORIES order).
+        Returns (buy: bool[n], codes: int64[n]); code 0 means every check passed.
+        Unknown issue sizes (None/NaN) don't fail the size check.
+        """
+        subs = np.nan_to_num(np.asarray(subs, dtype=np.float64).reshape(-1, len(CATEGORIES)))
+        codes = (subs <= self.thresholds) @ self._bits
+
+        if self.weights is not None and self.min_score is not None:
+            codes |= np.where(subs @ self.weights < self.min_score, SCORE_TOO_LOW, 0)
+
+        if self.min_issue_size is not None and issue_sizes is not None:
+            sizes = np.asarray(issue_sizes, dtype=np.float64)
+            with np.errstate(invalid='ignore'):
+                codes |= np.where(sizes < self.min_issue_size, ISSUE_TOO_SMALL, 0)
+
+        return codes == 0, codes
+
+    def score(self, subs):
+        """Weighted subscription score (None if the rule has no weights)"""
+        if self.weights is None:
+            return None
+        return np.asarray(subs, dtype=np.float64).reshape(-1, len(CATEGORIES)) @ self.weights
+
+def _parse_map(text):
+    """'QIB=1.5,Retail=2' -> {'qib': 1.5, 'retail': 2.0}"""
+    result = {}
+    for part in (text or '').split(','):
+        if '=' in part:
+            key, val = part.split('=', 1)
+            result[key.strip().lower()] = float(val)
+    return result
+
+def compile_rule(thresholds=None, weights=None, min_score=None, min_issue_size=None):
+    """Build a rule; anything not given comes from config (RULE_* settings)"""
+    if thresholds is None:
+        thresholds = _parse_map(config.RULE_THRESHOLDS)
+    if weights is None:
+        weights = _parse_map(config.RULE_WEIGHTS)
+    if min_score is None:
+        min_score = config.RULE_MIN_SCORE
+    if min_issue_size is None:
+        min_issue_size = config.RULE_MIN_ISSUE_SIZE
+    return CompiledRule(thresholds, weights, min_score, min_issue_size)
+
+_default_rule = None
+
+def get_default_rule():
+    global _default_rule
+    if _default_rule is None:
+        _default_rule = compile_rule()
+    return _default_rule
+
+def to_array(subscriptions):
+    """List of subscription dicts -> [n, 5] array"""
+    return np.array([[s.get(c) or 0.0 for c in CATEGORIES] for s in subscriptions],
+                    dtype=np.float64).reshape(-1, len(CATEGORIES))
+
+def format_reason(code, values, rule=None):
+    """Human-readable reason for one evaluated subscription"""
+    rule = rule or get_default_rule()
+    parts = []
+    for i, (label, val) in enumerate(zip(LABELS, values)):
+        mark = '✗' if code & (1 << i) else '✓'
+        parts.append(f"{label}: {val:g}x {mark}")
+    reason = ', '.join(parts)
+
+    if code == 0:
+        return f"All categories oversubscribed: {reason}"
+
+    extras = []
+    if code & SCORE_TOO_LOW:
+        extras.append(f"score below {rule.min_score}")
+    if code & ISSUE_TOO_SMALL:
+        extras.append(f"issue size below {rule.min_issue_size}")
+    if code & (SCORE_TOO_LOW - 1):
+        prefix = "Not all categories oversubscribed"
+    else:
+        prefix = "Rule not met"
+    if extras:
+        reason += f" ({', '.join(extras)})"
+    return f"{prefix}: {reason}"
@@ -10,35 +10,94 @@ from datetime import date
 import scraper
 import trader
 import db
+import jobs
+import config
+import metrics
+import ticker
+import token_manager
+import trading_calendar
 
 def run_daily_job():
     """Main entry point for daily cron job"""
     today = date.today().isoformat()
     print(f"=== Running daily job for {today} ===")
+    stages = []
 
-    # Step 0: Auto-refresh Kite token if needed
-    print("\n[0/4] Checking Kite token...")
-    try:
-        import kite_auto_login
-        if not kite_auto_login.auto_refresh_token_if_needed():
-            print("⚠ Warning: Kite token refresh failed, trading may not work")
-    except Exception as e:
-        print(f"⚠ Token auto-refresh error: {e}")
-
-    # Step 1: Scrape fresh data
-    print("\n[1/4] Scraping IPO data...")
-    scraper.run_scraper()
+    with metrics.span('stage', 'daily_job') as job:
+        # Step 0: Auto-refresh Kite token if needed
+        print("\n[0/4] Checking Kite token...")
+        jobs.set_progress('[0/4] Checking Kite token')
+        with metrics.span('stage', 'token') as stage:
+            try:
+                # Normally already refreshed in the background after expiry
+                if not token_manager.ensure_token():
+                    print("⚠ Warning: Kite token refresh failed, trading may not work")
+            except Exception as e:
+                print(f"⚠ Token auto-refresh error: {e}")
+        stages.append(stage)
+
+        # Step 1: Scrape fresh data
+        print("\n[1/4] Scraping IPO data...")
+        jobs.set_progress('[1/4] Scraping IPO data')
+        with metrics.span('stage', 'scrape') as stage:
+            scraper.run_scraper()
+        stages.append(stage)
+
+        # Step 2: Evaluate subscriptions
+        print("\n[2/4] Evaluating subscriptions...")
+        jobs.set_progress('[2/4] Evaluating subscriptions')
+        with metrics.span('stage', 'evaluate') as stage:
+            trader.run_evaluation(today)
+        stages.append(stage)
+
+        # Step 3: Execute trades
+        print("\n[3/4] Executing trades...")
+        jobs.set_progress('[3/4] Executing trades')
+        with metrics.span('stage', 'trade') as stage:
+            trader.run_trading(today)
+            # Trail the new positions' exits on live ticks (TICKER_ENABLED=on)
+            ticker.start(today)
+        stages.append(stage)
 
-    # Step 2: Evaluate subscriptions
-    print("\n[2/4] Evaluating subscriptions...")
-    trader.run_evaluation(today)
+    durations = ', '.join(f"{s.name} {s.ms:.0f}ms" for s in stages)
+    print(f"\n=== Daily job complete in {job.ms:.0f}ms ({durations}) ===")
+    db.log_run('DAILY_JOB', 'SUCCESS', f'Completed for {today} in {job.ms:.0f}ms ({durations})')
+    metrics.flush()
+
+# Market clock stages (see market_clock.py) - the daily job split up and run
+# at the right time of day instead of all at 9 AM
+
+def warm_up(day):
+    """Token, instruments and order tracker ready before the listing auction"""
+    if not token_manager.ensure_token():
+        print("⚠ Warning: no Kite token, trading may not work")
+    if db.get_pending_buys(day):
+        trader.init_kite()
+        trader.load_instruments()
+        trader.get_order_tracker()
+
+def scrape(day):
+    """Subscription snapshot during the bidding window"""
+    scraper.run_scraper()
 
-    # Step 3: Execute trades
-    print("\n[3/4] Executing trades...")
-    trader.run_trading(today)
+def evaluate(day):
+    """Final post-close scrape, then decisions for IPOs that closed today"""
+    # Not the 17:00 snapshot the cache may still hold: the final numbers
+    scraper.run_scraper(fresh=True)
+    trader.run_evaluation(day)
 
-    print("\n=== Daily job complete ===")
-    db.log_run('DAILY_JOB', 'SUCCESS', f'Completed for {today}')
+def trade(day):
+    """
+    Orders for IPOs listing today. Placed during the listing pre-open
+    auction they only fill when it matches, so wait for fills until trading
+    opens rather than the usual ORDER_FILL_TIMEOUT. Filled positions then
+    get trailing exits if the ticker is enabled.
+    """
+    listing_open = trading_calendar.at(date.fromisoformat(day), trading_calendar.LISTING_OPEN)
+    until_open = (listing_open - trading_calendar.now()).total_seconds()
+    fill_timeout = until_open + config.ORDER_FILL_TIMEOUT if until_open > 0 else None
+    trader.run_trading(day, fill_timeout)
+    ticker.start(day)
 
 if __name__ == '__main__':
     run_daily_job()
@@ -1,16 +1,87 @@
+import json
+import threading
+import time
 import requests
-from datetime import datetime, date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, date, timedelta
+from requests.adapters import HTTPAdapter
 import db
 import config
+import metrics
+import trading_calendar
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
     'Accept': 'application/json',
 }
 
-# NSE API endpoints
-NSE_IPO_LIST_URL = 'https://www.nseindia.com/api/ipo-current-issue'
-NSE_IPO_DETAIL_URL = 'https://www.nseindia.com/api/ipo-detail'
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Shared keep-alive session for NSE calls (one cookie handshake per process)"""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = HTTPAdapter(pool_connections=1,
+                                  pool_maxsize=max(config.NSE_FETCH_WORKERS, 1))
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+
+            # NSE sets its API cookies on the home page
+            try:
+                session.get(config.NSE_HOME_URL, timeout=10)
+            except requests.RequestException as e:
+                print(f"NSE cookie handshake failed: {e}")
+
+            _session = session
+        return _session
+
+def reset_session():
+    """Drop the shared session (e.g. after NSE rejects stale cookies)"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+def fetch_json(url, ttl):
+    """
+    GET a JSON payload through the on-disk response cache.
+    Entries younger than ttl seconds are served without a request; older ones
+    are revalidated with If-None-Match / If-Modified-Since when NSE sent
+    validators. Raises requests.HTTPError on non-2xx responses.
+    """
+    now = time.time()
+    cached = db.get_cached_response(url)
+
+    if cached and now - cached['fetched_at'] < ttl:
+        db.touch_cached_response(url, now)
+        return json.loads(cached['body'])
+
+    headers = {}
+    if cached and cached['etag']:
+        headers['If-None-Match'] = cached['etag']
+    if cached and cached['last_modified']:
+        headers['If-Modified-Since'] = cached['last_modified']
+
+    endpoint = url.split('?', 1)[0].rsplit('/', 1)[-1]
+    with metrics.span('http', endpoint):
+        resp = get_session().get(url, headers=headers, timeout=30)
+    metrics.incr('http_responses_total', endpoint=endpoint, status=resp.status_code)
+
+    if resp.status_code == 304 and cached:
+        db.touch_cached_response(url, now, revalidated=True)
+        return json.loads(cached['body'])
+
+    resp.raise_for_status()
+    data = resp.json()
+    db.save_cached_response(url, resp.text, resp.headers.get('ETag'),
+                            resp.headers.get('Last-Modified'), now)
+    return data
 
 def parse_nse_date(date_str):
     """Parse date from NSE format like '04-Feb-2026'"""
@@ -34,14 +105,16 @@ def parse_float(val):
     except ValueError:
         return 0.0
 
-def scrape_ipo_list():
-    """Scrape current IPO list from NSE API"""
-    print(f"Scraping IPO list from NSE API...")
+def parse_issue_size(val):
+    """NSE issueSize (Rs.) -> Rs. crore, None when missing"""
+    size = parse_float(val)
+    return size / 1e7 if size else None
 
-    resp = requests.get(NSE_IPO_LIST_URL, headers=HEADERS, timeout=30)
-    resp.raise_for_status()
+def scrape_ipo_list(fresh=False):
+    """Scrape current IPO list from NSE API (fresh: revalidate any cached copy)"""
+    print(f"Scraping IPO list from NSE API...")
 
-    data = resp.json()
+    data = fetch_json(config.NSE_IPO_LIST_URL, 0 if fresh else config.NSE_CACHE_TTL_LIST)
     ipos = []
 
     for item in data:
@@ -49,13 +122,22 @@ def scrape_ipo_list():
         # if item.get('series') == 'SME':
         #     continue
 
+        close_date = parse_nse_date(item.get('issueEndDate'))
+        # The list rarely carries a listing date; until it does, expect T+3
+        listing_date = parse_nse_date(item.get('listingDate'))
+        estimated = listing_date is None and close_date is not None
+        if estimated:
+            listing_date = trading_calendar.expected_listing_date(close_date).isoformat()
+
         ipo = {
             'company': item.get('companyName', ''),
             'symbol': item.get('symbol', ''),
             'open_date': parse_nse_date(item.get('issueStartDate')),
-            'close_date': parse_nse_date(item.get('issueEndDate')),
-            'listing_date': None,  # NSE API doesn't provide this in list
+            'close_date': close_date,
+            'listing_date': listing_date,
+            'listing_date_estimated': estimated,
             'issue_price': None,   # Need to get from detail
+            'issue_size': parse_issue_size(item.get('issueSize')),
             'status': item.get('status', ''),
             'series': item.get('series', ''),
             'subscription': parse_float(item.get('noOfTime', 0)),
@@ -67,17 +149,16 @@ def scrape_ipo_list():
 
     return ipos
 
-def scrape_subscription_detail(symbol):
+def scrape_subscription_detail(symbol, fresh=False):
     """Get detailed subscription status for an IPO from NSE"""
     print(f"  Getting subscription details for {symbol}...")
 
-    url = f"{NSE_IPO_DETAIL_URL}?symbol={symbol}"
-    resp = requests.get(url, headers=HEADERS, timeout=30)
-
-    if resp.status_code != 200:
+    url = f"{config.NSE_IPO_DETAIL_URL}?symbol={symbol}"
+    try:
+        data = fetch_json(url, 0 if fresh else config.NSE_CACHE_TTL_DETAIL)
+    except requests.HTTPError:
         return None
 
-    data = resp.json()
     bid_details = data.get('bidDetails', [])
 
     sub = {
@@ -105,79 +186,190 @@ def scrape_subscription_detail(symbol):
 
     return sub
 
-def scrape_subscription_status():
+def fetch_subscription_details(symbols, max_workers=None, fresh=False):
+    """
+    Fetch subscription details for many symbols over a bounded worker pool.
+    Returns (results, errors): dicts keyed by symbol. A failing symbol is
+    recorded in errors and never stops the rest of the batch.
+    """
+    if max_workers is None:
+        max_workers = config.NSE_FETCH_WORKERS
+    max_workers = max(1, min(max_workers, len(symbols) or 1))
+
+    results = {}
+    errors = {}
+
+    # Warm the session (and its cookies) before the workers share it
+    get_session()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(scrape_subscription_detail, s, fresh): s for s in symbols}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                detail = future.result()
+            except Exception as e:
+                errors[symbol] = str(e)
+                continue
+            if detail:
+                results[symbol] = detail
+            else:
+                errors[symbol] = 'No subscription data returned'
+
+    return results, errors
+
+def scrape_subscription_status(ipos=None, max_workers=None, fresh=False):
     """Get subscription status for all current IPOs"""
     print("Scraping subscription status from NSE API...")
 
-    ipos = scrape_ipo_list()
-    subscriptions = []
+    if ipos is None:
+        ipos = scrape_ipo_list(fresh)
+
+    symbols = list(dict.fromkeys(ipo['symbol'] for ipo in ipos if ipo.get('symbol')))
+    details, errors = fetch_subscription_details(symbols, max_workers, fresh)
 
+    subscriptions = []
     for ipo in ipos:
         symbol = ipo.get('symbol')
-        if not symbol:
+        detail = details.get(symbol)
+        if not detail:
             continue
 
-        detail = scrape_subscription_detail(symbol)
-        if detail:
-            sub = {
-                'company': ipo['company'],
-                'symbol': symbol,
-                'close_date': ipo['close_date'],
-                **detail
-            }
-            subscriptions.append(sub)
-            print(f"    QIB: {sub['qib']}x, NII: {sub['nii']}x, Retail: {sub['retail']}x")
+        sub = {
+            'company': ipo['company'],
+            'symbol': symbol,
+            'close_date': ipo['close_date'],
+            **detail
+        }
+        subscriptions.append(sub)
+        print(f"    {symbol} QIB: {sub['qib']}x, NII: {sub['nii']}x, Retail: {sub['retail']}x")
+
+    for symbol, err in errors.items():
+        print(f"    {symbol} failed: {err}")
 
-    return subscriptions
+    return subscriptions, errors
 
 def save_ipos(ipos):
     """Save scraped IPOs to database"""
-    for ipo in ipos:
-        db.upsert_ipo(
-            ipo['company'],
-            ipo['open_date'],
-            ipo['close_date'],
-            ipo['listing_date'],
-            ipo['issue_price']
-        )
+    db.upsert_ipos([
+        (ipo['company'], ipo['open_date'], ipo['close_date'],
+         ipo['listing_date'], ipo['issue_price'], ipo.get('symbol') or None,
+         int(ipo.get('listing_date_estimated', False)), ipo.get('issue_size'))
+        for ipo in ipos
+    ])
     print(f"Saved {len(ipos)} IPOs to database")
 
+def backfill_listing_dates(days=30):
+    """Estimate listing dates for IPOs closed in the last `days` days that have none"""
+    since = (date.today() - timedelta(days=days)).isoformat()
+    rows = db.get_ipos_without_listing_date(since)
+    db.set_estimated_listing_dates([
+        (trading_calendar.expected_listing_date(r['close_date']).isoformat(), r['id'])
+        for r in rows
+    ])
+    return len(rows)
+
 def save_subscriptions(subscriptions):
-    """Save scraped subscriptions to database"""
+    """Save scraped subscriptions to database (latest scrape wins)"""
     today = date.today().isoformat()
 
-    for sub in subscriptions:
-        close_date = sub.get('close_date') or today
-        existing = db.get_subscription(sub['company'], close_date)
-        if not existing:
-            db.save_subscription(
-                sub['company'],
-                close_date,
-                sub.get('qib', 0),
-                sub.get('snii', 0),
-                sub.get('bnii', 0),
-                sub.get('nii', 0),
-                sub.get('retail', 0)
-            )
+    db.upsert_subscriptions([
+        (sub['company'], sub.get('close_date') or today,
+         sub.get('qib', 0), sub.get('snii', 0), sub.get('bnii', 0),
+         sub.get('nii', 0), sub.get('retail', 0))
+        for sub in subscriptions
+    ])
     print(f"Saved {len(subscriptions)} subscriptions to database")
 
-def run_scraper():
-    """Main scraper entry point"""
+def save_snapshots(subscriptions, ts=None):
+    """Record a time-series snapshot per IPO; unchanged values are not stored"""
+    if ts is None:
+        ts = datetime.now().isoformat(timespec='seconds')
+    today = date.today().isoformat()
+
+    written = 0
+    for sub in subscriptions:
+        if db.save_subscription_snapshot(
+            sub['company'],
+            sub.get('close_date') or today,
+            ts,
+            *(sub.get(f, 0) for f in db.SNAPSHOT_FIELDS)
+        ):
+            written += 1
+    return written
+
+def is_open(ipo, today):
+    """True if the IPO is accepting bids on the given ISO date"""
+    if ipo.get('open_date') and ipo['open_date'] > today:
+        return False
+    if ipo.get('close_date') and ipo['close_date'] < today:
+        return False
+    return True
+
+def poll_subscriptions(interval=None, until=None):
+    """
+    Snapshot category-wise subscription of every open IPO every `interval`
+    seconds until the `until` time (HH:MM, IST) is reached.
+    """
+    if interval is None:
+        interval = config.SUBSCRIPTION_POLL_INTERVAL
+    if until is None:
+        until = config.SUBSCRIPTION_POLL_END
+
+    # IST, whatever the server's timezone (UTC on Railway)
+    end = trading_calendar.at(trading_calendar.today(), until)
+    print(f"Polling subscriptions every {interval}s until {until} IST")
+
+    while True:
+        started = time.monotonic()
+        today = trading_calendar.today().isoformat()
+        try:
+            ipos = [ipo for ipo in scrape_ipo_list() if is_open(ipo, today)]
+            subs, errors = scrape_subscription_status(ipos)
+            written = save_snapshots(subs)
+            print(f"Snapshot: {written}/{len(subs)} changed, {len(errors)} failed")
+        except Exception as e:
+            print(f"Error polling subscriptions: {e}")
+            db.log_run('POLL_SUB', 'FAILED', str(e))
+        metrics.flush()
+
+        remaining = (end - trading_calendar.now()).total_seconds()
+        if remaining <= 0:
+            break
+        time.sleep(max(0, min(interval - (time.monotonic() - started), remaining)))
+
+    db.log_run('POLL_SUB', 'SUCCESS', f'Polled subscriptions until {until}')
+
+def run_scraper(fresh=False):
+    """
+    Main scraper entry point. fresh bypasses the response cache TTLs (every
+    payload is requested or revalidated), e.g. for the final post-close scrape.
+    """
+    ipos = None
     try:
-        ipos = scrape_ipo_list()
+        ipos = scrape_ipo_list(fresh)
         save_ipos(ipos)
+        backfill_listing_dates()
         db.log_run('SCRAPE_IPO', 'SUCCESS', f'Scraped {len(ipos)} IPOs')
     except Exception as e:
         print(f"Error scraping IPO list: {e}")
         db.log_run('SCRAPE_IPO', 'FAILED', str(e))
 
     try:
-        subs = scrape_subscription_status()
+        subs, errors = scrape_subscription_status(ipos, fresh=fresh)
         save_subscriptions(subs)
-        db.log_run('SCRAPE_SUB', 'SUCCESS', f'Scraped {len(subs)} subscriptions')
+        save_snapshots(subs)
+        details = f'Scraped {len(subs)} subscriptions'
+        if errors:
+            details += f"; failed: {', '.join(sorted(errors))}"
+        db.log_run('SCRAPE_SUB', 'SUCCESS', details)
     except Exception as e:
         print(f"Error scraping subscriptions: {e}")
         db.log_run('SCRAPE_SUB', 'FAILED', str(e))
 
 if __name__ == '__main__':
-    run_scraper()
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'poll':
+        poll_subscriptions()
+    else:
+        run_scraper()
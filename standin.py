@@ -0,0 +1,714 @@
+"""
+Local stand-in for the NSE and Kite APIs
+
+Serves ipo-current-issue / ipo-detail and the Kite endpoints the trader
+uses (instruments, orders, GTT, session, LTP, and the login/TOTP flow) from
+the recorded payloads in fixtures/, with configurable latency distributions,
+error rates and rate limits per service. Point the app at it with:
+
+    NSE_BASE_URL=http://127.0.0.1:8765 KITE_API_ROOT=http://127.0.0.1:8765
+    KITE_LOGIN_ROOT=http://127.0.0.1:8765
+
+Latency specs (milliseconds): 'fixed:50', 'uniform:20,200' or
+'lognormal:80,0.6' (median, sigma).
+
+Usage:
+    python standin.py serve --nse-latency lognormal:120,0.5 --kite-error-rate 0.02
+    python standin.py load scrape --rounds 50
+    python standin.py load trade --trades 40 --kite-latency lognormal:60,0.4
+    python standin.py load daily --rounds 5 --url http://127.0.0.1:8765
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
+from flask import Flask, Response, request
+from werkzeug.serving import make_server
+from kite_client import TokenBucket
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def load_fixture(*parts):
+    with open(os.path.join(FIXTURES, *parts), encoding='utf-8') as f:
+        return f.read()
+
+def parse_latency(spec):
+    """'fixed:50' / 'uniform:20,200' / 'lognormal:80,0.6' -> function returning seconds"""
+    if not spec or spec in ('0', 'none'):
+        return lambda: 0.0
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',') if v.strip()]
+    if kind == 'fixed' and len(values) == 1:
+        return lambda: values[0] / 1000
+    if kind == 'uniform' and len(values) == 2:
+        return lambda: random.uniform(*values) / 1000
+    if kind == 'lognormal' and len(values) == 2:
+        median, sigma = values
+        return lambda: median * random.lognormvariate(0, sigma) / 1000
+    raise ValueError(f"Bad latency spec: {spec}")
+
+class Faults:
+    """Latency, error rate and per-endpoint-class rate limits for one service"""
+
+    def __init__(self, latency=None, error_rate=0.0, rates=None):
+        self.delay = parse_latency(latency)
+        self.error_rate = error_rate
+        self.buckets = {cls: TokenBucket(rate) for cls, rate in (rates or {}).items() if rate}
+
+    def check(self, endpoint_class):
+        """Sleep for the drawn latency; returns 'rate_limited', 'error' or None"""
+        time.sleep(self.delay())
+        bucket = self.buckets.get(endpoint_class)
+        if bucket and not bucket.try_acquire():
+            return 'rate_limited'
+        if self.error_rate and random.random() < self.error_rate:
+            return 'error'
+        return None
+
+def _upper_price(price_band):
+    """'Rs.412 to Rs.434' -> 434.0"""
+    prices = re.findall(r'[\d,]+(?:\.\d+)?', price_band or '')
+    return float(prices[-1].replace(',', '')) if prices else 100.0
+
+class Market:
+    """In-memory Kite account: orders fill after a delay, GTTs just sit there"""
+
+    TERMINAL = ('COMPLETE', 'REJECTED', 'CANCELLED')
+
+    def __init__(self, ipo_list, fill_delay=0.5, seed=None):
+        rng = random.Random(seed)
+        # Listing price per symbol: upper end of the price band plus a listing gain
+        self.prices = {i['symbol']: round(_upper_price(i.get('issuePrice')) * rng.uniform(0.9, 1.4), 2)
+                       for i in ipo_list}
+        self.fill_delay = fill_delay
+        self.instruments_csv = load_fixture('kite', 'instruments.csv')
+        self._lock = threading.Lock()
+        self._ids = itertools.count(250000000000001)
+        self.orders = {}
+        self.gtts = {}
+
+    def price(self, symbol):
+        return self.prices.get(symbol, 100.0)
+
+    def place_order(self, variety, params):
+        now = datetime.now()
+        order = {
+            'order_id': str(next(self._ids)),
+            'variety': variety,
+            'status': 'OPEN',
+            'exchange': params.get('exchange'),
+            'tradingsymbol': params.get('tradingsymbol'),
+            'transaction_type': params.get('transaction_type'),
+            'order_type': params.get('order_type'),
+            'product': params.get('product'),
+            'quantity': int(params.get('quantity') or 0),
+            'filled_quantity': 0,
+            'pending_quantity': int(params.get('quantity') or 0),
+            'price': float(params.get('price') or 0),
+            'trigger_price': float(params.get('trigger_price') or 0),
+            'average_price': 0.0,
+            'status_message': None,
+            'order_timestamp': now.strftime('%Y-%m-%d %H:%M:%S'),
+            '_placed': time.monotonic(),
+        }
+        if order['order_type'] == 'SL-M':
+            order['status'] = 'TRIGGER PENDING'
+        with self._lock:
+            self.orders[order['order_id']] = order
+        return order['order_id']
+
+    def _advance(self, order):
+        """Market orders complete once fill_delay has passed since placement"""
+        if (order['status'] == 'OPEN' and order['order_type'] == 'MARKET'
+                and time.monotonic() - order['_placed'] >= self.fill_delay):
+            order.update(status='COMPLETE', filled_quantity=order['quantity'],
+                         pending_quantity=0, average_price=self.price(order['tradingsymbol']))
+
+    def _public(self, order):
+        return {k: v for k, v in order.items() if not k.startswith('_')}
+
+    def list_orders(self):
+        with self._lock:
+            for order in self.orders.values():
+                self._advance(order)
+            return [self._public(o) for o in self.orders.values()]
+
+    def order_history(self, order_id):
+        with self._lock:
+            order = self.orders.get(order_id)
+            if not order:
+                return None
+            self._advance(order)
+            history = [{**self._public(order), 'status': 'OPEN', 'average_price': 0.0}]
+            if order['status'] != 'OPEN':
+                history.append(self._public(order))
+            return history
+
+    def modify_order(self, order_id, params):
+        with self._lock:
+            order = self.orders.get(order_id)
+            if not order or order['status'] in self.TERMINAL:
+                return None
+            for key in ('price', 'trigger_price'):
+                if params.get(key):
+                    order[key] = float(params[key])
+            if params.get('quantity'):
+                order['quantity'] = order['pending_quantity'] = int(params['quantity'])
+            return order_id
+
+    def cancel_order(self, order_id):
+        with self._lock:
+            order = self.orders.get(order_id)
+            if not order or order['status'] in self.TERMINAL:
+                return None
+            order['status'] = 'CANCELLED'
+            return order_id
+
+    def place_gtt(self, params):
+        trigger_id = next(self._ids)
+        condition = json.loads(params.get('condition') or '{}')
+        with self._lock:
+            self.gtts[trigger_id] = {
+                'id': trigger_id,
+                'type': params.get('type'),
+                'status': 'active',
+                'condition': condition,
+                'orders': json.loads(params.get('orders') or '[]'),
+                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            }
+        return trigger_id
+
+def create_app(nse_faults=None, kite_faults=None, close_today=True, fill_delay=0.5, seed=None,
+               redirect_url='http://localhost:5001/kite-callback', totp_key=None):
+    """
+    Build the stand-in Flask app (NSE under /, /api/ipo-*; Kite under its own
+    paths). With totp_key set, the login flow checks TOTP codes against it.
+    """
+    nse_faults = nse_faults or Faults()
+    kite_faults = kite_faults or Faults()
+
+    ipo_list = json.loads(load_fixture('nse', 'ipo-current-issue.json'))
+    if close_today:
+        today = date.today().strftime('%d-%b-%Y')
+        for item in ipo_list:
+            item['issueEndDate'] = today
+    details = json.loads(load_fixture('nse', 'ipo-detail.json'))
+    list_body = json.dumps(ipo_list)
+    list_etag = '"%s"' % hashlib.md5(list_body.encode()).hexdigest()
+
+    market = Market(ipo_list, fill_delay, seed)
+    stats = {}
+    stats_lock = threading.Lock()
+
+    app = Flask(__name__)
+    app.config['market'] = market
+    app.config['stats'] = stats
+
+    def record(route, status):
+        with stats_lock:
+            entry = stats.setdefault(route, {})
+            entry[status] = entry.get(status, 0) + 1
+
+    # NSE
+
+    def nse(route, endpoint_class='nse'):
+        fault = nse_faults.check(endpoint_class)
+        if fault == 'rate_limited':
+            record(route, 429)
+            return Response('Too Many Requests', 429)
+        if fault == 'error':
+            record(route, 503)
+            return Response('<html>Service Unavailable</html>', 503, mimetype='text/html')
+        return None
+
+    @app.route('/')
+    def nse_home():
+        failed = nse('home')
+        if failed:
+            return failed
+        record('home', 200)
+        resp = Response('<html>NSE stand-in</html>', mimetype='text/html')
+        resp.set_cookie('nsit', 'standin')
+        resp.set_cookie('nseappid', 'standin')
+        return resp
+
+    @app.route('/api/ipo-current-issue')
+    def nse_ipo_list():
+        failed = nse('ipo-current-issue')
+        if failed:
+            return failed
+        if request.headers.get('If-None-Match') == list_etag:
+            record('ipo-current-issue', 304)
+            return Response(status=304)
+        record('ipo-current-issue', 200)
+        return Response(list_body, mimetype='application/json', headers={'ETag': list_etag})
+
+    @app.route('/api/ipo-detail')
+    def nse_ipo_detail():
+        failed = nse('ipo-detail')
+        if failed:
+            return failed
+        detail = details.get(request.args.get('symbol', ''))
+        if detail is None:
+            record('ipo-detail', 404)
+            return Response('{}', 404, mimetype='application/json')
+        record('ipo-detail', 200)
+        return Response(json.dumps(detail), mimetype='application/json')
+
+    # Kite
+
+    def ok(route, data):
+        record(route, 200)
+        return {'status': 'success', 'data': data}
+
+    def kite_error(route, status, error_type, message):
+        record(route, status)
+        return {'status': 'error', 'error_type': error_type, 'message': message, 'data': None}, status
+
+    def kite(route, endpoint_class, needs_token=True):
+        fault = kite_faults.check(endpoint_class)
+        if fault == 'rate_limited':
+            return kite_error(route, 429, 'NetworkException', 'Too many requests')
+        if fault == 'error':
+            return kite_error(route, 503, 'NetworkException', 'Gateway timed out')
+        if needs_token and not request.headers.get('Authorization', '').startswith('token '):
+            return kite_error(route, 403, 'TokenException', 'Incorrect `api_key` or `access_token`.')
+        return None
+
+    # Kite login (what kite_auto_login's HTTP mode drives)
+
+    logins = {}  # sess_id -> {'request_id', 'user_id', 'authed'}
+
+    def login_error(route, status, message):
+        return kite_error(route, status, 'TwoFAException' if route == 'twofa' else 'InputException', message)
+
+    @app.route('/connect/login')
+    def kite_connect_login():
+        sess = logins.get(request.cookies.get('kf_session', ''))
+        if sess and sess['authed']:
+            record('connect_login', 302)
+            return Response(status=302, headers={
+                'Location': f"/connect/finish?api_key={request.args.get('api_key', '')}&sess_id={sess['request_id']}"})
+        sess_id = f"sess{next(market._ids)}"
+        logins[sess_id] = {'request_id': None, 'user_id': None, 'authed': False}
+        record('connect_login', 200)
+        resp = Response('<html>Kite login stand-in</html>', mimetype='text/html')
+        resp.set_cookie('kf_session', sess_id)
+        return resp
+
+    @app.route('/connect/finish')
+    def kite_connect_finish():
+        sess = logins.get(request.cookies.get('kf_session', ''))
+        if not sess or not sess['authed']:
+            record('connect_finish', 403)
+            return Response('Not logged in', 403)
+        record('connect_finish', 302)
+        sep = '&' if '?' in redirect_url else '?'
+        return Response(status=302, headers={
+            'Location': f"{redirect_url}{sep}action=login&type=login&status=success"
+                        f"&request_token=rt{next(market._ids)}"})
+
+    @app.route('/api/login', methods=['POST'])
+    def kite_api_login():
+        failed = kite('login', 'other', needs_token=False)
+        if failed:
+            return failed
+        sess = logins.get(request.cookies.get('kf_session', ''))
+        if sess is None:
+            return login_error('login', 400, 'Login session expired. Open the login page again.')
+        if not request.form.get('user_id') or not request.form.get('password'):
+            return login_error('login', 400, 'Invalid `user_id` or `password`.')
+        sess['user_id'] = request.form['user_id']
+        sess['request_id'] = f"req{next(market._ids)}"
+        return ok('login', {'user_id': sess['user_id'], 'request_id': sess['request_id'],
+                            'twofa_type': 'totp', 'twofa_types': ['totp']})
+
+    @app.route('/api/twofa', methods=['POST'])
+    def kite_api_twofa():
+        failed = kite('twofa', 'other', needs_token=False)
+        if failed:
+            return failed
+        sess = logins.get(request.cookies.get('kf_session', ''))
+        if sess is None or sess['request_id'] != request.form.get('request_id'):
+            return login_error('twofa', 400, 'Invalid `request_id`.')
+        code = request.form.get('twofa_value', '')
+        if totp_key:
+            import pyotp
+            valid = pyotp.TOTP(totp_key).verify(code, valid_window=1)
+        else:
+            valid = len(code) == 6 and code.isdigit()
+        if not valid:
+            return login_error('twofa', 400, 'Invalid TOTP.')
+        sess['authed'] = True
+        return ok('twofa', {'profile': {}})
+
+    @app.route('/session/token', methods=['POST'])
+    def kite_session():
+        failed = kite('session', 'other', needs_token=False)
+        if failed:
+            return failed
+        return ok('session', {
+            'user_id': 'ST0001', 'user_name': 'Stand-in', 'api_key': request.form.get('api_key'),
+            'access_token': f"standin-{next(market._ids)}", 'public_token': 'standin',
+            'login_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        })
+
+    @app.route('/user/profile')
+    def kite_profile():
+        failed = kite('profile', 'other')
+        if failed:
+            return failed
+        return ok('profile', {'user_id': 'ST0001', 'user_name': 'Stand-in', 'exchanges': ['NSE', 'BSE']})
+
+    @app.route('/instruments')
+    @app.route('/instruments/<exchange>')
+    def kite_instruments(exchange=None):
+        failed = kite('instruments', 'other')
+        if failed:
+            return failed
+        lines = market.instruments_csv.splitlines()
+        rows = [l for l in lines[1:] if exchange is None or l.endswith(f',{exchange}')]
+        record('instruments', 200)
+        return Response('\n'.join([lines[0]] + rows) + '\n', mimetype='text/csv')
+
+    @app.route('/quote/ltp')
+    def kite_ltp():
+        failed = kite('ltp', 'quote')
+        if failed:
+            return failed
+        return ok('ltp', {key: {'instrument_token': 0, 'last_price': market.price(key.split(':')[-1])}
+                          for key in request.args.getlist('i')})
+
+    @app.route('/orders/<variety>', methods=['POST'])
+    def kite_place_order(variety):
+        failed = kite('place_order', 'order')
+        if failed:
+            return failed
+        return ok('place_order', {'order_id': market.place_order(variety, request.form)})
+
+    @app.route('/orders')
+    def kite_orders():
+        failed = kite('orders', 'other')
+        if failed:
+            return failed
+        return ok('orders', market.list_orders())
+
+    @app.route('/orders/<order_id>')
+    def kite_order_history(order_id):
+        failed = kite('order_history', 'other')
+        if failed:
+            return failed
+        history = market.order_history(order_id)
+        if history is None:
+            return kite_error('order_history', 400, 'InputException', "Couldn't find that order.")
+        return ok('order_history', history)
+
+    @app.route('/orders/<variety>/<order_id>', methods=['PUT', 'DELETE'])
+    def kite_modify_order(variety, order_id):
+        route = 'modify_order' if request.method == 'PUT' else 'cancel_order'
+        failed = kite(route, 'order')
+        if failed:
+            return failed
+        if request.method == 'PUT':
+            result = market.modify_order(order_id, request.form)
+        else:
+            result = market.cancel_order(order_id)
+        if result is None:
+            return kite_error(route, 400, 'InputException', 'Order cannot be modified or cancelled.')
+        return ok(route, {'order_id': result})
+
+    @app.route('/gtt/triggers', methods=['GET', 'POST'])
+    def kite_gtts():
+        if request.method == 'GET':
+            failed = kite('get_gtts', 'other')
+            return failed or ok('get_gtts', list(market.gtts.values()))
+        failed = kite('place_gtt', 'order')
+        if failed:
+            return failed
+        return ok('place_gtt', {'trigger_id': market.place_gtt(request.form)})
+
+    @app.route('/gtt/triggers/<int:trigger_id>', methods=['GET', 'PUT', 'DELETE'])
+    def kite_gtt(trigger_id):
+        route = {'GET': 'get_gtt', 'PUT': 'modify_gtt', 'DELETE': 'delete_gtt'}[request.method]
+        failed = kite(route, 'other' if request.method == 'GET' else 'order')
+        if failed:
+            return failed
+        gtt = market.gtts.get(trigger_id)
+        if gtt is None:
+            return kite_error(route, 404, 'InputException', 'Trigger not found.')
+        if request.method == 'PUT':
+            gtt['condition'] = json.loads(request.form.get('condition') or '{}')
+            gtt['orders'] = json.loads(request.form.get('orders') or '[]')
+        elif request.method == 'DELETE':
+            gtt['status'] = 'deleted'
+        return ok(route, gtt if request.method == 'GET' else {'trigger_id': trigger_id})
+
+    # Stand-in control
+
+    @app.route('/__standin/stats')
+    def standin_stats():
+        with stats_lock:
+            return {route: dict(counts) for route, counts in stats.items()}
+
+    @app.route('/__standin/reset', methods=['POST'])
+    def standin_reset():
+        with stats_lock:
+            stats.clear()
+        with market._lock:
+            market.orders.clear()
+            market.gtts.clear()
+        return {'status': 'ok'}
+
+    return app
+
+class StandinServer:
+    """Run the stand-in on a background thread (port 0 = any free port)"""
+
+    def __init__(self, app, host='127.0.0.1', port=0):
+        self.app = app
+        self._server = make_server(host, port, app, threaded=True)
+        self.url = f'http://{host}:{self._server.server_port}'
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True,
+                                         name='standin')
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+
+def use_standin(url):
+    """Repoint this process's NSE and Kite clients at a stand-in URL"""
+    import config
+    import scraper
+
+    url = url.rstrip('/')
+    config.NSE_BASE_URL = config.NSE_HOME_URL = url
+    config.NSE_IPO_LIST_URL = f'{url}/api/ipo-current-issue'
+    config.NSE_IPO_DETAIL_URL = f'{url}/api/ipo-detail'
+    config.KITE_API_ROOT = config.KITE_LOGIN_ROOT = url
+    config.KITE_API_KEY = config.KITE_API_KEY or 'standin'
+    config.KITE_ACCESS_TOKEN = config.KITE_ACCESS_TOKEN or 'standin'
+    scraper.reset_session()
+
+# Load testing
+
+def _percentiles(samples_ms):
+    if not samples_ms:
+        return {}
+    ordered = sorted(samples_ms)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 1)
+    return {'count': len(ordered), 'p50': pct(50), 'p90': pct(90), 'p99': pct(99),
+            'max': round(ordered[-1], 1), 'mean': round(statistics.fmean(ordered), 1)}
+
+def _timed_calls(module, name, samples):
+    """Patch module.name to append (ms, result) for every call"""
+    func = getattr(module, name)
+
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        finally:
+            samples.append(((time.perf_counter() - started) * 1000, result))
+    return mock.patch.object(module, name, wrapper)
+
+def _seed_trades(n, ipo_list):
+    """n pending BUYs listing today, cycling through the fixture symbols"""
+    import db
+
+    today = date.today().isoformat()
+    earlier = (date.today() - timedelta(days=5)).isoformat()
+    rows = []
+    for i in range(n):
+        item = ipo_list[i % len(ipo_list)]
+        company = f"{item['companyName']} #{i}"
+        rows.append((company, None, earlier, today, _upper_price(item.get('issuePrice')), item['symbol']))
+        db.save_decision(earlier, company, 'BUY', 'seeded for load test')
+    db.upsert_ipos(rows)
+
+def load_scrape(rounds):
+    """Full ipo-current-issue + ipo-detail fan-out per round, no response caching"""
+    import config
+    import scraper
+
+    calls, totals = [], []
+    with _timed_calls(scraper, 'scrape_subscription_detail', calls), \
+            mock.patch.object(config, 'NSE_CACHE_TTL_LIST', 0), \
+            mock.patch.object(config, 'NSE_CACHE_TTL_DETAIL', 0):
+        for _ in range(rounds):
+            started = time.perf_counter()
+            try:
+                scraper.scrape_subscription_status()
+            except Exception as e:
+                print(f"Round failed: {e}")
+            totals.append((time.perf_counter() - started) * 1000)
+
+    failed = sum(1 for _, result in calls if result is None)
+    elapsed = sum(totals) / 1000
+    return {
+        'rounds': _percentiles(totals),
+        'ipo_detail': _percentiles([ms for ms, _ in calls]),
+        'detail_failures': failed,
+        'throughput_per_s': round(len(calls) / elapsed, 1) if elapsed else 0.0,
+    }
+
+def load_trade(trades):
+    """run_trading over `trades` pending BUYs; per-trade latency and outcome"""
+    import trader
+
+    ipo_list = json.loads(load_fixture('nse', 'ipo-current-issue.json'))
+    _seed_trades(trades, ipo_list)
+
+    calls = []
+    started = time.perf_counter()
+    with _timed_calls(trader, '_run_trade', calls):
+        trader.run_trading()
+    elapsed = time.perf_counter() - started
+
+    outcomes = {}
+    steps = {}
+    for _, result in calls:
+        outcomes[result['outcome']] = outcomes.get(result['outcome'], 0) + 1
+        for step, ms in result['timings'].items():
+            steps.setdefault(step, []).append(ms)
+    return {
+        'trades': _percentiles([ms for ms, _ in calls]),
+        'steps': {step: _percentiles(v) for step, v in steps.items()},
+        'outcomes': outcomes,
+        'throughput_per_s': round(len(calls) / elapsed, 2) if elapsed else 0.0,
+        'kite_calls': trader.get_api_metrics(),
+    }
+
+def load_daily(rounds):
+    """scheduler.run_daily_job end to end, with a few pending BUYs each round"""
+    import scheduler
+    import token_manager
+
+    ipo_list = json.loads(load_fixture('nse', 'ipo-current-issue.json'))
+    # A current token keeps the token check from starting a login
+    token_manager.set_token('standin')
+
+    totals = []
+    for _ in range(rounds):
+        _seed_trades(4, ipo_list)
+        started = time.perf_counter()
+        scheduler.run_daily_job()
+        totals.append((time.perf_counter() - started) * 1000)
+    return {'daily_job': _percentiles(totals)}
+
+def run_load(args):
+    import config
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    workdir = tempfile.mkdtemp(prefix='ipo-standin-')
+    # Before the first `import db`, which initializes the database it points at
+    config.DB_PATH = os.path.join(workdir, 'ipo.db')
+    import db
+    db.init_db()
+
+    with contextlib.ExitStack() as stack:
+        if args.url:
+            url = args.url
+        else:
+            app = create_app(_faults(args, 'nse'), _faults(args, 'kite'),
+                             fill_delay=args.fill_delay, seed=args.seed)
+            url = stack.enter_context(StandinServer(app)).url
+        use_standin(url)
+        print(f"Load test '{args.path}' against {url}")
+
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            if args.path == 'scrape':
+                result = load_scrape(args.rounds)
+            elif args.path == 'trade':
+                result = load_trade(args.trades)
+            else:
+                result = load_daily(args.rounds)
+
+        import requests
+        try:
+            result['server'] = requests.get(f'{url}/__standin/stats', timeout=5).json()
+        except requests.RequestException:
+            pass
+
+    print(json.dumps(result, indent=2, default=str))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'path': args.path, 'created_at': datetime.now().isoformat(timespec='seconds'),
+                       'result': result}, f, indent=2, default=str)
+        print(f"Saved {args.output}")
+
+def _faults(args, service):
+    if service == 'nse':
+        return Faults(args.nse_latency, args.nse_error_rate, {'nse': args.nse_rate})
+    return Faults(args.kite_latency, args.kite_error_rate, {
+        'order': args.kite_order_rate, 'quote': args.kite_quote_rate, 'other': args.kite_other_rate,
+    })
+
+def _add_fault_args(parser):
+    parser.add_argument('--nse-latency', default='none', help="e.g. 'lognormal:120,0.5'")
+    parser.add_argument('--nse-error-rate', type=float, default=0.0, help='fraction of NSE calls failing with 503')
+    parser.add_argument('--nse-rate', type=float, default=0, help='NSE requests/second before 429s (0 = unlimited)')
+    parser.add_argument('--kite-latency', default='none', help="e.g. 'lognormal:60,0.4'")
+    parser.add_argument('--kite-error-rate', type=float, default=0.0, help='fraction of Kite calls failing with 503')
+    parser.add_argument('--kite-order-rate', type=float, default=10, help='Kite order calls/second before 429s')
+    parser.add_argument('--kite-quote-rate', type=float, default=1, help='Kite quote calls/second before 429s')
+    parser.add_argument('--kite-other-rate', type=float, default=10, help='other Kite calls/second before 429s')
+    parser.add_argument('--fill-delay', type=float, default=0.5, help='seconds until a MARKET order completes')
+    parser.add_argument('--seed', type=int, default=None)
+
+def main():
+    parser = argparse.ArgumentParser(description='Local NSE + Kite stand-in server')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve = sub.add_parser('serve', help='run the stand-in server')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--keep-dates', action='store_true',
+                       help="serve the fixture close dates instead of today's")
+    serve.add_argument('--redirect-url', default='http://localhost:5001/kite-callback',
+                       help='where a completed login redirects with the request_token')
+    serve.add_argument('--totp-key', help='check login TOTP codes against this secret')
+    _add_fault_args(serve)
+
+    load = sub.add_parser('load', help='load-test a pipeline path against the stand-in')
+    load.add_argument('path', choices=('scrape', 'trade', 'daily'))
+    load.add_argument('--url', help='use a running stand-in instead of starting one')
+    load.add_argument('--rounds', type=int, default=20, help='scrape/daily rounds')
+    load.add_argument('--trades', type=int, default=20, help='pending BUYs for the trade path')
+    load.add_argument('--output', help='save results as JSON')
+    _add_fault_args(load)
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        app = create_app(_faults(args, 'nse'), _faults(args, 'kite'),
+                         close_today=not args.keep_dates, fill_delay=args.fill_delay, seed=args.seed,
+                         redirect_url=args.redirect_url, totp_key=args.totp_key)
+        server = make_server(args.host, args.port, app, threaded=True)
+        print(f"Stand-in listening on http://{args.host}:{args.port}")
+        print(f"  NSE_BASE_URL=http://{args.host}:{args.port} KITE_API_ROOT=http://{args.host}:{args.port}"
+              f" KITE_LOGIN_ROOT=http://{args.host}:{args.port}")
+        server.serve_forever()
+    else:
+        run_load(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,703 @@
+"""
+Live ticks and trailing exits for listing-day positions
+A KiteTicker websocket subscribed (full mode, with market depth) to just the
+instruments bought today. Frames are not run through KiteTicker's dict
+parser: each packet is copied as raw bytes into a preallocated per-instrument
+ring buffer (TICK_BUFFER_SIZE ticks, read back through a numpy structured
+view) and only its token and last price are unpacked. So the tick path
+builds no dicts, lists or datetimes: a couple of microseconds per full-depth
+tick, where KiteTicker's own parser takes tens.
+
+When a position makes a new high, the trailing manager moves its SL up to
+TRAIL_STOP_PERCENT below it (and, with TRAIL_TARGET_PERCENT, keeps the
+target that far above it). The exit orders are modified on a separate
+thread, at most every TRAIL_MODIFY_INTERVAL seconds per position and only
+for moves of TRAIL_MIN_STEP_PERCENT or more, so a burst of ticks becomes one
+modification with the latest levels.
+
+Frames can be recorded (TICK_RECORD_DIR) and replayed through the same path,
+or synthesized, to exercise the whole thing offline.
+
+Usage:
+    python ticker.py status
+    python ticker.py run [--date 2026-03-04]
+    python ticker.py synth ticks.bin --symbols AMBERLEAF --seconds 600 --drift 0.0004
+    python ticker.py replay ticks.bin [--speed 0] [--standin]
+"""
+import argparse
+import json
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+from datetime import date
+import numpy as np
+import config
+import db
+import metrics
+import token_manager
+import trader
+import trading_calendar as cal
+
+# Kite full-mode packet for an exchange instrument (prices in paise)
+_DEPTH = np.dtype([('quantity', '>u4'), ('price', '>i4'), ('orders', '>u2'), ('pad', '>u2')])
+TICK = np.dtype([
+    ('instrument_token', '>u4'), ('last_price', '>i4'), ('last_traded_quantity', '>u4'),
+    ('average_traded_price', '>i4'), ('volume_traded', '>u4'), ('total_buy_quantity', '>u4'),
+    ('total_sell_quantity', '>u4'), ('open', '>i4'), ('high', '>i4'), ('low', '>i4'),
+    ('close', '>i4'), ('last_trade_time', '>u4'), ('oi', '>u4'), ('oi_day_high', '>u4'),
+    ('oi_day_low', '>u4'), ('exchange_timestamp', '>u4'), ('depth', _DEPTH, (10,)),
+])
+TICK_SIZE = TICK.itemsize    # 184 bytes; LTP (8) and quote (44) packets are prefixes of it
+
+_COUNT = struct.Struct('>H')           # packets in a frame
+_PACKET = struct.Struct('>HIi')        # packet length, instrument token, last price
+_FULL = struct.Struct('>IiIiIIIiiiiIIIII' + 'IiHH' * 10)
+_RECORD = struct.Struct('>dI')         # recording: receive time, frame length
+_ZEROS = bytes(TICK_SIZE)
+
+MAX_FAILURES = 3     # consecutive rejected modifications before a position is left alone
+
+def price_divisor(token):
+    """Kite sends prices as integers: paise, except currency segments"""
+    segment = token & 0xff
+    if segment == 3:          # cds
+        return 10000000.0
+    if segment == 6:          # bcd
+        return 10000.0
+    return 100.0
+
+class TickRing:
+    """The last `size` ticks of one instrument, in a fixed preallocated buffer"""
+
+    def __init__(self, token, size=None):
+        self.token = token
+        self.size = size or config.TICK_BUFFER_SIZE
+        self.divisor = price_divisor(token)
+        self.ticks = np.zeros(self.size, dtype=TICK)
+        self.received = np.zeros(self.size)
+        self.count = 0
+        self._bytes = memoryview(self.ticks).cast('B')
+
+    def push(self, packet, length, received):
+        """Copy one raw packet into the next slot (overwriting the oldest)"""
+        i = self.count % self.size
+        start = i * TICK_SIZE
+        if length >= TICK_SIZE:
+            self._bytes[start:start + TICK_SIZE] = packet[:TICK_SIZE]
+        else:
+            self._bytes[start:start + length] = packet
+            self._bytes[start + length:start + TICK_SIZE] = _ZEROS[length:]
+        self.received[i] = received
+        self.count += 1
+
+    def _index(self, n=None):
+        held = min(self.count, self.size)
+        n = held if n is None else min(n, held)
+        return (self.count - n + np.arange(n)) % self.size
+
+    def latest(self, n=None):
+        """The last n ticks (default all held), oldest first, as a copy"""
+        return self.ticks[self._index(n)]
+
+    def prices(self, n=None):
+        return self.latest(n)['last_price'] / self.divisor
+
+    def last(self):
+        """The newest tick as a plain dict, or None"""
+        if not self.count:
+            return None
+        i = (self.count - 1) % self.size
+        tick = self.ticks[i]
+        depth = tick['depth']
+        return {
+            'instrument_token': int(tick['instrument_token']),
+            'last_price': int(tick['last_price']) / self.divisor,
+            'volume_traded': int(tick['volume_traded']),
+            'bid': int(depth[0]['price']) / self.divisor,
+            'ask': int(depth[5]['price']) / self.divisor,
+            'exchange_timestamp': int(tick['exchange_timestamp']) or None,
+            'received': float(self.received[i]),
+            'ticks': self.count,
+        }
+
+class Position:
+    """
+    An open position's exit levels. Prices are integers in the instrument's
+    price unit (paise), like the ticks. sl/target are where the trailing
+    manager wants the exits; live_sl/live_target are what Kite last accepted.
+    """
+    __slots__ = ('decision_id', 'symbol', 'token', 'quantity', 'exit_order_id', 'divisor',
+                 'tick', 'step', 'keep', 'lift', 'entry', 'high', 'last', 'sl', 'target',
+                 'live_sl', 'live_target', 'active', 'closed', 'modifications', 'failures',
+                 'next_modify')
+
+    def __init__(self, decision_id, symbol, token, quantity, entry, sl, target,
+                 exit_order_id, tick_size=None):
+        self.decision_id = decision_id
+        self.symbol = symbol
+        self.token = token
+        self.quantity = quantity
+        self.exit_order_id = exit_order_id
+        self.divisor = price_divisor(token)
+        self.tick = max(1, round((tick_size or 0.05) * self.divisor))
+        self.entry = self.high = self.last = round(entry * self.divisor)
+        self.sl = self.live_sl = round(sl * self.divisor)
+        self.target = self.live_target = round(target * self.divisor)
+        self.step = max(self.tick, round(self.entry * config.TRAIL_MIN_STEP_PERCENT / 100))
+        self.keep = 1 - config.TRAIL_STOP_PERCENT / 100
+        self.lift = 1 + config.TRAIL_TARGET_PERCENT / 100 if config.TRAIL_TARGET_PERCENT > 0 else None
+        self.active = True
+        self.closed = None
+        self.modifications = 0
+        self.failures = 0
+        self.next_modify = 0.0
+
+    def pending(self):
+        return (self.active and self.modifications < config.TRAIL_MAX_MODIFICATIONS
+                and (self.sl != self.live_sl or self.target != self.live_target))
+
+    def to_dict(self):
+        d = self.divisor
+        return {
+            'symbol': self.symbol, 'instrument_token': self.token,
+            'decision_id': self.decision_id, 'exit_order_id': self.exit_order_id,
+            'entry': self.entry / d, 'high': self.high / d, 'last': self.last / d,
+            'stop_loss': self.live_sl / d, 'target': self.live_target / d,
+            'pending_stop_loss': self.sl / d if self.sl != self.live_sl else None,
+            'pending_target': self.target / d if self.target != self.live_target else None,
+            'active': self.active, 'closed': self.closed,
+            'modifications': self.modifications,
+        }
+
+class TickEngine:
+    """
+    Tick rings plus the trailing manager. on_frame runs on the websocket
+    thread; exit modifications run on the engine's own modifier thread.
+    """
+
+    def __init__(self, size=None, modify_exit=None, recorder=None):
+        self.size = size or config.TICK_BUFFER_SIZE
+        self.modify_exit = modify_exit or trader.modify_exit_orders
+        self.recorder = recorder
+        self.rings = {}          # token -> TickRing
+        self.positions = {}      # token -> Position
+        self.frames = 0
+        self.ticks = 0
+        self.busy = 0.0          # seconds spent in on_frame
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._modifier = None
+
+    def watch(self, token):
+        if token not in self.rings:
+            self.rings[token] = TickRing(token, self.size)
+        return self.rings[token]
+
+    def add_position(self, position):
+        self.watch(position.token)
+        self.positions[position.token] = position
+
+    def tokens(self):
+        return list(self.rings)
+
+    def on_frame(self, payload, received=None):
+        """One binary websocket frame: packets into their rings, then the trailing check"""
+        if len(payload) < 4:
+            return    # 1-byte heartbeat
+        started = time.perf_counter()
+        if received is None:
+            received = time.time()
+        if self.recorder:
+            self.recorder.write(payload, received)
+
+        src = memoryview(payload)
+        rings, positions = self.rings, self.positions
+        count, = _COUNT.unpack_from(payload, 0)
+        pos = 2
+        for _ in range(count):
+            length, token, ltp = _PACKET.unpack_from(payload, pos)
+            pos += 2
+            ring = rings.get(token)
+            if ring is not None:
+                ring.push(src[pos:pos + length], length, received)
+                position = positions.get(token)
+                if position is not None and position.active:
+                    position.last = ltp
+                    if ltp > position.high:
+                        self._new_high(position, ltp)
+                    if ltp <= position.live_sl or ltp >= position.live_target:
+                        self._crossed(position, ltp)
+            pos += length
+
+        self.frames += 1
+        self.ticks += count
+        self.busy += time.perf_counter() - started
+
+    def _new_high(self, p, ltp):
+        """Ratchet the wanted SL (and target) up behind a new high"""
+        p.high = ltp
+        moved = False
+        sl = int(ltp * p.keep) // p.tick * p.tick
+        if sl >= p.sl + p.step:
+            p.sl = sl
+            moved = True
+        if p.lift:
+            target = -(-int(ltp * p.lift) // p.tick) * p.tick
+            if target >= p.target + p.step:
+                p.target = target
+                moved = True
+        if moved:
+            self._wake.set()
+
+    def _crossed(self, p, ltp):
+        """The price went through a live exit level: assume it filled and stop trailing"""
+        p.active = False
+        p.closed = 'stop_loss' if ltp <= p.live_sl else 'target'
+        self._wake.set()
+
+    # Modifier thread
+
+    def start(self):
+        if self._modifier is None or not self._modifier.is_alive():
+            self._stop.clear()
+            self._modifier = threading.Thread(target=self._run, daemon=True, name='ticker-exits')
+            self._modifier.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
+
+    def _run(self):
+        wait = None
+        reported = set()
+        while not self._stop.is_set():
+            self._wake.wait(wait)
+            self._wake.clear()
+            wait = None
+            for p in list(self.positions.values()):
+                if p.closed and p.token not in reported:
+                    reported.add(p.token)
+                    print(f"[ticker] {p.symbol}: {p.last / p.divisor} crossed the {p.closed}, "
+                          f"no longer trailing")
+                if not p.pending():
+                    continue
+                left = p.next_modify - time.monotonic()
+                if left > 0:
+                    wait = left if wait is None else min(wait, left)
+                    continue
+                self._modify(p)
+                if p.pending():
+                    wait = config.TRAIL_MODIFY_INTERVAL if wait is None else min(wait, config.TRAIL_MODIFY_INTERVAL)
+
+    def _modify(self, p):
+        sl, target, d = p.sl, p.target, p.divisor
+        sl_moved, target_moved = sl != p.live_sl, target != p.live_target
+        with metrics.span('ticker', 'modify_exit'):
+            ok = self.modify_exit(p.exit_order_id, p.symbol, p.quantity, p.last / d,
+                                  sl / d, target / d, sl_moved, target_moved)
+        p.next_modify = time.monotonic() + config.TRAIL_MODIFY_INTERVAL
+        metrics.incr('exit_modifications_total', outcome='ok' if ok else 'error')
+        if not ok:
+            p.failures += 1
+            if p.failures >= MAX_FAILURES:
+                p.active = False
+                print(f"[ticker] {p.symbol}: {p.failures} modifications rejected, no longer trailing")
+            return
+
+        moves = []
+        if sl_moved:
+            moves.append(f"SL {p.live_sl / d} -> {sl / d}")
+        if target_moved:
+            moves.append(f"target {p.live_target / d} -> {target / d}")
+        print(f"[ticker] {p.symbol}: {', '.join(moves)} (high {p.high / d})")
+        p.failures = 0
+        p.modifications += 1
+        p.live_sl, p.live_target = sl, target
+        if p.decision_id:
+            db.update_decision(p.decision_id, stop_loss_price=sl / d, target_price=target / d)
+
+    def drain(self, timeout=10):
+        """Wait until no modification is pending (for replays); False on timeout"""
+        deadline = time.monotonic() + timeout
+        while any(p.pending() for p in list(self.positions.values())):
+            if time.monotonic() > deadline:
+                return False
+            self._wake.set()
+            time.sleep(0.05)
+        return True
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'ticks': self.ticks,
+            'instruments': len(self.rings),
+            'us_per_tick': round(self.busy / self.ticks * 1e6, 2) if self.ticks else None,
+        }
+
+# Recording and replay
+
+class TickRecorder:
+    """Append raw websocket frames with their receive time, for replay()"""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._file = open(path, 'ab')
+        self._lock = threading.Lock()
+
+    def write(self, payload, received):
+        with self._lock:
+            self._file.write(_RECORD.pack(received, len(payload)))
+            self._file.write(payload)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def read_frames(path):
+    """(receive time, frame) for every frame in a recording"""
+    with open(path, 'rb') as f:
+        while True:
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            received, length = _RECORD.unpack(head)
+            yield received, f.read(length)
+
+def replay(path, engine, speed=1.0):
+    """
+    Feed a recording through engine.on_frame, the same path live frames take.
+    speed 1 keeps the recorded pacing, 10 plays ten times faster and 0 as
+    fast as possible. Returns the number of frames fed.
+    """
+    first = started = None
+    frames = 0
+    for received, payload in read_frames(path):
+        if speed > 0:
+            if first is None:
+                first, started = received, time.time()
+            delay = started + (received - first) / speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            engine.on_frame(payload)
+        else:
+            engine.on_frame(payload, received)
+        frames += 1
+    return frames
+
+def encode_full(token, price, volume, timestamp, spread=1):
+    """One full-mode packet (price in rupees) with a five-level book around it"""
+    paise = round(price * 100)
+    depth = []
+    for side in (-1, 1):
+        for level in range(5):
+            depth += [100 * (level + 1), paise + side * 5 * (spread + level), 1 + level, 0]
+    return _FULL.pack(token, paise, 10, paise, volume, 5000, 5000, paise, paise, paise, paise,
+                      int(timestamp), 0, 0, 0, int(timestamp), *depth)
+
+def encode_frame(packets):
+    return _COUNT.pack(len(packets)) + b''.join(_COUNT.pack(len(p)) + p for p in packets)
+
+def synthesize(path, prices, seconds=600, interval=0.25, drift=0.0, volatility=0.001, seed=None):
+    """
+    Write a recording of random-walk full-mode ticks: prices is
+    {instrument_token: starting price}, one frame with every instrument per
+    interval. Returns the number of frames written.
+    """
+    rng = random.Random(seed)
+    current = dict(prices)
+    volume = dict.fromkeys(prices, 0)
+    start = time.time()
+    frames = int(seconds / interval)
+    with open(path, 'wb') as f:
+        for i in range(frames):
+            at = start + i * interval
+            packets = []
+            for token in current:
+                current[token] = max(0.05, current[token] * (1 + rng.gauss(drift, volatility)))
+                volume[token] += rng.randint(1, 500)
+                packets.append(encode_full(token, current[token], volume[token], at))
+            payload = encode_frame(packets)
+            f.write(_RECORD.pack(at, len(payload)))
+            f.write(payload)
+    return frames
+
+# Listing-day lifecycle
+
+_lock = threading.Lock()
+_engine = None
+_engine_day = None
+_ticker = None
+_stop_timer = None
+
+def get_engine(day=None):
+    """The engine for a listing day (a fresh one each day)"""
+    global _engine, _engine_day
+    day = day or cal.today().isoformat()
+    with _lock:
+        if _engine is None or _engine_day != day:
+            if _engine is not None:
+                _engine.stop()
+            recorder = None
+            if config.TICK_RECORD_DIR:
+                recorder = TickRecorder(os.path.join(config.TICK_RECORD_DIR, f'{day}.ticks'))
+            _engine, _engine_day = TickEngine(recorder=recorder), day
+        return _engine
+
+def load_positions(day, engine):
+    """Add the day's open positions to the engine; returns how many were new"""
+    added = 0
+    for row in db.get_open_positions(day):
+        symbol, _, _ = trader.resolve_trading_symbol(row['company'], row.get('symbol'))
+        inst = trader.get_instrument(symbol, 'NSE') if symbol else None
+        if not inst:
+            print(f"[ticker] No instrument for {row['company']} ({symbol}), not trailing")
+            continue
+        token = inst['instrument_token']
+        if token in engine.positions:
+            continue
+        engine.add_position(Position(
+            row['id'], symbol, token, row['quantity'], row['entry_price'],
+            row['stop_loss_price'], row['target_price'], row['exit_order_id'],
+            inst.get('tick_size')))
+        added += 1
+    return added
+
+def _subscribe(ws, tokens):
+    if tokens:
+        ws.subscribe(tokens)
+        ws.set_mode(ws.MODE_FULL, tokens)
+
+def _connect(engine):
+    """Open the websocket, or subscribe new instruments on the open one"""
+    global _ticker
+    from kiteconnect import KiteTicker
+    from twisted.internet import reactor
+
+    with _lock:
+        if _ticker is not None:
+            if _ticker.is_connected():
+                # The websocket belongs to the Twisted reactor thread
+                reactor.callFromThread(_subscribe, _ticker, engine.tokens())
+            return
+        access_token = token_manager.get_token() or config.KITE_ACCESS_TOKEN
+        kws = KiteTicker(config.KITE_API_KEY, access_token, root=config.KITE_TICKER_ROOT)
+        kws.on_connect = lambda ws, response: _subscribe(ws, engine.tokens())
+        kws.on_message = lambda ws, payload, is_binary: is_binary and engine.on_frame(payload)
+        kws.on_close = lambda ws, code, reason: print(f"[ticker] Websocket closed: {code} {reason}")
+        kws.on_error = lambda ws, code, reason: print(f"[ticker] Websocket error: {code} {reason}")
+        kws.connect(threaded=True)
+        _ticker = kws
+
+def start(day=None):
+    """
+    Stream ticks for a listing day's open positions and trail their exits
+    until the close. No-op unless TICKER_ENABLED; safe to call again after
+    more positions open.
+    """
+    global _stop_timer
+    if not config.TICKER_ENABLED:
+        return False
+    day = day or cal.today().isoformat()
+    close_at = cal.at(date.fromisoformat(day), cal.MARKET_CLOSE)
+    until_close = (close_at - cal.now()).total_seconds()
+    if until_close <= 0:
+        print(f"[ticker] The {day} session is over, nothing to trail")
+        return False
+    if not trader.kite:
+        trader.init_kite()
+
+    engine = get_engine(day)
+    added = load_positions(day, engine)
+    if not engine.positions:
+        print(f"[ticker] No open positions on {day}")
+        return False
+
+    engine.start()
+    _connect(engine)
+    print(f"[ticker] Trailing {len(engine.positions)} position(s) ({added} new)")
+
+    with _lock:
+        if _stop_timer is None:
+            _stop_timer = threading.Timer(until_close, stop)
+            _stop_timer.daemon = True
+            _stop_timer.start()
+    return True
+
+def resume():
+    """After a restart during a listing-day session, pick trailing back up"""
+    if not config.TICKER_ENABLED:
+        return False
+    now = cal.now()
+    if not cal.is_trading_day(now.date()):
+        return False
+    if not cal.LISTING_OPEN <= now.time() < cal.MARKET_CLOSE:
+        return False
+    threading.Thread(target=start, daemon=True, name='ticker-start').start()
+    return True
+
+def stop():
+    """Close the websocket and stop trailing; exits stay where they were last moved"""
+    global _ticker, _stop_timer
+    with _lock:
+        kws, _ticker = _ticker, None
+        if _stop_timer is not None:
+            _stop_timer.cancel()
+            _stop_timer = None
+        engine = _engine
+    if kws is not None:
+        kws.close()
+    if engine is not None:
+        engine.stop()
+    print("[ticker] Stopped")
+
+def status():
+    """Connection, tick path stats, positions and the last tick per instrument, for /ticker"""
+    engine = _engine
+    return {
+        'enabled': config.TICKER_ENABLED,
+        'day': _engine_day,
+        'connected': bool(_ticker is not None and _ticker.is_connected()),
+        'stats': engine.stats() if engine else None,
+        'positions': [p.to_dict() for p in engine.positions.values()] if engine else [],
+        'instruments': [r.last() for r in engine.rings.values()] if engine else [],
+    }
+
+# CLI
+
+def _fixture_tokens():
+    """{symbol: instrument_token} for NSE rows of fixtures/kite/instruments.csv"""
+    import standin
+    tokens = {}
+    for line in standin.load_fixture('kite', 'instruments.csv').splitlines()[1:]:
+        fields = line.split(',')
+        if fields[-1] == 'NSE':
+            tokens[fields[2]] = int(fields[0])
+    return tokens
+
+def _replay_positions(path, engine, place_exits):
+    """A position per recorded instrument, entered at its first tick"""
+    symbols = {token: symbol for symbol, token in _fixture_tokens().items()}
+    symbols.update((inst['instrument_token'], symbol)
+                   for (exchange, symbol), inst in trader.load_instruments().items()
+                   if exchange == 'NSE')
+    for _, payload in read_frames(path):
+        count, = _COUNT.unpack_from(payload, 0)
+        pos = 2
+        for _ in range(count):
+            length, token, ltp = _PACKET.unpack_from(payload, pos)
+            pos += 2 + length
+            if token in engine.positions:
+                continue
+            symbol = symbols.get(token, str(token))
+            entry = ltp / price_divisor(token)
+            sl = trader.round_to_tick(entry * (1 - config.STOP_LOSS_PERCENT / 100), symbol)
+            target = trader.round_to_tick(entry * (1 + config.TARGET_PROFIT_PERCENT / 100), symbol)
+            quantity = trader.calculate_quantity(entry)
+            exit_order_id = place_exits(symbol, quantity, entry, sl, target)
+            engine.add_position(Position(None, symbol, token, quantity, entry, sl, target, exit_order_id))
+
+def _run_replay(args):
+    def dry_run(exit_order_id, symbol, quantity, last_price, sl_price, target_price, *moved):
+        return True
+
+    if not args.standin:
+        engine = TickEngine(modify_exit=dry_run)
+        _replay_positions(args.file, engine, lambda *a: 'dry-run')
+        return engine, None
+
+    import logging
+    import standin
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = standin.StandinServer(standin.create_app(fill_delay=0)).__enter__()
+    standin.use_standin(server.url)
+    config.DB_PATH = os.path.join(tempfile.mkdtemp(prefix='ipo-ticker-'), 'ipo.db')
+    db.init_db()
+    trader.init_kite()
+    engine = TickEngine()
+    _replay_positions(args.file, engine,
+                      lambda *a: trader.place_exit_orders(*a)[1])
+    return engine, server
+
+def main():
+    parser = argparse.ArgumentParser(description='Live ticks and trailing exits for listing-day positions')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status', help="this process's ticker state")
+    run = sub.add_parser('run', help="trail a listing day's open positions until the close")
+    run.add_argument('--date', help='listing day (YYYY-MM-DD, default today IST)')
+
+    synth = sub.add_parser('synth', help='write a random-walk tick recording')
+    synth.add_argument('file')
+    synth.add_argument('--symbols', default='AMBERLEAF', help='comma-separated NSE symbols')
+    synth.add_argument('--price', type=float, default=100.0, help='starting price')
+    synth.add_argument('--seconds', type=float, default=600)
+    synth.add_argument('--interval', type=float, default=0.25, help='seconds between frames')
+    synth.add_argument('--drift', type=float, default=0.0, help='mean return per frame')
+    synth.add_argument('--volatility', type=float, default=0.001, help='return std-dev per frame')
+    synth.add_argument('--seed', type=int, default=None)
+
+    rep = sub.add_parser('replay', help='feed a recording through the tick path and trailing manager')
+    rep.add_argument('file')
+    rep.add_argument('--speed', type=float, default=0, help='1 = recorded pacing, 0 = as fast as possible')
+    rep.add_argument('--standin', action='store_true',
+                     help='place and modify real exits on a local stand-in instead of a dry run')
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        print(json.dumps(status(), indent=2, default=str))
+        return
+
+    if args.command == 'run':
+        config.TICKER_ENABLED = True
+        if not start(args.date):
+            return
+        try:
+            while _ticker is not None:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            stop()
+        return
+
+    if args.command == 'synth':
+        tokens = _fixture_tokens()
+        symbols = [s.strip().upper() for s in args.symbols.split(',') if s.strip()]
+        missing = [s for s in symbols if s not in tokens]
+        if missing:
+            parser.error(f"not in fixtures/kite/instruments.csv: {', '.join(missing)}")
+        frames = synthesize(args.file, {tokens[s]: args.price for s in symbols}, args.seconds,
+                            args.interval, args.drift, args.volatility, args.seed)
+        print(f"Wrote {frames} frames for {', '.join(symbols)} to {args.file}")
+        return
+
+    engine, server = _run_replay(args)
+    engine.start()
+    started = time.perf_counter()
+    frames = replay(args.file, engine, args.speed)
+    elapsed = time.perf_counter() - started
+    engine.drain(timeout=config.TRAIL_MODIFY_INTERVAL * 2 + 5)
+    engine.stop()
+
+    stats = engine.stats()
+    print(f"Replayed {frames} frames / {stats['ticks']} ticks in {elapsed:.2f}s "
+          f"({stats['us_per_tick']}us per tick in the tick path)")
+    for p in engine.positions.values():
+        print(json.dumps(p.to_dict(), default=str))
+        ring = engine.rings[p.token]
+        prices = ring.prices()
+        print(f"  ring: {min(ring.count, ring.size)} ticks held, last {prices[-1]:.2f}, "
+              f"range {prices.min():.2f}-{prices.max():.2f}")
+    if server:
+        for p in engine.positions.values():
+            if p.exit_order_id and ',' not in p.exit_order_id:
+                gtt = trader.kite.get_gtt(int(p.exit_order_id))
+                print(f"  stand-in GTT {p.exit_order_id}: triggers {gtt['condition'].get('trigger_values')}")
+        server.__exit__(None, None, None)
+
+if __name__ == '__main__':
+    main()
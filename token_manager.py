@@ -0,0 +1,180 @@
+"""
+Kite access token manager
+Kite access tokens do not last 24 hours: every token dies at a fixed
+early-morning time (06:00 IST) regardless of when it was issued. The valid
+token is held in memory with its real expiry, so callers never read
+kite_tokens once it is loaded. A background thread logs in again shortly
+after each expiry (KITE_TOKEN_REFRESH_DELAY), long before the morning job
+needs the token, and subscribers are told about every new token.
+"""
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+import config
+import db
+from trading_calendar import IST
+MAX_RETRY_INTERVAL = 900
+
+_lock = threading.Lock()
+_token = None
+_expires_at = None      # aware datetime
+_loaded = False
+_listeners = []
+_wake = threading.Event()
+_refresher = None
+_refresh_lock = threading.Lock()
+_state = {'last_refresh': None, 'last_error': None, 'refreshing': False}
+
+def next_expiry(issued_at=None):
+    """When a token issued at `issued_at` (default now) stops working"""
+    issued = (issued_at or datetime.now(IST)).astimezone(IST)
+    hour, _, minute = config.KITE_TOKEN_EXPIRY.partition(':')
+    expiry = issued.replace(hour=int(hour), minute=int(minute or 0), second=0, microsecond=0)
+    if expiry <= issued:
+        expiry += timedelta(days=1)
+    return expiry
+
+def _is_valid(expires_at):
+    return expires_at is not None and expires_at > datetime.now(IST)
+
+def _load():
+    """Seed the cache from the database (once per process)"""
+    global _token, _expires_at, _loaded
+    row = db.get_token_record()
+    with _lock:
+        _loaded = True
+        if row:
+            expires_at = datetime.fromisoformat(row['expires_at'])
+            expires_at = expires_at.astimezone(IST)  # naive = local time
+            # Rows saved with the old flat 24h expiry can outlive the token
+            expires_at = min(expires_at, next_expiry(datetime.fromisoformat(row['created_at'])
+                                                     .replace(tzinfo=timezone.utc)))
+            if _is_valid(expires_at):
+                _token, _expires_at = row['access_token'], expires_at
+
+def get_token():
+    """The current valid access token, or None (no database read once loaded)"""
+    if not _loaded:
+        _load()
+    with _lock:
+        if _is_valid(_expires_at):
+            return _token
+    return None
+
+def expires_at():
+    if not _loaded:
+        _load()
+    with _lock:
+        return _expires_at
+
+def set_token(access_token, issued_at=None):
+    """Store a freshly generated token and notify subscribers"""
+    global _token, _expires_at, _loaded
+    expiry = next_expiry(issued_at)
+    # Stored as local naive time, like the other timestamps in the database
+    db.save_access_token(access_token, expiry.astimezone().replace(tzinfo=None).isoformat())
+    with _lock:
+        _token, _expires_at, _loaded = access_token, expiry, True
+        listeners = list(_listeners)
+    for callback in listeners:
+        try:
+            callback(access_token)
+        except Exception as e:
+            print(f"Token listener {callback.__name__} failed: {e}")
+    _wake.set()
+    return expiry
+
+def subscribe(callback):
+    """Call callback(access_token) whenever a new token is set (idempotent)"""
+    with _lock:
+        if callback not in _listeners:
+            _listeners.append(callback)
+
+def unsubscribe(callback):
+    with _lock:
+        if callback in _listeners:
+            _listeners.remove(callback)
+
+def can_auto_login():
+    return all([config.KITE_API_KEY, config.KITE_API_SECRET,
+                config.KITE_USER_ID, config.KITE_PASSWORD, config.KITE_TOTP_KEY])
+
+def refresh(force=False):
+    """
+    Log in now and return the new token (None on failure). Concurrent
+    callers share one login; force logs in even while the token is valid.
+    """
+    with _refresh_lock:
+        # Another caller (or process) may have refreshed while we waited
+        _load()
+        token = get_token()
+        if token and not force:
+            return token
+
+        import kite_auto_login
+        _state['refreshing'] = True
+        try:
+            token = kite_auto_login.auto_login_kite()
+        except Exception as e:
+            traceback.print_exc()
+            token = None
+            _state['last_error'] = str(e)
+        finally:
+            _state['refreshing'] = False
+        if token:
+            _state['last_refresh'] = datetime.now(IST).isoformat(timespec='seconds')
+            _state['last_error'] = None
+        elif not _state['last_error']:
+            _state['last_error'] = 'Auto-login failed'
+        return token
+
+def ensure_token():
+    """The valid token, logging in synchronously only if there is none"""
+    return get_token() or (refresh() if can_auto_login() else None)
+
+def start():
+    """Start the background refresher (no-op without auto-login credentials)"""
+    global _refresher
+    if not can_auto_login():
+        return False
+    with _lock:
+        if _refresher is None:
+            _refresher = threading.Thread(target=_run, daemon=True, name='token-refresher')
+            _refresher.start()
+    return True
+
+def _run():
+    retry = config.KITE_TOKEN_RETRY_INTERVAL
+    while True:
+        current = expires_at() if get_token() else None
+        if current:
+            due = current + timedelta(seconds=config.KITE_TOKEN_REFRESH_DELAY)
+            wait = (due - datetime.now(IST)).total_seconds()
+            if wait > 0:
+                _wake.clear()
+                # Wake early if a token is set elsewhere (callback, manual refresh)
+                _wake.wait(wait)
+                continue
+
+        started = time.monotonic()
+        if refresh():
+            retry = config.KITE_TOKEN_RETRY_INTERVAL
+            print(f"Token refreshed in the background in {time.monotonic() - started:.2f}s")
+            continue
+        print(f"Background token refresh failed, retrying in {retry}s")
+        _wake.clear()
+        _wake.wait(retry)
+        retry = min(retry * 2, MAX_RETRY_INTERVAL)
+
+def status():
+    """Token state for /token-status"""
+    token = get_token()
+    expiry = expires_at()
+    return {
+        'status': 'valid' if token else 'expired',
+        'has_token': bool(token),
+        'expires_at': expiry.isoformat() if token else None,
+        'auto_refresh': _refresher is not None,
+        **_state,
+    }
@@ -1,10 +1,21 @@
 import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from kiteconnect import KiteConnect
 import config
 import db
+import metrics
+import resolver
+import rules
+import token_manager
+import trading_calendar
+from kite_client import KiteClient
+from order_tracker import OrderTracker, TERMINAL_STATUSES
 
 kite = None
+_order_tracker = None
 
 def init_kite():
     """Initialize Kite Connect with access token from database or env var"""
@@ -14,10 +25,10 @@ def init_kite():
         print("Kite API credentials not configured")
         return None
 
-    kite = KiteConnect(api_key=config.KITE_API_KEY)
+    kite = KiteClient(KiteConnect(api_key=config.KITE_API_KEY, root=config.KITE_API_ROOT))
 
-    # Try to get token from database first
-    access_token = db.get_access_token()
+    # Try the token manager's cached token first
+    access_token = token_manager.get_token()
 
     # Fallback to env var if no DB token
     if not access_token and config.KITE_ACCESS_TOKEN:
@@ -29,8 +40,14 @@ def init_kite():
     else:
         print("Kite Connect initialized (no access token - login required)")
 
+    # Pick up refreshed tokens without re-initializing
+    token_manager.subscribe(set_access_token)
     return kite
 
+def get_api_metrics():
+    """Per-method Kite call metrics (empty until Kite is initialized)"""
+    return kite.get_metrics() if isinstance(kite, KiteClient) else {}
+
 def set_access_token(access_token):
     """Set access token manually"""
     global kite
@@ -44,24 +61,94 @@ def calculate_quantity(issue_price):
         return 0
     return math.ceil(config.INVESTMENT_AMOUNT / issue_price)
 
-def get_instrument_token(symbol):
-    """Get instrument token for a symbol (for placing orders)"""
-    if not kite:
-        return None
+# In-memory instrument master: {(exchange, TRADINGSYMBOL): instrument dict}
+_instruments = {}
+_instruments_loaded_on = None
+_instruments_lock = threading.Lock()
 
-    # Search in NSE instruments
-    instruments = kite.instruments("NSE")
-    for inst in instruments:
-        if inst['tradingsymbol'].upper() == symbol.upper():
-            return inst['instrument_token']
+def load_instruments(force=False):
+    """
+    Load the instrument master once per trading day.
+    Served from memory, then from the SQLite copy, and only downloaded from
+    Kite when neither is from today.
+    """
+    today = date.today().isoformat()
+    if _instruments_loaded_on == today and not force:
+        return _instruments
+
+    # One loader at a time: trade workers and the ticker would otherwise all
+    # download the master and race on replace_instruments
+    with _instruments_lock:
+        if _instruments_loaded_on == today and not force:
+            return _instruments
+        return _load_instruments(today, force)
+
+def _load_instruments(today, force):
+    global _instruments, _instruments_loaded_on
+
+    rows = None
+    if not force and db.get_instruments_loaded_on() == today:
+        rows = db.get_instruments()
+
+    if rows is None:
+        if not kite:
+            return _instruments
+
+        print("Downloading instrument master...")
+        rows = []
+        for exchange in ('NSE', 'BSE'):
+            for inst in kite.instruments(exchange):
+                rows.append({
+                    'exchange': exchange,
+                    'tradingsymbol': inst['tradingsymbol'],
+                    'instrument_token': inst['instrument_token'],
+                    'name': inst.get('name'),
+                    'lot_size': inst.get('lot_size'),
+                    'tick_size': inst.get('tick_size'),
+                    'instrument_type': inst.get('instrument_type'),
+                    'segment': inst.get('segment'),
+                })
+        db.replace_instruments(
+            [(r['exchange'], r['tradingsymbol'], r['instrument_token'], r['name'],
+              r['lot_size'], r['tick_size'], r['instrument_type'], r['segment']) for r in rows],
+            today
+        )
+        print(f"Cached {len(rows)} instruments")
+
+    _instruments = {(r['exchange'], r['tradingsymbol'].upper()): r for r in rows}
+    _instruments_loaded_on = today
+    return _instruments
+
+def get_instrument(symbol, exchange=None):
+    """Get instrument details (token, lot size, tick size) for a symbol"""
+    instruments = load_instruments()
+    exchanges = (exchange,) if exchange else ('NSE', 'BSE')
+    for ex in exchanges:
+        inst = instruments.get((ex, symbol.upper()))
+        if inst:
+            return inst
+    return None
 
-    # Try BSE
-    instruments = kite.instruments("BSE")
-    for inst in instruments:
-        if inst['tradingsymbol'].upper() == symbol.upper():
-            return inst['instrument_token']
+def get_instrument_token(symbol):
+    """Get instrument token for a symbol (for placing orders)"""
+    inst = get_instrument(symbol)
+    return inst['instrument_token'] if inst else None
 
-    return None
+def resolve_trading_symbol(company, symbol=None):
+    """
+    Get the trading symbol for an IPO: the NSE symbol captured by the scraper
+    when it is an equity in today's instrument master, else a name-index
+    match. Returns (symbol, exchange, confidence), (None, None, 0.0) if
+    unresolved.
+    """
+    instruments = load_instruments()
+    if symbol:
+        inst = instruments.get(('NSE', symbol.upper()))
+        if not instruments or (inst and resolver.is_equity('NSE', inst)):
+            return symbol.upper(), 'NSE', 1.0
+        # Not listed (yet): any name match would be a different, listed company
+        return None, None, 0.0
+    return resolver.resolve_symbol(company, instruments)
 
 def place_buy_order(symbol, quantity):
     """Place a market buy order"""
@@ -129,17 +216,161 @@ def place_target_order(symbol, quantity, price):
         print(f"Error placing target order: {e}")
         return None
 
+def round_to_tick(price, symbol):
+    """Round a price to the instrument's tick size (0.05 if unknown)"""
+    inst = get_instrument(symbol, 'NSE')
+    tick = (inst or {}).get('tick_size') or 0.05
+    return round(round(price / tick) * tick, 2)
+
+def _oco_legs(symbol, quantity, sl_price, target_price):
+    """SL (limit just below its trigger) and target sell legs of an OCO GTT"""
+    sl_limit = round_to_tick(sl_price * (1 - config.GTT_SL_LIMIT_BUFFER / 100), symbol)
+    leg = {
+        'exchange': kite.EXCHANGE_NSE,
+        'tradingsymbol': symbol,
+        'transaction_type': kite.TRANSACTION_TYPE_SELL,
+        'quantity': quantity,
+        'order_type': kite.ORDER_TYPE_LIMIT,
+        'product': kite.PRODUCT_CNC,
+    }
+    return [{**leg, 'price': sl_limit}, {**leg, 'price': target_price}]
+
+def place_oco_exit(symbol, quantity, last_price, sl_price, target_price):
+    """
+    Place SL and target as one GTT two-leg (OCO) trigger, so only one leg can
+    ever execute. Returns the trigger id, or None if Kite rejects it.
+    """
+    if not kite:
+        return None
+
+    try:
+        resp = kite.place_gtt(
+            trigger_type=kite.GTT_TYPE_OCO,
+            tradingsymbol=symbol,
+            exchange=kite.EXCHANGE_NSE,
+            trigger_values=[sl_price, target_price],
+            last_price=last_price,
+            orders=_oco_legs(symbol, quantity, sl_price, target_price)
+        )
+        trigger_id = resp['trigger_id']
+        print(f"OCO GTT placed: {trigger_id}")
+        return trigger_id
+    except Exception as e:
+        print(f"Error placing OCO GTT: {e}")
+        return None
+
+def find_oco_exit(symbol, quantity, sl_price, target_price):
+    """
+    Trigger id of an active OCO GTT matching this exit exactly (symbol, both
+    trigger values, quantity on every leg), e.g. one Kite accepted on a
+    place_gtt call that then timed out. GTTs placed by hand or left over from
+    another trade don't match. Raises if the GTT list cannot be read.
+    """
+    for gtt in kite.get_gtts():
+        condition = gtt.get('condition') or {}
+        triggers = condition.get('trigger_values') or []
+        orders = gtt.get('orders') or []
+        if (gtt.get('status') == 'active'
+                and condition.get('tradingsymbol') == symbol
+                and len(triggers) == 2 and len(orders) == 2
+                and all(abs(float(got) - want) < 0.005
+                        for got, want in zip(triggers, (sl_price, target_price)))
+                and all(o.get('quantity') == quantity for o in orders)):
+            return gtt['id']
+    return None
+
+def place_exit_orders(symbol, quantity, fill_price, sl_price, target_price):
+    """
+    Protect a position: one OCO GTT when EXIT_MODE is 'gtt', falling back to
+    separate SL-M and LIMIT orders. Returns (mode, exit_order_id, protected);
+    exit_order_id is the trigger id or 'sl_order_id,target_order_id' with a
+    failed leg left empty, None if nothing was placed.
+    """
+    if config.EXIT_MODE == 'gtt':
+        trigger_id = place_oco_exit(symbol, quantity, fill_price, sl_price, target_price)
+        if not trigger_id:
+            # Order calls are not retried, so a timed-out place_gtt may still
+            # have gone through: falling back then would sell twice
+            try:
+                trigger_id = find_oco_exit(symbol, quantity, sl_price, target_price)
+            except Exception as e:
+                print(f"Could not check existing GTTs for {symbol}, not falling back: {e}")
+                return 'GTT', None, False
+        if trigger_id:
+            return 'GTT', str(trigger_id), True
+        print("Falling back to separate SL and target orders")
+
+    sl_order_id = place_stop_loss_order(symbol, quantity, sl_price)
+    target_order_id = place_target_order(symbol, quantity, target_price)
+    if not sl_order_id and not target_order_id:
+        return 'ORDERS', None, False
+    return ('ORDERS', f"{sl_order_id or ''},{target_order_id or ''}",
+            bool(sl_order_id and target_order_id))
+
+def modify_exit_orders(exit_order_id, symbol, quantity, last_price, sl_price, target_price,
+                       sl_moved=True, target_moved=True):
+    """
+    Move a position's SL and target. exit_order_id is as stored by
+    place_exit_orders: a GTT trigger id (both legs go in one modify_gtt) or
+    'sl_order_id,target_order_id' (only the moved orders are modified).
+    Returns True if Kite accepted every change.
+    """
+    if not kite or not exit_order_id:
+        return False
+
+    try:
+        if ',' not in exit_order_id:
+            kite.modify_gtt(
+                trigger_id=int(exit_order_id),
+                trigger_type=kite.GTT_TYPE_OCO,
+                tradingsymbol=symbol,
+                exchange=kite.EXCHANGE_NSE,
+                trigger_values=[sl_price, target_price],
+                last_price=last_price,
+                orders=_oco_legs(symbol, quantity, sl_price, target_price)
+            )
+            return True
+
+        sl_order_id, target_order_id = exit_order_id.split(',', 1)
+        if sl_moved and sl_order_id:
+            kite.modify_order(variety=kite.VARIETY_REGULAR, order_id=sl_order_id,
+                              trigger_price=sl_price)
+        if target_moved and target_order_id:
+            kite.modify_order(variety=kite.VARIETY_REGULAR, order_id=target_order_id,
+                              price=target_price)
+        return True
+    except Exception as e:
+        print(f"Error modifying exits for {symbol}: {e}")
+        return False
+
+def cancel_unfilled_buy(order_id):
+    """
+    Cancel a buy that did not fill in time. Returns its final order dict
+    (CANCELLED, or COMPLETE if it filled meanwhile), or None if it is still
+    open.
+    """
+    if not kite:
+        return None
+
+    try:
+        kite.cancel_order(variety=kite.VARIETY_REGULAR, order_id=order_id)
+        print(f"Buy order {order_id} not filled in time, cancelled")
+    except Exception as e:
+        print(f"Error cancelling buy order {order_id}: {e}")
+
+    order = get_order_status(order_id)
+    if order and order['status'] in TERMINAL_STATUSES:
+        return order
+    return None
+
 def get_order_status(order_id):
     """Get status of an order"""
     if not kite:
         return None
 
     try:
-        orders = kite.orders()
-        for o in orders:
-            if o['order_id'] == order_id:
-                return o
-        return None
+        history = kite.order_history(order_id)
+        return history[-1] if history else None
     except Exception as e:
         print(f"Error getting order status: {e}")
         return None
@@ -151,52 +382,86 @@ def get_fill_price(order_id):
         return order['average_price']
     return None
 
+def get_order_tracker():
+    """Shared tracker resolving all pending orders from one orders() poll"""
+    global _order_tracker
+    if _order_tracker is None:
+        _order_tracker = OrderTracker(lambda: kite.orders() if kite else [])
+    return _order_tracker
+
+def wait_for_fill(order_id, timeout=None):
+    """Wait until an order is COMPLETE/REJECTED/CANCELLED; None on timeout"""
+    return get_order_tracker().wait(order_id, timeout)
+
 def evaluate_subscription(subscription):
     """
     Evaluate if subscription qualifies for BUY
-    Rule: ALL of QIB, SNII, BNII, NII, Retail must be > 1x
+    Rule: every category above its configured threshold (default: ALL of
+    QIB, SNII, BNII, NII, Retail must be > 1x) - see rules.py
     """
-    qib = subscription.get('qib') or 0
-    snii = subscription.get('snii') or 0
-    bnii = subscription.get('bnii') or 0
-    nii = subscription.get('nii') or 0
-    retail = subscription.get('retail') or 0
-
-    # Build reason string
-    parts = []
-    all_above_1 = True
-
-    checks = [
-        ('QIB', qib),
-        ('SNII', snii),
-        ('BNII', bnii),
-        ('NII', nii),
-        ('Retail', retail)
-    ]
-
-    for name, val in checks:
-        if val > 1:
-            parts.append(f"{name}: {val}x ✓")
-        else:
-            parts.append(f"{name}: {val}x ✗")
-            all_above_1 = False
-
-    reason = ', '.join(parts)
-
-    if all_above_1:
-        return 'BUY', f"All categories oversubscribed: {reason}"
-    else:
-        return 'SKIP', f"Not all categories oversubscribed: {reason}"
+    decisions, codes = evaluate_subscriptions([subscription])
+    return decisions[0], rules.format_reason(codes[0], rules.to_array([subscription])[0])
+
+def evaluate_subscriptions(subscriptions, issue_sizes=None):
+    """
+    Evaluate many subscription dicts in one vectorized call.
+    Returns (['BUY'|'SKIP', ...], reason codes); see rules.format_reason.
+    """
+    buy, codes = rules.get_default_rule().evaluate(rules.to_array(subscriptions), issue_sizes)
+    return ['BUY' if b else 'SKIP' for b in buy], [int(c) for c in codes]
+
+def rescore_history(rule=None):
+    """
+    Re-evaluate every stored subscription against a rule (default: the
+    configured one). Returns {'total': n, 'buy': n} without building reasons.
+    """
+    rule = rule or rules.get_default_rule()
+    history = db.get_all_subscriptions()
+    buy, _ = rule.evaluate(rules.to_array(history),
+                           [h['issue_size'] for h in history])
+    return {'total': len(history), 'buy': int(buy.sum())}
+
+def execute_trade(company, issue_price, decision_id, symbol=None, timings=None, fill_timeout=None,
+                  listing_estimated=False):
+    """
+    Execute the full trade flow: buy + SL + target
+    If a timings dict is given, per-step durations (ms) are recorded in it.
+    fill_timeout overrides ORDER_FILL_TIMEOUT (e.g. to wait out the listing auction).
+    With listing_estimated, an IPO missing from today's instrument master is
+    left PENDING and None is returned: its estimated listing date was early.
+    """
+    if timings is None:
+        timings = {}
+    started = time.perf_counter()
+
+    def mark(step):
+        nonlocal started
+        now = time.perf_counter()
+        timings[step] = round((now - started) * 1000, 1)
+        metrics.observe('trade', step, now - started)
+        started = now
+
+    # The trade stage and a manual daily job can both pick up this decision;
+    # only the run that claims it places orders. A crash leaves it PLACING.
+    if not db.claim_decision(decision_id):
+        print(f"{company}: decision {decision_id} already claimed by another run")
+        return False
 
-def execute_trade(company, issue_price, decision_id):
-    """Execute the full trade flow: buy + SL + target"""
     if not kite:
         print("Kite not initialized, simulating trade")
         db.update_decision(decision_id, status='SIMULATED')
         return False
 
-    # Extract symbol from company name (rough, might need mapping)
-    symbol = company.split()[0].upper()
+    symbol, exchange, confidence = resolve_trading_symbol(company, symbol)
+    mark('resolve')
+    if not symbol and listing_estimated:
+        print(f"{company} is not listed yet (listing date was estimated), keeping the BUY pending")
+        db.update_decision(decision_id, status='PENDING')
+        return None
+    if not symbol or exchange != 'NSE' or confidence < config.SYMBOL_MIN_CONFIDENCE:
+        print(f"Could not resolve symbol for {company} (best: {symbol}, {confidence})")
+        db.update_decision(decision_id, status='FAILED', reason='Symbol not resolved')
+        return False
 
     quantity = calculate_quantity(issue_price)
     if quantity <= 0:
@@ -205,43 +470,59 @@ def execute_trade(company, issue_price, decision_id):
 
     # Place buy order
     buy_order_id = place_buy_order(symbol, quantity)
+    mark('buy')
     if not buy_order_id:
         db.update_decision(decision_id, status='FAILED', order_id=None)
         return False
 
-    # Wait a bit for fill (in real scenario, poll status)
-    import time
-    time.sleep(5)
+    # Wait for the fill (resolved by the shared poller or a postback)
+    order = wait_for_fill(buy_order_id, fill_timeout)
+    if order is None:
+        # Never place exits against a buy that may not have filled
+        order = cancel_unfilled_buy(buy_order_id)
+    mark('fill')
+    if order is None:
+        print(f"Buy order {buy_order_id} still open and could not be cancelled, skipping exits")
+        db.update_decision(decision_id, status='PENDING_FILL', order_id=buy_order_id,
+                           reason='Buy not filled in time; exits not placed')
+        return False
+    if order['status'] != 'COMPLETE':
+        print(f"Buy order {buy_order_id} {order['status']}: {order.get('status_message')}")
+        db.update_decision(decision_id, status='FAILED', order_id=buy_order_id)
+        return False
 
-    # Get fill price
-    fill_price = get_fill_price(buy_order_id)
+    fill_price = order.get('average_price')
     if not fill_price:
         fill_price = issue_price  # Fallback to issue price
 
     # Calculate SL and target
-    sl_price = round(fill_price * (1 - config.STOP_LOSS_PERCENT / 100), 2)
-    target_price = round(fill_price * (1 + config.TARGET_PROFIT_PERCENT / 100), 2)
-
-    # Place SL order
-    sl_order_id = place_stop_loss_order(symbol, quantity, sl_price)
-
-    # Place target order
-    target_order_id = place_target_order(symbol, quantity, target_price)
+    sl_price = round_to_tick(fill_price * (1 - config.STOP_LOSS_PERCENT / 100), symbol)
+    target_price = round_to_tick(fill_price * (1 + config.TARGET_PROFIT_PERCENT / 100), symbol)
+
+    # Place SL + target (single OCO trigger, or two orders as fallback)
+    exit_mode, exit_order_id, protected = place_exit_orders(symbol, quantity, fill_price,
+                                                            sl_price, target_price)
+    mark('exits')
+    if not protected:
+        print(f"⚠ {company}: exits not fully placed ({exit_mode} {exit_order_id}), position unprotected")
+        db.log_run('EXITS', 'FAILED', f'{company} ({symbol}): bought {quantity} at {fill_price} '
+                                      f'but exits not fully placed ({exit_mode} {exit_order_id})')
 
     # Update decision with all order info
     db.update_decision(
         decision_id,
-        status='EXECUTED',
+        status='EXECUTED' if protected else 'EXECUTED_UNPROTECTED',
         order_id=buy_order_id,
         entry_price=fill_price,
         stop_loss_price=sl_price,
         target_price=target_price,
-        quantity=quantity
+        quantity=quantity,
+        exit_order_id=exit_order_id
     )
 
     print(f"Trade executed: {company}")
     print(f"  Quantity: {quantity}, Entry: {fill_price}")
-    print(f"  SL: {sl_price}, Target: {target_price}")
+    print(f"  SL: {sl_price}, Target: {target_price} ({exit_mode} {exit_order_id})")
 
     return True
 
@@ -260,27 +541,31 @@ def run_evaluation(today=None):
         print("No IPOs closing today")
         return
 
+    evaluated = []
     for ipo in ipos:
         company = ipo['company']
-        print(f"Evaluating: {company}")
 
-        # Get subscription data
-        sub = db.get_subscription(company, today)
+        # Get subscription data (latest intraday snapshot, else first scrape)
+        sub = db.get_latest_snapshot(company, today) or db.get_subscription(company, today)
         if not sub:
             print(f"  No subscription data for {company}")
             db.save_decision(today, company, 'SKIP', 'No subscription data available')
             continue
+        evaluated.append((ipo, sub))
 
-        # Evaluate
-        decision, reason = evaluate_subscription(sub)
-        print(f"  Decision: {decision} - {reason}")
+    # Evaluate all of today's IPOs in one call
+    subs = [sub for _, sub in evaluated]
+    decisions, codes = evaluate_subscriptions(subs, [ipo.get('issue_size') for ipo, _ in evaluated])
 
-        # Save decision
-        db.save_decision(today, company, decision, reason)
+    # Only the reason code is stored; views build the text (rules.format_reason)
+    for (ipo, _), decision, code in zip(evaluated, decisions, codes):
+        print(f"Evaluating: {ipo['company']}")
+        print(f"  Decision: {decision} (reason code {code})")
+        db.save_decision(today, ipo['company'], decision, None, reason_code=code)
 
     db.log_run('EVALUATE', 'SUCCESS', f'Evaluated {len(ipos)} IPOs')
 
-def run_trading(today=None):
+def run_trading(today=None, fill_timeout=None):
     """
     Run on listing date to execute BUY decisions
     """
@@ -298,15 +583,54 @@ def run_trading(today=None):
         print("No pending BUY orders for today")
         return
 
-    for decision in pending:
-        company = decision['company']
-        issue_price = decision['issue_price']
-        decision_id = decision['id']
+    # Warm shared state once so worker threads don't race to build it
+    load_instruments()
+    get_order_tracker()
+
+    workers = max(1, min(config.TRADE_WORKERS, len(pending)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='trade') as pool:
+        results = list(pool.map(lambda d: _run_trade(d, fill_timeout), pending))
+
+    for r in results:
+        steps = ', '.join(f"{k} {v}ms" for k, v in r['timings'].items())
+        print(f"  {r['company']}: {r['outcome']} ({steps})")
+
+    # Estimated listing dates that proved early move on a trading day, until
+    # the IPO lists or NSE publishes its date
+    next_day = trading_calendar.next_trading_day(date.fromisoformat(today)).isoformat()
+    db.postpone_estimated_listing_dates([
+        (next_day, d['ipo_id']) for d, r in zip(pending, results) if r['outcome'] == 'NOT LISTED'
+    ])
+
+    executed = sum(1 for r in results if r['outcome'] == 'EXECUTED')
+    summary = '; '.join(
+        f"{r['company']}: {r['outcome']} in {sum(r['timings'].values()):.0f}ms"
+        for r in results
+    )
+    db.log_run('TRADE', 'SUCCESS',
+               f'Processed {len(pending)} trades ({executed} executed). {summary}')
+
+def _run_trade(decision, fill_timeout=None):
+    """Run one IPO's trade pipeline; errors are contained to that IPO"""
+    company = decision['company']
+    issue_price = decision['issue_price']
+    decision_id = decision['id']
+    timings = {}
 
-        print(f"Executing trade: {company} at ~{issue_price}")
-        execute_trade(company, issue_price, decision_id)
+    print(f"Executing trade: {company} at ~{issue_price}")
+    try:
+        ok = execute_trade(company, issue_price, decision_id,
+                           decision.get('symbol'), timings, fill_timeout,
+                           bool(decision.get('listing_date_estimated')))
+        outcome = 'NOT LISTED' if ok is None else 'EXECUTED' if ok else 'NOT EXECUTED'
+    except Exception as e:
+        print(f"Trade error for {company}: {e}")
+        db.update_decision(decision_id, status='FAILED', reason=f'Error: {e}')
+        outcome = 'ERROR'
+    finally:
+        db.close_db()
 
-    db.log_run('TRADE', 'SUCCESS', f'Processed {len(pending)} trades')
+    return {'company': company, 'outcome': outcome, 'timings': timings}
 
 if __name__ == '__main__':
     # For testing
@@ -0,0 +1,157 @@
+"""
+NSE trading calendar
+Exchange holidays for the equity segment, the session times the market
+clock schedules against, and business-day arithmetic. Everything here is
+IST, whatever the server's timezone. Add each year's holidays from the NSE
+circular published in December; MARKET_HOLIDAYS covers one-off closures.
+
+Trading days of the years NSE_HOLIDAYS covers (CALENDAR_START through
+CALENDAR_END) are precomputed at import: for every calendar day, the number
+of trading days before it. That makes is_trading_day, add_trading_days and
+trading_days_between two list lookups each. Dates in other years step day
+by day, skipping weekends and the fixed-date FIXED_HOLIDAYS only, and print
+a warning once per year since moving festival holidays will be missed.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+import config
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+NSE_HOLIDAYS = [
+    # 2025
+    '2025-02-26', '2025-03-14', '2025-03-31', '2025-04-10', '2025-04-14',
+    '2025-04-18', '2025-05-01', '2025-08-15', '2025-08-27', '2025-10-02',
+    '2025-10-21', '2025-10-22', '2025-11-05', '2025-12-25',
+    # 2026
+    '2026-01-15', '2026-01-26', '2026-03-03', '2026-03-26', '2026-03-31',
+    '2026-04-03', '2026-04-14', '2026-05-01', '2026-05-28', '2026-06-26',
+    '2026-09-14', '2026-10-02', '2026-10-20', '2026-11-10', '2026-11-24',
+    '2026-12-25',
+]
+
+HOLIDAYS = frozenset(date.fromisoformat(d) for d in NSE_HOLIDAYS + config.MARKET_HOLIDAYS)
+
+# National holidays NSE closes for every year, as (month, day): the best
+# guess for a year whose holiday list isn't in NSE_HOLIDAYS yet
+FIXED_HOLIDAYS = frozenset([(1, 26), (5, 1), (8, 15), (10, 2), (12, 25)])
+
+# Regular equity session
+PRE_OPEN = time(9, 0)
+MARKET_OPEN = time(9, 15)
+MARKET_CLOSE = time(15, 30)
+
+# Listing day: special pre-open call auction for the new issue
+LISTING_AUCTION_CLOSE = time(9, 45)   # order entry ends
+LISTING_OPEN = time(10, 0)            # normal trading starts
+
+# IPO bidding window
+BIDDING_OPEN = time(10, 0)
+BIDDING_CLOSE = time(17, 0)
+
+def now():
+    return datetime.now(IST)
+
+def today():
+    return now().date()
+
+def at(day, t):
+    """Aware IST datetime for a date and a time (or 'HH:MM[:SS]' string)"""
+    if isinstance(t, str):
+        t = time.fromisoformat(t)
+    return datetime.combine(day, t, tzinfo=IST)
+
+# Precomputed tables: only the years with a holiday list
+CALENDAR_START = date(int(min(NSE_HOLIDAYS)[:4]), 1, 1)
+CALENDAR_END = date(int(max(NSE_HOLIDAYS)[:4]), 12, 31)
+
+# Days T+n after an issue closes until listing (SEBI T+3 timeline)
+LISTING_OFFSET = 3
+
+def _build():
+    base = CALENDAR_START.toordinal()
+    days = CALENDAR_END.toordinal() - base + 1
+    before = [0] * (days + 1)      # trading days strictly before base + i
+    trading = []                   # index -> trading date
+    for i in range(days):
+        day = date.fromordinal(base + i)
+        before[i + 1] = before[i]
+        if day.weekday() < 5 and day not in HOLIDAYS:
+            trading.append(day)
+            before[i + 1] += 1
+    return base, before, trading
+
+_BASE, _BEFORE, _TRADING = _build()
+
+def _offset(day):
+    """Index into _BEFORE, or None outside the precomputed range"""
+    i = day.toordinal() - _BASE
+    return i if 0 <= i < len(_BEFORE) - 1 else None
+
+_warned_years = set()
+
+def _guess_trading_day(day):
+    """Trading day outside the precomputed years: weekdays minus fixed-date holidays"""
+    if day.year not in _warned_years:
+        _warned_years.add(day.year)
+        print(f"⚠ Warning: no NSE holiday list for {day.year}, only fixed-date holidays "
+              f"are skipped; add the year to NSE_HOLIDAYS (or MARKET_HOLIDAYS)")
+    return (day.weekday() < 5 and day not in HOLIDAYS
+            and (day.month, day.day) not in FIXED_HOLIDAYS)
+
+def is_trading_day(day):
+    i = _offset(day)
+    if i is None:
+        return _guess_trading_day(day)
+    return _BEFORE[i + 1] > _BEFORE[i]
+
+def add_trading_days(day, n):
+    """
+    The n-th trading day after `day` (before it for negative n). `day` itself
+    need not be a trading day: T+1 of a Saturday is the following Monday.
+    """
+    if n == 0:
+        return day
+    i = _offset(day)
+    if i is not None:
+        # Rank of `day` among trading days (a non-trading day sits just below
+        # the next one when counting forward, at it when counting back)
+        rank = _BEFORE[i] - (0 if is_trading_day(day) or n < 0 else 1)
+        j = rank + n
+        if 0 <= j < len(_TRADING):
+            return _TRADING[j]
+    step = 1 if n >= 0 else -1
+    remaining = abs(n)
+    while remaining:
+        day += timedelta(days=step)
+        if is_trading_day(day):
+            remaining -= 1
+    return day
+
+def trading_days_between(start, end):
+    """Trading days in [start, end)"""
+    i, j = _offset(start), _offset(end)
+    if i is not None and j is not None:
+        return _BEFORE[j] - _BEFORE[i]
+    count = 0
+    day, stop, sign = (start, end, 1) if start <= end else (end, start, -1)
+    while day < stop:
+        count += is_trading_day(day)
+        day += timedelta(days=1)
+    return sign * count
+
+def next_trading_day(day, include=False):
+    """First trading day after `day` (or `day` itself if include and it trades)"""
+    if include and is_trading_day(day):
+        return day
+    return add_trading_days(day, 1)
+
+def previous_trading_day(day):
+    return add_trading_days(day, -1)
+
+def expected_listing_date(close_date):
+    """Listing day for an issue closing on close_date (date or ISO string): T+3 trading days"""
+    if not close_date:
+        return None
+    if isinstance(close_date, str):
+        close_date = date.fromisoformat(close_date)
+    return add_trading_days(close_date, LISTING_OFFSET)